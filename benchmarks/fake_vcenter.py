@@ -0,0 +1,1308 @@
+import itertools
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from pyVmomi import vim
+from pyVmomi import vmodl
+from pyVmomi.VmomiSupport import DataObject, ManagedObject
+
+# sentinel for property paths that have no value
+_UNSET = object()
+
+# task state names
+_RUNNING, _SUCCESS, _ERROR = 'running', 'success', 'error'
+
+# performance counters served by the fake performance manager: key, group, name, rollup, unit and the
+# range of the synthetic values
+_PERF_COUNTERS = [
+    (2, 'cpu', 'usage', 'average', 'percent', 10000),
+    (12, 'cpu', 'ready', 'summation', 'millisecond', 2000),
+    (24, 'mem', 'usage', 'average', 'percent', 10000),
+    (33, 'mem', 'active', 'average', 'kiloBytes', 4 * 1024 ** 2),
+    (133, 'disk', 'maxTotalLatency', 'latest', 'millisecond', 50),
+]
+# event logged when a task of a virtual machine succeeds, other tasks log a TaskEvent
+_TASK_EVENTS = {
+    'PowerOnVM_Task': vim.event.VmPoweredOnEvent,
+    'PowerOffVM_Task': vim.event.VmPoweredOffEvent,
+    'SuspendVM_Task': vim.event.VmSuspendedEvent,
+    'ResetVM_Task': vim.event.VmResettingEvent,
+    'ReconfigVM_Task': vim.event.VmReconfiguredEvent,
+    'Destroy_Task': vim.event.VmRemovedEvent,
+    'Rename_Task': vim.event.VmRenamedEvent,
+}
+
+# the real-time interval in seconds, and the samples vCenter keeps of it
+_PERF_INTERVAL = 20
+_PERF_MAX_SAMPLES = 180
+
+
+def estimate_size(value):
+    """
+    Estimate the number of bytes a value takes once serialized into a SOAP message.
+
+    :param value: any value returned by a managed method or property accessor
+    :return: the approximate payload size in bytes
+    """
+    if value is None:
+        return 0
+    if isinstance(value, ManagedObject):
+        # <obj type="VirtualMachine">vm-123</obj>
+        return 26 + len(type(value).__name__) + len(value._moId)
+    if isinstance(value, DataObject):
+        size = 0
+        for prop in value._GetPropertyList():
+            child = getattr(value, prop.name, None)
+            if child is None or (isinstance(child, list) and not child):
+                continue
+            size += 2 * len(prop.name) + 5 + estimate_size(child)
+        return size
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) + 10 for item in value)
+
+    return len(str(value))
+
+
+class FakeObject:
+    """
+    Server-side state of one managed object of the fake vCenter.
+    """
+
+    def __init__(self, moref, props):
+        self.moref = moref
+        self.props = props
+        # bumped on every change, property filters compare it to detect modifications
+        self.version = 0
+
+
+class FakeStubAdapter:
+    """
+    pyVmomi stub adapter that serves managed method and property calls from a FakeVCenter.
+
+    Every call made through it is recorded, so the number of SOAP round trips and the
+    approximate response size of an operation can be measured without a real vCenter.
+    """
+
+    def __init__(self, vcenter):
+        self.vcenter = vcenter
+        self.version = 'vim.version.version8'
+        self.calls = Counter()
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    @property
+    def call_count(self):
+        return sum(self.calls.values())
+
+    def reset_counters(self):
+        """
+        Reset the recorded calls and byte counters.
+        """
+        with self._lock:
+            self.calls.clear()
+            self.bytes_received = 0
+
+    def _record(self, name, result):
+        with self._lock:
+            self.calls[name] += 1
+            self.bytes_received += estimate_size(result)
+
+    def InvokeMethod(self, mo, info, args):
+        try:
+            result = self.vcenter.invoke(mo, info, args)
+        except vmodl.MethodFault:
+            self._record(info.wsdlName, None)
+            raise
+        self._record(info.wsdlName, result)
+        return result
+
+    def InvokeAccessor(self, mo, info):
+        result = self.vcenter.read_property(mo, info.name)
+        self._record('Fetch', result)
+        return result
+
+
+class FakeVCenter:
+    """
+    In-process stand-in for a vCenter server holding a synthetic inventory.
+
+    Managed objects returned by it are ordinary pyVmomi objects bound to a FakeStubAdapter,
+    so the modules of this repository run against it unchanged.
+    """
+
+    def __init__(self, datacenters=1, clusters=1, hosts=2, datastores=2, vms=10, templates=1, snapshots=0,
+                 task_delay=0.0):
+        """
+        Build a synthetic inventory.
+
+        :param datacenters: number of datacenters
+        :param clusters: number of clusters per datacenter
+        :param hosts: number of ESXi hosts per cluster
+        :param datastores: number of datastores per datacenter
+        :param vms: total number of virtual machines, spread over all hosts
+        :param templates: number of templates per datacenter
+        :param snapshots: depth of the snapshot chain created on every virtual machine
+        :param task_delay: seconds a task stays running before it completes
+        """
+        self.stub = FakeStubAdapter(self)
+        self.objects = {}
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.task_delay = task_delay
+        # wsdl method name -> set of entity names whose tasks should fail
+        self.failures = {}
+        self.max_running_tasks = 0
+
+        self._ids = itertools.count(1)
+        self._tasks = []
+        self._results = {}
+        self._filters = {}
+        self._update_version = 0
+        self._cancelled = set()
+        self.events = []
+
+        self._build_service_content()
+        self._build_inventory(datacenters, clusters, hosts, datastores, vms, templates, snapshots)
+
+    # ---------------------------------------------------------------- object store
+
+    def new(self, cls, prefix, **props):
+        """
+        Create a managed object in the fake inventory.
+
+        :param cls: the pyVmomi managed object class
+        :param prefix: prefix of the generated managed object id
+        :param props: initial property values
+        :return: the managed object reference
+        """
+        moref = cls(f'{prefix}-{next(self._ids)}', self.stub)
+        self.objects[moref._moId] = FakeObject(moref, props)
+        return moref
+
+    def get(self, moref):
+        return self.objects[moref._moId]
+
+    def touch(self, *morefs):
+        """
+        Mark objects as modified and wake up property collector waiters.
+
+        :param morefs: the modified managed objects
+        :return: none
+        """
+        with self.changed:
+            for moref in morefs:
+                if moref is not None and moref._moId in self.objects:
+                    self.objects[moref._moId].version += 1
+            self.changed.notify_all()
+
+    def remove(self, moref):
+        with self.changed:
+            self.objects.pop(moref._moId, None)
+            self.changed.notify_all()
+
+    def service_instance(self):
+        """
+        Return a service instance bound to the fake server.
+
+        :return: a vim.ServiceInstance managed object
+        """
+        return vim.ServiceInstance('ServiceInstance', self.stub)
+
+    def read_property(self, moref, name):
+        with self.lock:
+            self._tick()
+            value = self._read_path(self.get(moref), name)
+        return None if value is _UNSET else value
+
+    def _read_path(self, fake_obj, path):
+        first, _, rest = path.partition('.')
+        value = fake_obj.props.get(first)
+        if callable(value):
+            value = value()
+        for part in rest.split('.') if rest else []:
+            if value is None:
+                break
+            try:
+                value = getattr(value, part)
+            except AttributeError:
+                return _UNSET
+        if value is None or (isinstance(value, list) and not value and path != first):
+            return _UNSET
+        return value
+
+    def find(self, cls, name):
+        """
+        Find a managed object by type and name without going through the stub.
+
+        :param cls: the pyVmomi managed object class
+        :param name: the object name
+        :return: the managed object reference or None
+        """
+        for fake_obj in self.objects.values():
+            if isinstance(fake_obj.moref, cls) and fake_obj.props.get('name') == name:
+                return fake_obj.moref
+        return None
+
+    def all(self, cls):
+        return [fake_obj.moref for fake_obj in self.objects.values() if isinstance(fake_obj.moref, cls)]
+
+    # ---------------------------------------------------------------- inventory
+
+    def _build_service_content(self):
+        self.property_collector = self.new(vmodl.query.PropertyCollector, 'propertyCollector')
+        self.view_manager = self.new(vim.view.ViewManager, 'ViewManager')
+        self.session_manager = self.new(vim.SessionManager, 'SessionManager')
+        self.search_index = self.new(vim.SearchIndex, 'SearchIndex')
+        self.perf_manager = self.new(vim.PerformanceManager, 'PerfMgr', perfCounter=[
+            vim.PerformanceManager.CounterInfo(
+                key=key, groupInfo=vim.ElementDescription(key=group, label=group, summary=group),
+                nameInfo=vim.ElementDescription(key=name, label=name, summary=name),
+                unitInfo=vim.ElementDescription(key=unit, label=unit, summary=unit),
+                rollupType=rollup, statsType='absolute' if rollup != 'summation' else 'delta', level=1)
+            for key, group, name, rollup, unit, _ in _PERF_COUNTERS])
+        self.root_folder = self.new(vim.Folder, 'group-d', name='Datacenters', childEntity=[], parent=None,
+                                    childType=['Folder', 'Datacenter'])
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root_folder,
+            propertyCollector=self.property_collector,
+            viewManager=self.view_manager,
+            sessionManager=self.session_manager,
+            searchIndex=self.search_index,
+            perfManager=self.perf_manager,
+            eventManager=self.new(vim.event.EventManager, 'EventManager'),
+            about=vim.AboutInfo(name='Fake vCenter', fullName='Fake vCenter Server', apiVersion='8.0',
+                                instanceUuid='fake-vcenter')
+        )
+        service_instance = vim.ServiceInstance('ServiceInstance', self.stub)
+        self.objects['ServiceInstance'] = FakeObject(service_instance, {'content': self.content})
+
+    def add_child(self, parent, child):
+        self.get(parent).props['childEntity'].append(child)
+        self.get(child).props['parent'] = parent
+        self.touch(parent, child)
+
+    def remove_child(self, parent, child):
+        children = self.get(parent).props.get('childEntity')
+        if children is not None and child in children:
+            children.remove(child)
+            self.touch(parent)
+
+    def new_folder(self, parent, name, child_type):
+        folder = self.new(vim.Folder, 'group-' + child_type[0].lower(), name=name, childEntity=[],
+                          childType=[child_type, 'Folder'])
+        self.add_child(parent, folder)
+        return folder
+
+    def new_datacenter(self, name):
+        datacenter = self.new(vim.Datacenter, 'datacenter', name=name, datastore=[], network=[])
+        self.add_child(self.root_folder, datacenter)
+        props = self.get(datacenter).props
+        for attr, child_type in (('vmFolder', 'VirtualMachine'), ('hostFolder', 'ComputeResource'),
+                                 ('datastoreFolder', 'Datastore'), ('networkFolder', 'Network')):
+            folder = self.new(vim.Folder, 'group-' + child_type[0].lower(), name=attr[:-6], childEntity=[],
+                              childType=[child_type, 'Folder'], parent=datacenter)
+            props[attr] = folder
+        return datacenter
+
+    def new_datastore(self, datacenter, name, capacity_gb=2048, free_gb=1024, ds_type='VMFS'):
+        summary = vim.Datastore.Summary(name=name, type=ds_type, capacity=capacity_gb * 1024 ** 3,
+                                        freeSpace=free_gb * 1024 ** 3, uncommitted=0, accessible=True,
+                                        url=f'ds:///vmfs/volumes/{name}/', multipleHostAccess=True)
+        if ds_type == 'VMFS':
+            info = vim.host.VmfsDatastoreInfo(name=name, url=summary.url, freeSpace=summary.freeSpace,
+                                              vmfs=vim.host.VmfsVolume(type='VMFS', majorVersion=6, name=name,
+                                                                       capacity=summary.capacity))
+        else:
+            info = vim.host.NasDatastoreInfo(name=name, url=summary.url, freeSpace=summary.freeSpace)
+        datastore = self.new(vim.Datastore, 'datastore', name=name, summary=summary, info=info, host=[], vm=[])
+        props = self.get(datacenter).props
+        self.add_child(props['datastoreFolder'], datastore)
+        props['datastore'].append(datastore)
+        return datastore
+
+    def new_network(self, datacenter, name):
+        network = self.new(vim.Network, 'network', name=name, host=[], vm=[],
+                           summary=vim.Network.Summary(name=name, accessible=True))
+        props = self.get(datacenter).props
+        self.add_child(props['networkFolder'], network)
+        props['network'].append(network)
+        return network
+
+    def new_cluster(self, datacenter, name):
+        cluster = self.new(vim.ClusterComputeResource, 'domain-c', name=name, host=[], datastore=[], network=[],
+                           summary=vim.ClusterComputeResource.Summary(totalCpu=0, totalMemory=0, numHosts=0,
+                                                                      numCpuCores=0, numVmotions=0))
+        pool = self.new(vim.ResourcePool, 'resgroup', name='Resources', parent=cluster, owner=cluster, vm=[],
+                        resourcePool=[])
+        self.get(cluster).props['resourcePool'] = pool
+        self.add_child(self.get(datacenter).props['hostFolder'], cluster)
+        return cluster
+
+    def new_host(self, cluster, name, datastores, networks):
+        network_system = self.new(vim.host.NetworkSystem, 'networkSystem')
+        host = self.new(vim.HostSystem, 'host', name=name, parent=cluster, vm=[], datastore=list(datastores),
+                        network=list(networks))
+        vswitch = vim.host.VirtualSwitch(name='vSwitch0', key='key-vim.host.VirtualSwitch-vSwitch0', numPorts=1024,
+                                         mtu=1500, pnic=['key-vim.host.PhysicalNic-vmnic0'], portgroup=[],
+                                         spec=vim.host.VirtualSwitch.Specification(
+                                             numPorts=1024, mtu=1500,
+                                             bridge=vim.host.VirtualSwitch.BondBridge(nicDevice=['vmnic0'])))
+        network_info = vim.host.NetworkInfo(vswitch=[vswitch], portgroup=[], pnic=[])
+        for network in networks:
+            self._add_portgroup(network_info, self.get(network).props['name'], 'vSwitch0', 0)
+            self.get(network).props['host'].append(host)
+        self.get(network_system).props.update(networkInfo=network_info, networkConfig=lambda: self._network_config(
+            network_info))
+        hardware = vim.host.Summary.HardwareSummary(cpuMhz=2400, numCpuCores=32, numCpuPkgs=2,
+                                                    memorySize=512 * 1024 ** 3)
+        host_props = self.get(host).props
+        host_props.update(
+            summary=vim.host.Summary(hardware=hardware,
+                                     quickStats=vim.host.Summary.QuickStats(overallCpuUsage=0,
+                                                                            overallMemoryUsage=0),
+                                     config=vim.host.Summary.ConfigSummary(name=name)),
+            configManager=vim.host.ConfigManager(networkSystem=network_system),
+            config=vim.host.ConfigInfo(network=network_info),
+            runtime=vim.host.RuntimeInfo(connectionState='connected', powerState='poweredOn'),
+        )
+        cluster_props = self.get(cluster).props
+        cluster_props['host'].append(host)
+        cluster_props['summary'].numHosts += 1
+        cluster_props['summary'].numCpuCores += hardware.numCpuCores
+        cluster_props['summary'].totalCpu += hardware.numCpuCores * hardware.cpuMhz
+        cluster_props['summary'].totalMemory += hardware.memorySize
+        for datastore in datastores:
+            self.get(datastore).props['host'].append(vim.Datastore.HostMount(key=host))
+            if datastore not in cluster_props['datastore']:
+                cluster_props['datastore'].append(datastore)
+        return host
+
+    @staticmethod
+    def _add_portgroup(network_info, name, vswitch_name, vlan_id):
+        key = f'key-vim.host.PortGroup-{name}'
+        spec = vim.host.PortGroup.Specification(
+            name=name, vswitchName=vswitch_name, vlanId=vlan_id,
+            policy=vim.host.NetworkPolicy(security=vim.host.NetworkPolicy.SecurityPolicy(
+                allowPromiscuous=False, macChanges=False, forgedTransmits=False)))
+        network_info.portgroup.append(vim.host.PortGroup(key=key, spec=spec, port=[]))
+        for vswitch in network_info.vswitch:
+            if vswitch.name == vswitch_name:
+                vswitch.portgroup.append(key)
+
+    @staticmethod
+    def _network_config(network_info):
+        return vim.host.NetworkConfig(
+            vswitch=[vim.host.VirtualSwitch.Config(name=vswitch.name, spec=vswitch.spec, changeOperation=None)
+                     for vswitch in network_info.vswitch],
+            portgroup=[vim.host.PortGroup.Config(spec=portgroup.spec) for portgroup in network_info.portgroup])
+
+    def new_vm(self, folder, name, host, datastore, network=None, template=False, power_state='poweredOff',
+               num_cpu=2, memory_mb=4096, disk_gb=40):
+        datastore_name = self.get(datastore).props['name']
+        devices = [vim.vm.device.ParaVirtualSCSIController(key=1000, busNumber=0, unitNumber=7,
+                                                           deviceInfo=vim.Description(label='SCSI controller 0',
+                                                                                      summary='VMware paravirtual SCSI'),
+                                                           device=[2000])]
+        devices.append(vim.vm.device.VirtualDisk(
+            key=2000, controllerKey=1000, unitNumber=0, capacityInKB=disk_gb * 1024 ** 2,
+            deviceInfo=vim.Description(label='Hard disk 1', summary=f'{disk_gb * 1024 ** 2} KB'),
+            backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(fileName=f'[{datastore_name}] {name}/{name}.vmdk',
+                                                                  diskMode='persistent', thinProvisioned=True,
+                                                                  datastore=datastore)))
+        guest_net = []
+        if network is not None:
+            network_name = self.get(network).props['name']
+            devices.append(vim.vm.device.VirtualVmxnet3(
+                key=4000, controllerKey=100, unitNumber=7,
+                deviceInfo=vim.Description(label='Network adapter 1', summary=network_name),
+                backing=vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(deviceName=network_name,
+                                                                             network=network),
+                macAddress='00:50:56:00:00:01'))
+            guest_net.append(vim.vm.GuestInfo.NicInfo(
+                network=network_name, macAddress='00:50:56:00:00:01', ipAddress=['10.0.0.10'], deviceConfigId=4000,
+                ipConfig=vim.net.IpConfigInfo(ipAddress=[vim.net.IpConfigInfo.IpAddress(ipAddress='10.0.0.10',
+                                                                                         prefixLength=24)])))
+
+        hardware = vim.vm.VirtualHardware(numCPU=num_cpu, numCoresPerSocket=1, memoryMB=memory_mb, device=devices)
+        config = vim.vm.ConfigInfo(name=name, template=template, annotation='', guestFullName='Ubuntu Linux (64-bit)',
+                                   guestId='ubuntu64Guest', version='vmx-19', uuid=f'uuid-{name}',
+                                   instanceUuid=f'instance-{name}', hardware=hardware, memoryHotAddEnabled=False,
+                                   cpuHotAddEnabled=False, cpuHotRemoveEnabled=False, changeVersion='1')
+        runtime = vim.vm.RuntimeInfo(powerState=power_state, connectionState='connected', host=host,
+                                     consolidationNeeded=False)
+        guest = vim.vm.GuestInfo(toolsStatus='toolsOk', hostName=name, ipAddress='10.0.0.10', net=guest_net,
+                                 guestState='running' if power_state == 'poweredOn' else 'notRunning',
+                                 hwVersion='vmx-19',
+                                 ipStack=[vim.vm.GuestInfo.StackInfo(
+                                     dnsConfig=vim.net.DnsConfigInfo(hostName=name, ipAddress=['10.0.0.2']),
+                                     ipRouteConfig=vim.net.IpRouteConfigInfo(ipRoute=[
+                                         vim.net.IpRouteConfigInfo.IpRoute(
+                                             network='0.0.0.0', prefixLength=0,
+                                             gateway=vim.net.IpRouteConfigInfo.Gateway(ipAddress='10.0.0.1'))]))])
+        committed = disk_gb * 1024 ** 3 // 4
+        storage = vim.vm.StorageInfo(perDatastoreUsage=[vim.vm.StorageInfo.UsageOnDatastore(
+            datastore=datastore, committed=committed, uncommitted=disk_gb * 1024 ** 3 - committed, unshared=committed)])
+        summary = vim.vm.Summary(
+            config=vim.vm.Summary.ConfigSummary(name=name, template=template, numCpu=num_cpu, memorySizeMB=memory_mb,
+                                                vmPathName=f'[{datastore_name}] {name}/{name}.vmx'),
+            runtime=runtime,
+            guest=vim.vm.Summary.GuestSummary(toolsStatus='toolsOk', hostName=name, ipAddress='10.0.0.10'),
+            quickStats=vim.vm.Summary.QuickStats(overallCpuUsage=100, guestMemoryUsage=1024),
+            storage=vim.vm.Summary.StorageSummary(committed=committed, uncommitted=disk_gb * 1024 ** 3 - committed))
+
+        cluster = self.get(host).props['parent']
+        pool = self.get(cluster).props['resourcePool'] if isinstance(cluster, vim.ClusterComputeResource) else None
+        vm = self.new(vim.VirtualMachine, 'vm', name=name, config=config, runtime=runtime, guest=guest,
+                      storage=storage, summary=summary, datastore=[datastore],
+                      network=[network] if network is not None else [], resourcePool=pool, snapshot=None,
+                      rootSnapshot=[])
+        self.add_child(folder, vm)
+        self.get(host).props['vm'].append(vm)
+        self.get(datastore).props['vm'].append(vm)
+        if network is not None:
+            self.get(network).props['vm'].append(vm)
+        if pool is not None:
+            self.get(pool).props['vm'].append(vm)
+        return vm
+
+    def _build_inventory(self, datacenters, clusters, hosts, datastores, vms, templates, snapshots):
+        all_hosts = []
+        for dc_index in range(datacenters):
+            datacenter = self.new_datacenter(f'dc{dc_index + 1}')
+            dc_props = self.get(datacenter).props
+            dc_datastores = [self.new_datastore(datacenter, f'dc{dc_index + 1}-ds{i + 1}') for i in range(datastores)]
+            dc_networks = [self.new_network(datacenter, 'VM Network')]
+            dc_hosts = []
+            for cluster_index in range(clusters):
+                cluster = self.new_cluster(datacenter, f'dc{dc_index + 1}-cluster{cluster_index + 1}')
+                for host_index in range(hosts):
+                    host_name = f'esxi-{dc_index + 1}-{cluster_index + 1}-{host_index + 1}.example.com'
+                    dc_hosts.append(self.new_host(cluster, host_name, dc_datastores, dc_networks))
+            templates_folder = self.new_folder(dc_props['vmFolder'], 'templates', 'VirtualMachine')
+            for template_index in range(templates):
+                self.new_vm(templates_folder, f'template-{template_index + 1}', dc_hosts[0], dc_datastores[0],
+                            dc_networks[0], template=True)
+            all_hosts.extend((host, dc_props['vmFolder'], dc_datastores, dc_networks[0]) for host in dc_hosts)
+
+        for vm_index in range(vms):
+            host, folder, dc_datastores, network = all_hosts[vm_index % len(all_hosts)]
+            datastore = dc_datastores[vm_index % len(dc_datastores)]
+            vm = self.new_vm(folder, f'vm-{vm_index + 1:05d}', host, datastore, network,
+                             power_state='poweredOn' if vm_index % 2 == 0 else 'poweredOff')
+            for snapshot_index in range(snapshots):
+                self._snapshot_add(vm, f'snap-{snapshot_index + 1}', 'synthetic snapshot', False, False)
+
+    # ---------------------------------------------------------------- snapshots
+
+    def _snapshot_add(self, vm, name, description, memory, quiesce):
+        vm_props = self.get(vm).props
+        snapshot = self.new(vim.vm.Snapshot, 'snapshot', vm=vm, childSnapshot=[],
+                            config=vm_props['config'])
+        tree = vim.vm.SnapshotTree(snapshot=snapshot, vm=vm, name=name, description=description or '',
+                                   id=next(self._ids), createTime=datetime.now(timezone.utc),
+                                   state=vm_props['runtime'].powerState, quiesced=bool(quiesce),
+                                   childSnapshotList=[])
+        info = vm_props['snapshot']
+        if info is None:
+            info = vim.vm.SnapshotInfo(rootSnapshotList=[tree], currentSnapshot=snapshot)
+            vm_props['snapshot'] = info
+            vm_props['rootSnapshot'] = [snapshot]
+        else:
+            parent = self._find_snapshot_tree(info.rootSnapshotList, info.currentSnapshot)
+            parent.childSnapshotList.append(tree)
+            self.get(parent.snapshot).props['childSnapshot'].append(snapshot)
+            info.currentSnapshot = snapshot
+        self.touch(vm)
+        return snapshot
+
+    def _find_snapshot_tree(self, trees, snapshot):
+        for tree in trees:
+            if tree.snapshot == snapshot:
+                return tree
+            found = self._find_snapshot_tree(tree.childSnapshotList, snapshot)
+            if found is not None:
+                return found
+        return None
+
+    def _snapshot_remove(self, snapshot, remove_children):
+        vm = self.get(snapshot).props['vm']
+        vm_props = self.get(vm).props
+        info = vm_props['snapshot']
+
+        def prune(trees):
+            for index, tree in enumerate(trees):
+                if tree.snapshot == snapshot:
+                    children = [] if remove_children else list(tree.childSnapshotList)
+                    trees[index:index + 1] = children
+                    return tree
+                found = prune(tree.childSnapshotList)
+                if found is not None:
+                    return found
+            return None
+
+        removed = prune(info.rootSnapshotList)
+        self.remove(snapshot)
+        if not info.rootSnapshotList:
+            vm_props['snapshot'] = None
+            vm_props['rootSnapshot'] = []
+        else:
+            vm_props['rootSnapshot'] = [tree.snapshot for tree in info.rootSnapshotList]
+            if self._find_snapshot_tree(info.rootSnapshotList, info.currentSnapshot) is None:
+                info.currentSnapshot = info.rootSnapshotList[0].snapshot
+        self.touch(vm)
+        return removed
+
+    # ---------------------------------------------------------------- property collector
+
+    def _named_specs(self, select_set, named):
+        for spec in select_set or []:
+            if spec.name and isinstance(spec, vmodl.query.PropertyCollector.TraversalSpec):
+                if spec.name not in named:
+                    named[spec.name] = spec
+                    self._named_specs(spec.selectSet, named)
+            elif isinstance(spec, vmodl.query.PropertyCollector.TraversalSpec):
+                self._named_specs(spec.selectSet, named)
+
+    def _traverse(self, moref, select_set, named, found, visited):
+        for spec in select_set or []:
+            if not isinstance(spec, vmodl.query.PropertyCollector.TraversalSpec):
+                spec = named.get(spec.name)
+                if spec is None:
+                    continue
+            if not isinstance(moref, spec.type) or moref._moId not in self.objects:
+                continue
+            key = (moref._moId, id(spec))
+            if key in visited:
+                continue
+            visited.add(key)
+
+            value = self._read_path(self.get(moref), spec.path)
+            if value is _UNSET:
+                continue
+            children = value if isinstance(value, list) else [value]
+            for child in children:
+                if not isinstance(child, ManagedObject) or child._moId not in self.objects:
+                    continue
+                if not spec.skip:
+                    found.setdefault(child._moId, child)
+                self._traverse(child, spec.selectSet, named, found, visited)
+
+    def collect(self, filter_spec):
+        """
+        Evaluate a filter specification against the inventory.
+
+        :param filter_spec: a vmodl.query.PropertyCollector.FilterSpec
+        :return: list of (managed object, {property path: value}) tuples
+        """
+        named = {}
+        for obj_spec in filter_spec.objectSet:
+            self._named_specs(obj_spec.selectSet, named)
+
+        found = {}
+        visited = set()
+        for obj_spec in filter_spec.objectSet:
+            if obj_spec.obj._moId not in self.objects:
+                continue
+            if not obj_spec.skip:
+                found.setdefault(obj_spec.obj._moId, obj_spec.obj)
+            self._traverse(obj_spec.obj, obj_spec.selectSet, named, found, visited)
+
+        results = []
+        for moref in found.values():
+            paths = []
+            matched = False
+            for prop_spec in filter_spec.propSet:
+                if isinstance(moref, prop_spec.type):
+                    matched = True
+                    if prop_spec.all:
+                        paths.extend(self.get(moref).props.keys())
+                    else:
+                        paths.extend(prop_spec.pathSet or [])
+            if not matched:
+                continue
+            fake_obj = self.get(moref)
+            props = {}
+            for path in dict.fromkeys(paths):
+                value = self._read_path(fake_obj, path)
+                if value is not _UNSET:
+                    props[path] = value
+            results.append((moref, props))
+        return results
+
+    @staticmethod
+    def _typed(val):
+        # the server returns typed arrays, not python lists
+        if isinstance(val, list) and not hasattr(val, 'Item'):
+            item_type = type(val[0]) if val else vim.ManagedEntity
+            if isinstance(val[0] if val else None, vim.ManagedEntity):
+                item_type = vim.ManagedEntity
+            return item_type.Array(val)
+        return val
+
+    @classmethod
+    def _object_content(cls, moref, props):
+        return vmodl.query.PropertyCollector.ObjectContent(
+            obj=moref, propSet=[vmodl.DynamicProperty(name=name, val=cls._typed(val))
+                                for name, val in props.items()])
+
+    def _page(self, token):
+        objects = self._results[token]
+        page, rest = objects[:self._results[token + ':size']], objects[self._results[token + ':size']:]
+        if rest:
+            self._results[token] = rest
+            next_token = token
+        else:
+            del self._results[token]
+            del self._results[token + ':size']
+            next_token = None
+        return vmodl.query.PropertyCollector.RetrieveResult(objects=page, token=next_token)
+
+    def _retrieve_properties_ex(self, collector, spec_set, options):
+        contents = []
+        for filter_spec in spec_set:
+            contents.extend(self._object_content(moref, props) for moref, props in self.collect(filter_spec))
+        if not contents:
+            return None
+        token = f'token-{next(self._ids)}'
+        self._results[token] = contents
+        self._results[token + ':size'] = (options.maxObjects if options and options.maxObjects else 100)
+        return self._page(token)
+
+    def _continue_retrieve_properties_ex(self, collector, token):
+        if token not in self._results:
+            raise vmodl.fault.InvalidArgument(invalidProperty='token')
+        return self._page(token)
+
+    def _cancel_retrieve_properties_ex(self, collector, token):
+        self._results.pop(token, None)
+        self._results.pop(token + ':size', None)
+
+    def _retrieve_contents(self, collector, spec_set):
+        contents = []
+        for filter_spec in spec_set:
+            contents.extend(self._object_content(moref, props) for moref, props in self.collect(filter_spec))
+        return contents
+
+    def _create_filter(self, collector, spec, partial_updates):
+        property_filter = self.new(vmodl.query.PropertyCollector.Filter, 'session-filter', spec=spec,
+                                   partialUpdates=partial_updates)
+        self._filters[property_filter._moId] = {'collector': collector._moId, 'filter': property_filter,
+                                                'spec': spec, 'reported': {}}
+        return property_filter
+
+    def _destroy_property_filter(self, property_filter):
+        self._filters.pop(property_filter._moId, None)
+        self.remove(property_filter)
+
+    def _create_property_collector(self, collector):
+        return self.new(vmodl.query.PropertyCollector, 'session-collector')
+
+    def _destroy_property_collector(self, collector):
+        for key, state in list(self._filters.items()):
+            if state['collector'] == collector._moId:
+                del self._filters[key]
+        self.remove(collector)
+
+    def _compute_updates(self, collector, reset):
+        filter_updates = []
+        for state in self._filters.values():
+            if state['collector'] != collector._moId:
+                continue
+            if reset:
+                state['reported'] = {}
+            current = self.collect(state['spec'])
+            reported = state['reported']
+            object_updates = []
+            seen = set()
+            for moref, props in current:
+                seen.add(moref._moId)
+                version = self.get(moref).version
+                if moref._moId in reported and reported[moref._moId][1] == version:
+                    continue
+                kind = 'modify' if moref._moId in reported else 'enter'
+                reported[moref._moId] = (moref, version)
+                change_set = [vmodl.query.PropertyCollector.Change(name=name, op='assign', val=self._typed(val))
+                              for name, val in props.items()]
+                object_updates.append(vmodl.query.PropertyCollector.ObjectUpdate(kind=kind, obj=moref,
+                                                                                 changeSet=change_set))
+            for mo_id in list(reported):
+                if mo_id not in seen:
+                    moref = reported.pop(mo_id)[0]
+                    object_updates.append(vmodl.query.PropertyCollector.ObjectUpdate(kind='leave', obj=moref,
+                                                                                     changeSet=[]))
+            if object_updates:
+                filter_updates.append(vmodl.query.PropertyCollector.FilterUpdate(filter=state['filter'],
+                                                                                 objectSet=object_updates))
+        if not filter_updates:
+            return None
+        self._update_version += 1
+        return vmodl.query.PropertyCollector.UpdateSet(version=str(self._update_version), filterSet=filter_updates)
+
+    def _wait_for_updates_ex(self, collector, version, options):
+        max_wait = options.maxWaitSeconds if options is not None else None
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        reset = not version
+        with self.changed:
+            while True:
+                self._tick()
+                update = self._compute_updates(collector, reset)
+                reset = False
+                if update is not None:
+                    return update
+                if collector._moId in self._cancelled:
+                    self._cancelled.discard(collector._moId)
+                    raise vmodl.fault.RequestCanceled()
+                timeout = 0.05 if self._tasks else 0.5
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    timeout = min(timeout, remaining)
+                self.changed.wait(timeout)
+
+    def _wait_for_updates(self, collector, version):
+        return self._wait_for_updates_ex(collector, version, None)
+
+    def _cancel_wait_for_updates(self, collector):
+        with self.changed:
+            self._cancelled.add(collector._moId)
+            self.changed.notify_all()
+
+    # ---------------------------------------------------------------- tasks
+
+    def new_task(self, entity, method, action, *args):
+        """
+        Create a task that runs an action against the inventory.
+
+        :param entity: the managed entity the task operates on
+        :param method: the wsdl name of the method that created the task
+        :param action: callable applied when the task completes; its return value becomes the task result
+        :param args: arguments passed to the action
+        :return: the task managed object
+        """
+        entity_name = self.get(entity).props.get('name') if entity is not None else None
+        task_moref = vim.Task(f'task-{next(self._ids)}', self.stub)
+        # tasks of snapshots and other non-entities report no entity
+        if not isinstance(entity, vim.ManagedEntity):
+            entity = None
+        info = vim.TaskInfo(key=task_moref._moId, task=task_moref, descriptionId=method, entity=entity,
+                            entityName=entity_name, state=_RUNNING, cancelled=False, cancelable=False,
+                            queueTime=datetime.now(timezone.utc), startTime=datetime.now(timezone.utc))
+        self.objects[task_moref._moId] = FakeObject(task_moref, {'info': info})
+        fake_task = self.get(task_moref)
+        fake_task.action = (method, entity_name, action, args)
+        fake_task.complete_at = time.monotonic() + self.task_delay
+        self._tasks.append(task_moref)
+        # unfinished tasks stay in the list until they complete
+        self.max_running_tasks = max(self.max_running_tasks, len(self._tasks))
+        if self.task_delay <= 0:
+            self._complete(task_moref)
+        self.touch(task_moref)
+        return task_moref
+
+    def _complete(self, task_moref):
+        fake_task = self.get(task_moref)
+        info = fake_task.props['info']
+        method, entity_name, action, args = fake_task.action
+        failing = self.failures.get(method, ())
+        try:
+            if failing is True or entity_name in failing:
+                raise vmodl.fault.SystemError(reason=f'{method} failed on {entity_name}',
+                                              msg=f'{method} failed on {entity_name}')
+            info.result = action(*args)
+            info.state = _SUCCESS
+            self.log_event(method, info.entity, entity_name)
+        except vmodl.MethodFault as fault:
+            info.error = fault
+            info.state = _ERROR
+        info.completeTime = datetime.now(timezone.utc)
+        self._tasks.remove(task_moref)
+        self.touch(task_moref)
+
+    def _tick(self):
+        now = time.monotonic()
+        for task_moref in list(self._tasks):
+            if self.get(task_moref).complete_at <= now:
+                self._complete(task_moref)
+
+    # ---------------------------------------------------------------- dispatch
+
+    def invoke(self, mo, info, args):
+        """
+        Execute a managed method call.
+
+        :param mo: the managed object the method is invoked on
+        :param info: pyVmomi method info
+        :param args: list of positional arguments
+        :return: the method result
+        """
+        with self.lock:
+            self._tick()
+            handler = getattr(self, '_' + _snake(info.wsdlName), None)
+            if handler is not None:
+                return handler(mo, *args)
+            task_handler = getattr(self, '_task_' + _snake(info.wsdlName), None)
+            if task_handler is not None:
+                return self.new_task(mo, info.wsdlName, task_handler, mo, *args)
+            if info.isTask:
+                return self.new_task(mo, info.wsdlName, lambda: None)
+            return None
+
+    # events
+
+    def log_event(self, method, entity, entity_name):
+        """
+        Log the event of a succeeded task, like vCenter does in its event history.
+
+        :param method: wsdl name of the task method
+        :param entity: the entity the task ran on, or None
+        :param entity_name: name of the entity
+        :return: the event
+        """
+        event_cls = _TASK_EVENTS.get(method, vim.event.TaskEvent) if isinstance(entity, vim.VirtualMachine) \
+            else vim.event.TaskEvent
+        key = len(self.events) + 1
+        event = event_cls(key=key, chainId=key, createdTime=datetime.now(timezone.utc), userName='VSPHERE.LOCAL\\bench',
+                          fullFormattedMessage=f'{method} completed on {entity_name}')
+        if isinstance(entity, vim.VirtualMachine):
+            event.vm = vim.event.VmEventArgument(vm=entity, name=entity_name)
+        elif isinstance(entity, vim.HostSystem):
+            event.host = vim.event.HostEventArgument(host=entity, name=entity_name)
+        self.events.append((event, entity))
+        return event
+
+    def _is_below(self, moref, ancestor):
+        while moref is not None:
+            if moref == ancestor:
+                return True
+            fake_obj = self.objects.get(moref._moId)
+            moref = fake_obj.props.get('parent') if fake_obj is not None else None
+        return False
+
+    def _event_matches(self, event, entity, spec):
+        if spec.eventTypeId and event._wsdlName not in spec.eventTypeId:
+            return False
+        if spec.time is not None:
+            if spec.time.beginTime is not None and event.createdTime < spec.time.beginTime:
+                return False
+            if spec.time.endTime is not None and event.createdTime > spec.time.endTime:
+                return False
+        if spec.entity is not None:
+            if entity is None:
+                return False
+            if spec.entity.recursion == 'self':
+                return entity == spec.entity.entity
+            return self._is_below(entity, spec.entity.entity)
+        return True
+
+    def _create_collector_for_events(self, mo, filter):
+        return self.new(vim.event.EventHistoryCollector, 'session[fake]event', filter=filter, position=0)
+
+    def _read_next_events(self, mo, maxCount):
+        props = self.get(mo).props
+        events = []
+        for index in range(props['position'], len(self.events)):
+            if len(events) >= maxCount:
+                break
+            event, entity = self.events[index]
+            props['position'] = index + 1
+            if self._event_matches(event, entity, props['filter']):
+                events.append(event)
+        return events
+
+    def _rewind_collector(self, mo):
+        self.get(mo).props['position'] = 0
+
+    def _reset_collector(self, mo):
+        self.get(mo).props['position'] = len(self.events)
+
+    def _destroy_collector(self, mo):
+        self.remove(mo)
+
+    # performance manager
+
+    def _query_perf(self, mo, querySpec):
+        """
+        Serve real-time samples, deterministic per entity, counter and timestamp.
+        """
+        limits = {key: limit for key, _, _, _, _, limit in _PERF_COUNTERS}
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        last = now - timedelta(seconds=now.timestamp() % _PERF_INTERVAL)
+        results = []
+        for spec in querySpec:
+            if spec.startTime is not None:
+                count = int((last - spec.startTime).total_seconds() // _PERF_INTERVAL)
+            else:
+                count = spec.maxSample or 1
+            count = max(0, min(count, spec.maxSample or _PERF_MAX_SAMPLES, _PERF_MAX_SAMPLES))
+            timestamps = [last - timedelta(seconds=_PERF_INTERVAL * index) for index in reversed(range(count))]
+            series = []
+            for metric_id in spec.metricId or []:
+                limit = limits.get(metric_id.counterId)
+                if limit is None:
+                    continue
+                seed = f'{spec.entity._moId}/{metric_id.counterId}/'
+                series.append(vim.PerformanceManager.IntSeries(
+                    id=metric_id,
+                    value=[zlib.crc32(f'{seed}{int(timestamp.timestamp())}'.encode()) % limit
+                           for timestamp in timestamps]))
+            results.append(vim.PerformanceManager.EntityMetric(
+                entity=spec.entity, value=series,
+                sampleInfo=[vim.PerformanceManager.SampleInfo(timestamp=timestamp, interval=_PERF_INTERVAL)
+                            for timestamp in timestamps]))
+        return results
+
+    # service instance, views and sessions
+
+    def _retrieve_service_content(self, mo):
+        return self.content
+
+    def _current_time(self, mo):
+        return datetime.now(timezone.utc)
+
+    def _find_by_inventory_path(self, mo, inventoryPath):
+        current = self.root_folder
+        for name in inventoryPath.strip('/').split('/'):
+            fake_obj = self.get(current)
+            children = list(fake_obj.props.get('childEntity') or [])
+            if isinstance(current, vim.Datacenter):
+                children = [fake_obj.props[attr] for attr in ('vmFolder', 'hostFolder', 'datastoreFolder',
+                                                              'networkFolder')]
+            elif isinstance(current, vim.ComputeResource):
+                children = list(fake_obj.props.get('host') or [])
+            current = next((child for child in children if self.get(child).props.get('name') == name), None)
+            if current is None:
+                return None
+        return current
+
+    def _create_container_view(self, mo, container, types, recursive):
+        def view():
+            found = []
+            self._walk(container, types, recursive, found, top=True)
+            return found
+
+        return self.new(vim.view.ContainerView, 'session-view', container=container, type=types,
+                        recursive=recursive, view=view)
+
+    def _walk(self, moref, types, recursive, found, top=False):
+        fake_obj = self.objects.get(moref._moId)
+        if fake_obj is None:
+            return
+        if not top and (not types or isinstance(moref, tuple(types))):
+            found.append(moref)
+        if not top and not recursive:
+            return
+        props = fake_obj.props
+        children = []
+        if isinstance(moref, vim.Folder):
+            children = props.get('childEntity', [])
+        elif isinstance(moref, vim.Datacenter):
+            children = [props['vmFolder'], props['hostFolder'], props['datastoreFolder'], props['networkFolder']]
+        elif isinstance(moref, vim.ClusterComputeResource):
+            children = list(props.get('host', [])) + [props['resourcePool']]
+        elif isinstance(moref, vim.ResourcePool):
+            children = list(props.get('resourcePool', []))
+        for child in children:
+            self._walk(child, types, recursive, found)
+
+    def _destroy_view(self, mo):
+        self.remove(mo)
+
+    def _session_is_active(self, mo, session_id, user_name):
+        return True
+
+    def _login(self, mo, user_name, password, locale):
+        return vim.UserSession(key=f'session-{next(self._ids)}', userName=user_name)
+
+    def _logout(self, mo):
+        return None
+
+    # inventory operations
+
+    def _create_folder(self, mo, name):
+        child_type = self.get(mo).props.get('childType', ['Folder'])[0]
+        return self.new_folder(mo, name, child_type)
+
+    def _create_datacenter(self, mo, name):
+        datacenter = self.new_datacenter(name)
+        if mo != self.root_folder:
+            self.remove_child(self.root_folder, datacenter)
+            self.add_child(mo, datacenter)
+        return datacenter
+
+    def _create_cluster(self, mo, name, spec):
+        datacenter = self.get(mo).props['parent']
+        cluster = self.new_cluster(datacenter, name)
+        if self.get(datacenter).props['hostFolder'] != mo:
+            self.remove_child(self.get(datacenter).props['hostFolder'], cluster)
+            self.add_child(mo, cluster)
+        return cluster
+
+    def _create_cluster_ex(self, mo, name, spec):
+        return self._create_cluster(mo, name, spec)
+
+    def _task_rename(self, mo, new_name):
+        fake_obj = self.get(mo)
+        fake_obj.props['name'] = new_name
+        if isinstance(mo, vim.VirtualMachine):
+            fake_obj.props['config'].name = new_name
+            fake_obj.props['summary'].config.name = new_name
+        self.touch(mo)
+
+    def _task_destroy(self, mo):
+        fake_obj = self.get(mo)
+        parent = fake_obj.props.get('parent')
+        if parent is not None:
+            self.remove_child(parent, mo)
+        if isinstance(mo, vim.VirtualMachine):
+            host = fake_obj.props['runtime'].host
+            for holder, attr in [(host, 'vm'), (fake_obj.props['resourcePool'], 'vm')] + \
+                                [(ds, 'vm') for ds in fake_obj.props['datastore']] + \
+                                [(net, 'vm') for net in fake_obj.props['network']]:
+                if holder is not None and mo in self.get(holder).props.get(attr, []):
+                    self.get(holder).props[attr].remove(mo)
+                    self.touch(holder)
+        if isinstance(mo, vim.Datastore):
+            for datacenter in self.all(vim.Datacenter):
+                if mo in self.get(datacenter).props['datastore']:
+                    self.get(datacenter).props['datastore'].remove(mo)
+        self.remove(mo)
+
+    def _task_power_on_vm(self, mo, host=None):
+        self._set_power_state(mo, 'poweredOn')
+
+    def _task_power_off_vm(self, mo):
+        self._set_power_state(mo, 'poweredOff')
+
+    def _task_suspend_vm(self, mo):
+        self._set_power_state(mo, 'suspended')
+
+    def _task_reset_vm(self, mo):
+        self._set_power_state(mo, 'poweredOn')
+
+    def _set_power_state(self, mo, state):
+        runtime = self.get(mo).props['runtime']
+        runtime.powerState = state
+        self.get(mo).props['guest'].guestState = 'running' if state == 'poweredOn' else 'notRunning'
+        self.touch(mo)
+
+    def _task_clone_vm(self, mo, folder, name, spec):
+        source = self.get(mo).props
+        location = spec.location
+        host = location.host or source['runtime'].host
+        datastore = location.datastore or source['datastore'][0]
+        network = source['network'][0] if source['network'] else None
+        hardware = source['config'].hardware
+        clone = self.new_vm(folder, name, host, datastore, network, template=bool(spec.template),
+                            num_cpu=hardware.numCPU, memory_mb=hardware.memoryMB)
+        if location.pool is not None:
+            self.get(clone).props['resourcePool'] = location.pool
+        if spec.powerOn:
+            self._set_power_state(clone, 'poweredOn')
+        return clone
+
+    def _task_instant_clone(self, mo, spec):
+        source = self.get(mo).props
+        if source['runtime'].powerState != 'poweredOn':
+            raise vim.fault.InvalidPowerState(requestedState='poweredOn', existingState=source['runtime'].powerState)
+        folder = spec.location.folder or source['parent']
+        clone = self._task_clone_vm(mo, folder, spec.name, vim.vm.CloneSpec(location=spec.location))
+        self._set_power_state(clone, 'poweredOn')
+        return clone
+
+    def _task_reconfig_vm(self, mo, spec):
+        props = self.get(mo).props
+        config = props['config']
+        hardware = config.hardware
+        if spec.numCPUs is not None:
+            hardware.numCPU = spec.numCPUs
+            props['summary'].config.numCpu = spec.numCPUs
+        if spec.numCoresPerSocket is not None:
+            hardware.numCoresPerSocket = spec.numCoresPerSocket
+        if spec.memoryMB is not None:
+            hardware.memoryMB = spec.memoryMB
+            props['summary'].config.memorySizeMB = spec.memoryMB
+        if spec.annotation is not None:
+            config.annotation = spec.annotation
+        next_key = max([device.key for device in hardware.device] + [0]) + 1
+        for change in spec.deviceChange or []:
+            device = change.device
+            if change.operation == 'add':
+                if device.key is None or device.key < 0:
+                    device.key = next_key
+                    next_key += 1
+                if device.deviceInfo is None:
+                    device.deviceInfo = vim.Description(label=type(device).__name__, summary='')
+                if isinstance(device, vim.vm.device.VirtualDisk):
+                    index = sum(1 for d in hardware.device if isinstance(d, vim.vm.device.VirtualDisk)) + 1
+                    device.deviceInfo.label = f'Hard disk {index}'
+                elif isinstance(device, vim.vm.device.VirtualEthernetCard):
+                    index = sum(1 for d in hardware.device if isinstance(d, vim.vm.device.VirtualEthernetCard)) + 1
+                    device.deviceInfo.label = f'Network adapter {index}'
+                hardware.device.append(device)
+            elif change.operation == 'remove':
+                hardware.device = [d for d in hardware.device if d.key != device.key]
+            elif change.operation == 'edit':
+                hardware.device = [device if d.key == device.key else d for d in hardware.device]
+        config.changeVersion = str(int(config.changeVersion) + 1)
+        self.touch(mo)
+
+    def _task_customize_vm(self, mo, spec):
+        props = self.get(mo).props
+        if props['runtime'].powerState != 'poweredOff':
+            raise vim.fault.InvalidPowerState(requestedState='poweredOff',
+                                              existingState=props['runtime'].powerState)
+        for nic, adapter_map in zip(props['guest'].net, reversed(spec.nicSettingMap or [])):
+            nic.ipAddress = [adapter_map.adapter.ip.ipAddress]
+        if spec.identity is not None and spec.identity.hostName is not None:
+            props['guest'].hostName = spec.identity.hostName.name
+        self.touch(mo)
+
+    def _mark_as_virtual_machine(self, mo, pool, host=None):
+        self._set_template(mo, False)
+
+    def _mark_as_template(self, mo):
+        self._set_template(mo, True)
+
+    def _set_template(self, mo, template):
+        props = self.get(mo).props
+        props['config'].template = template
+        props['summary'].config.template = template
+        self.touch(mo)
+
+    def _task_create_snapshot(self, mo, name, description, memory, quiesce):
+        # like vCenter, templates cannot be snapshotted
+        if self.get(mo).props['config'].template:
+            raise vmodl.fault.NotSupported(msg='The operation is not supported on the object.')
+        return self._snapshot_add(mo, name, description, memory, quiesce)
+
+    def _task_remove_snapshot(self, mo, remove_children, consolidate=None):
+        self._snapshot_remove(mo, remove_children)
+
+    def _task_revert_to_snapshot(self, mo, host=None, suppress_power_on=None):
+        vm = self.get(mo).props['vm']
+        self.get(vm).props['snapshot'].currentSnapshot = mo
+        self.touch(vm)
+
+    def _task_revert_to_current_snapshot(self, mo, host=None, suppress_power_on=None):
+        if self.get(mo).props['snapshot'] is None:
+            raise vim.fault.NotFound(msg='no current snapshot')
+
+    def _task_remove_all_snapshots(self, mo, consolidate=None, spec=None):
+        props = self.get(mo).props
+        while props['snapshot'] is not None:
+            self._snapshot_remove(props['snapshot'].rootSnapshotList[0].snapshot, True)
+
+    def _task_consolidate_vm_disks(self, mo):
+        self.get(mo).props['runtime'].consolidationNeeded = False
+        self.touch(mo)
+
+    def _rename_snapshot(self, mo, name, description):
+        vm = self.get(mo).props['vm']
+        tree = self._find_snapshot_tree(self.get(vm).props['snapshot'].rootSnapshotList, mo)
+        if name:
+            tree.name = name
+        if description:
+            tree.description = description
+        self.touch(vm)
+
+    # host networking
+
+    def _host_of(self, network_system):
+        for host in self.all(vim.HostSystem):
+            if self.get(host).props['configManager'].networkSystem == network_system:
+                return host
+        return None
+
+    def _network_info(self, network_system):
+        return self.get(network_system).props['networkInfo']
+
+    def _add_virtual_switch(self, mo, vswitch_name, spec):
+        network_info = self._network_info(mo)
+        if any(vswitch.name == vswitch_name for vswitch in network_info.vswitch):
+            raise vim.fault.AlreadyExists(name=vswitch_name)
+        network_info.vswitch.append(vim.host.VirtualSwitch(
+            name=vswitch_name, key=f'key-vim.host.VirtualSwitch-{vswitch_name}', numPorts=spec.numPorts,
+            mtu=spec.mtu, portgroup=[], pnic=[], spec=spec))
+        self.touch(mo, self._host_of(mo))
+
+    def _remove_virtual_switch(self, mo, vswitch_name):
+        network_info = self._network_info(mo)
+        if not any(vswitch.name == vswitch_name for vswitch in network_info.vswitch):
+            raise vim.fault.NotFound(msg=f'vSwitch {vswitch_name} not found')
+        network_info.vswitch = [vswitch for vswitch in network_info.vswitch if vswitch.name != vswitch_name]
+        network_info.portgroup = [pg for pg in network_info.portgroup if pg.spec.vswitchName != vswitch_name]
+        self.touch(mo, self._host_of(mo))
+
+    def _update_virtual_switch(self, mo, vswitch_name, spec):
+        for vswitch in self._network_info(mo).vswitch:
+            if vswitch.name == vswitch_name:
+                vswitch.spec = spec
+                vswitch.numPorts = spec.numPorts
+                vswitch.mtu = spec.mtu
+                self.touch(mo, self._host_of(mo))
+                return
+        raise vim.fault.NotFound(msg=f'vSwitch {vswitch_name} not found')
+
+    def _add_port_group(self, mo, portgrp):
+        network_info = self._network_info(mo)
+        if any(pg.spec.name == portgrp.name for pg in network_info.portgroup):
+            raise vim.fault.AlreadyExists(name=portgrp.name)
+        if not any(vswitch.name == portgrp.vswitchName for vswitch in network_info.vswitch):
+            raise vim.fault.NotFound(msg=f'vSwitch {portgrp.vswitchName} not found')
+        self._add_portgroup(network_info, portgrp.name, portgrp.vswitchName, portgrp.vlanId)
+        network_info.portgroup[-1].spec = portgrp
+        self.touch(mo, self._host_of(mo))
+
+    def _remove_port_group(self, mo, pg_name):
+        network_info = self._network_info(mo)
+        if not any(pg.spec.name == pg_name for pg in network_info.portgroup):
+            raise vim.fault.NotFound(msg=f'port group {pg_name} not found')
+        network_info.portgroup = [pg for pg in network_info.portgroup if pg.spec.name != pg_name]
+        for vswitch in network_info.vswitch:
+            vswitch.portgroup = [key for key in vswitch.portgroup if key != f'key-vim.host.PortGroup-{pg_name}']
+        self.touch(mo, self._host_of(mo))
+
+    def _update_port_group(self, mo, pg_name, portgrp):
+        network_info = self._network_info(mo)
+        for portgroup in network_info.portgroup:
+            if portgroup.spec.name == pg_name:
+                self._remove_port_group(mo, pg_name)
+                self._add_port_group(mo, portgrp)
+                return
+        raise vim.fault.NotFound(msg=f'port group {pg_name} not found')
+
+    def _update_network_config(self, mo, config, change_mode):
+        for vswitch_config in config.vswitch or []:
+            if vswitch_config.changeOperation == 'add':
+                self._add_virtual_switch(mo, vswitch_config.name, vswitch_config.spec)
+            elif vswitch_config.changeOperation == 'remove':
+                self._remove_virtual_switch(mo, vswitch_config.name)
+            else:
+                self._update_virtual_switch(mo, vswitch_config.name, vswitch_config.spec)
+        for portgroup_config in config.portgroup or []:
+            if portgroup_config.changeOperation == 'add':
+                self._add_port_group(mo, portgroup_config.spec)
+            elif portgroup_config.changeOperation == 'remove':
+                self._remove_port_group(mo, portgroup_config.spec.name)
+            else:
+                self._update_port_group(mo, portgroup_config.spec.name, portgroup_config.spec)
+        return vim.host.NetworkConfig.Result()
+
+
+def _snake(name):
+    """
+    Convert a wsdl method name such as 'PowerOnVM_Task' into a handler name such as 'power_on_vm'.
+    """
+    if name.endswith('_Task'):
+        name = name[:-5]
+    out = []
+    for index, char in enumerate(name):
+        if char.isupper() and index and (not name[index - 1].isupper() or
+                                         (index + 1 < len(name) and name[index + 1].islower())):
+            out.append('_')
+        out.append(char.lower())
+    return ''.join(out).replace('__', '_')
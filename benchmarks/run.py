@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import io
+import json
+import re
+import sys
+import time
+
+import cluster
+import datacenter
+import datastore
+import folder
+import portgroup
+import vm_cpu
+import vm_disk
+import vm_memory
+import vm_nic
+import vm_snapshot
+import vmachine
+import vswitch
+from tools.output_sink import OUTPUT_FORMATS, get_sink
+from tools.retention import RetentionPolicy
+from .fake_vcenter import FakeVCenter
+
+# inventory sizes, in virtual machines, benchmarked by default
+DEFAULT_SIZES = [100, 1000, 10000]
+
+# first host of each of the two clusters of the synthetic inventory
+HOST_1 = 'esxi-1-1-1.example.com'
+HOST_2 = 'esxi-1-2-1.example.com'
+
+# (case name, function, keyword arguments) in execution order; cases creating objects come before the
+# cases removing them again, destructive bulk operations come last
+CASES = [
+    ('vmachine.show', vmachine.show, {}),
+    ('vmachine.info', vmachine.info, {'vm_name': 'vm-00001'}),
+    ('vmachine.metrics', vmachine.metrics, {'folder_name': 'vm', 'count': 10}),
+    ('vmachine.events', vmachine.events, {'folder_name': 'vm'}),
+    ('vmachine.rename', vmachine.rename, {'vm_name': 'vm-00003', 'new_name': 'vm-renamed'}),
+    ('vmachine.clone', vmachine.clone, {'vm_name': 'vm-clone', 'template_name': 'template-1',
+                                        'datacenter_name': 'dc1'}),
+    ('vmachine.clone linked', vmachine.clone, {'vm_name': 'vm-linked', 'template_name': 'template-1',
+                                               'datacenter_name': 'dc1', 'mode': 'linked'}),
+    ('vmachine.power_on', vmachine.power_on, {'folder_name': 'vm', 'regex': '^vm-'}),
+    ('vmachine.reboot', vmachine.reboot, {'folder_name': 'vm', 'vm_names': ['vm-00001']}),
+    ('vmachine.suspend', vmachine.suspend, {'folder_name': 'vm', 'vm_names': ['vm-00001']}),
+    ('vmachine.power_off', vmachine.power_off, {'folder_name': 'vm', 'regex': '^vm-'}),
+    ('vmachine.customize', vmachine.customize, {'vm_name': 'vm-00002', 'vm_ip': '10.0.0.20',
+                                                'vm_mask': '255.255.255.0', 'vm_gateway': '10.0.0.1',
+                                                'vm_dns': '10.0.0.2', 'vm_hostname': 'vm-00002'}),
+    ('vm_cpu.customize', vm_cpu.customize, {'vm_name': 'vm-00002', 'cpu_num': 4, 'core_num': 2}),
+    ('vm_memory.customize', vm_memory.customize, {'vm_name': 'vm-00002', 'memory_size': 8}),
+    ('vm_disk.add', vm_disk.add, {'vm_name': 'vm-00002', 'disk_size': 10}),
+    ('vm_disk.customize', vm_disk.customize, {'vm_name': 'vm-00002', 'disk_index': 2, 'disk_size': 20}),
+    ('vm_disk.delete', vm_disk.delete, {'vm_name': 'vm-00002', 'disk_index': 2}),
+    ('vm_nic.add', vm_nic.add, {'vm_name': 'vm-00002', 'portgroup_name': 'VM Network'}),
+    ('vm_nic.delete', vm_nic.delete, {'vm_name': 'vm-00002', 'portgroup_name': 'VM Network'}),
+    ('vm_snapshot.create', vm_snapshot.create, {'vm_name': 'vm-00002', 'snapshot_name': 'bench'}),
+    ('vm_snapshot.show', vm_snapshot.show, {'vm_name': 'vm-00002'}),
+    ('vm_snapshot.rename', vm_snapshot.rename, {'vm_name': 'vm-00002', 'snapshot_name': 'bench',
+                                                'new_name': 'bench-renamed'}),
+    ('vm_snapshot.revert', vm_snapshot.revert, {'vm_name': 'vm-00002', 'snapshot_name': 'bench-renamed'}),
+    ('vm_snapshot.remove', vm_snapshot.remove, {'vm_name': 'vm-00002', 'snapshot_name': 'bench-renamed'}),
+    ('vm_snapshot.remove_all', vm_snapshot.remove_all, {'vm_name': 'vm-00004'}),
+    ('vm_snapshot.create_bulk', vm_snapshot.create_bulk, {'snapshot_name': 'bench', 'folder_name': 'vm',
+                                                          'regex': '^vm-'}),
+    ('vm_snapshot.revert_bulk', vm_snapshot.revert_bulk, {'snapshot_name': 'bench', 'folder_name': 'vm',
+                                                          'regex': '^vm-'}),
+    ('vm_snapshot.remove_bulk', vm_snapshot.remove_bulk, {'folder_name': 'vm', 'regex': '^vm-',
+                                                          'snapshot_name': 'bench'}),
+    ('vm_snapshot.apply_retention', vm_snapshot.apply_retention, {'policy': RetentionPolicy(max_count=1),
+                                                                  'folder_name': 'vm'}),
+    ('cluster.add', cluster.add, {'cluster_name': 'bench-cluster', 'datacenter_name': 'dc1'}),
+    ('cluster.info', cluster.info, {'cluster_name': 'dc1-cluster1', 'datacenter_name': 'dc1'}),
+    ('cluster.rename', cluster.rename, {'cluster_name': 'bench-cluster', 'new_name': 'bench-cluster-2',
+                                        'datacenter_name': 'dc1'}),
+    ('cluster.delete', cluster.delete, {'cluster_name': 'bench-cluster-2', 'datacenter_name': 'dc1'}),
+    ('datacenter.info', datacenter.info, {'datacenter_name': 'dc1'}),
+    ('datastore.info', datastore.info, {'datastore_name': 'dc1-ds1', 'datacenter_name': 'dc1'}),
+    ('datastore.capacity', datastore.capacity, {}),
+    ('datastore.refresh', datastore.refresh, {'datastore_name': 'dc1-ds1', 'datacenter_name': 'dc1'}),
+    ('datastore.rename', datastore.rename, {'datastore_name': 'dc1-ds2', 'new_name': 'dc1-ds2-renamed',
+                                            'datacenter_name': 'dc1'}),
+    ('folder.add_to_folder', folder.add_to_folder, {'folder_name': 'bench'}),
+    ('folder.add_to_datacenter', folder.add_to_datacenter, {'folder_name': 'bench-vms', 'folder_type': 'vmFolder',
+                                                            'datacenter_name': 'dc1'}),
+    ('folder.info', folder.info, {'folder_name': 'vm', 'folder_type': 'vmFolder'}),
+    ('folder.rename', folder.rename, {'folder_name': 'bench', 'new_name': 'bench-renamed'}),
+    ('folder.delete_from_folder', folder.delete_from_folder, {'folder_name': 'bench-renamed'}),
+    ('folder.delete_from_datacenter', folder.delete_from_datacenter, {'folder_name': 'bench-vms',
+                                                                      'folder_type': 'vmFolder',
+                                                                      'datacenter_name': 'dc1'}),
+    ('vswitch.add', vswitch.add, {'vswitch_name': 'vSwitch1', 'vnic_name': 'vmnic1', 'hosts_name': [HOST_1, HOST_2]}),
+    ('vswitch.customize', vswitch.customize, {'vswitch_name': 'vSwitch1', 'vnic_name': 'vmnic2', 'host_name': HOST_1}),
+    ('vswitch.show', vswitch.show, {}),
+    ('portgroup.add', portgroup.add, {'vswitch_name': 'vSwitch1', 'portgroup_name': 'bench-pg', 'vlan_id': '10',
+                                      'hosts_name': [HOST_1, HOST_2]}),
+    ('portgroup.show', portgroup.show, {}),
+    ('portgroup.audit', portgroup.audit, {'cluster_name': 'dc1-cluster1'}),
+    ('portgroup.rename', portgroup.rename, {'portgroup_name': 'bench-pg', 'new_name': 'bench-pg-2',
+                                            'host_name': HOST_1}),
+    ('portgroup.delete', portgroup.delete, {'portgroup_name': 'bench-pg', 'hosts_name': [HOST_2]}),
+    ('vswitch.reconcile', vswitch.reconcile, {'layout': {'vswitches': [{'name': 'vSwitch1', 'mtu': 9000}],
+                                                         'portgroups': [{'name': 'bench-pg-3', 'vswitch': 'vSwitch1',
+                                                                         'vlan_id': 30}]},
+                                              'hosts_name': [HOST_1, HOST_2]}),
+    ('vswitch.delete', vswitch.delete, {'vswitch_name': 'vSwitch1', 'hosts_name': [HOST_1, HOST_2]}),
+    ('vmachine.destroy', vmachine.destroy, {'folder_name': 'vm', 'regex': '^vm-0000[1-5]$'}),
+    ('datastore.delete', datastore.delete, {'datastore_name': 'dc1-ds2-renamed', 'datacenter_name': 'dc1'}),
+]
+
+FIELD_NAMES = ['Size', 'Case', 'Seconds', 'Calls', 'KB received', 'Top calls', 'Error']
+
+
+def build_inventory(size):
+    """
+    Build a synthetic inventory of the given number of virtual machines.
+
+    :param size: number of virtual machines
+    :return: the FakeVCenter
+    """
+    # keep roughly 50 virtual machines per host, as on a busy production cluster
+    hosts = max(2, min(size // 50, 64))
+    return FakeVCenter(datacenters=1, clusters=2, hosts=(hosts + 1) // 2, datastores=4, vms=size, templates=1)
+
+
+def run_case(vcenter, si, func, kwargs):
+    """
+    Run one benchmark case and measure it.
+
+    :param vcenter: the FakeVCenter serving the service instance
+    :param si: service instance bound to the fake vCenter
+    :param func: the function to benchmark
+    :param kwargs: keyword arguments passed to the function after the service instance
+    :return: a dictionary with the wall time, the calls by method name, the bytes received and the error
+    """
+    vcenter.stub.reset_counters()
+    error = None
+
+    start_time = time.perf_counter()
+    # the functions print their results, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            func(si, **kwargs)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {getattr(exc, 'msg', None) or exc}"
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'seconds': elapsed,
+        'calls': dict(vcenter.stub.calls),
+        'bytes': vcenter.stub.bytes_received,
+        'error': error,
+    }
+
+
+def run(sizes=None, pattern=None):
+    """
+    Run every benchmark case at every inventory size.
+
+    :param sizes: list of inventory sizes, defaults to DEFAULT_SIZES
+    :param pattern: optional regular expression selecting the cases to run by name
+    :return: a generator yielding (size, case name, measurement) tuples
+    """
+    for size in sizes or DEFAULT_SIZES:
+        vcenter = build_inventory(size)
+        si = vcenter.service_instance()
+        # like a real connection, the service content is retrieved once at login
+        si.RetrieveContent()
+
+        for name, func, kwargs in CASES:
+            if pattern and not re.search(pattern, name):
+                continue
+            yield size, name, run_case(vcenter, si, func, kwargs)
+
+
+def compare(results, baseline):
+    """
+    Find the cases making more remote calls than recorded in a baseline.
+
+    :param results: dictionary mapping 'size/case' keys to measurements
+    :param baseline: dictionary mapping 'size/case' keys to the call count of an earlier run
+    :return: a list of regression messages
+    """
+    regressions = []
+    for key, measurement in results.items():
+        calls = sum(measurement['calls'].values())
+        if key in baseline and calls > baseline[key]:
+            regressions.append(f"{key}: {calls} calls, {baseline[key]} in the baseline")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure wall time, SOAP round trips and bytes received of every "
+                                                 "public function against an in-process fake vCenter.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="inventory sizes in virtual machines")
+    parser.add_argument('--cases', help="regular expression selecting the cases to run, e.g. 'vmachine\\.'")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='table', help="report format")
+    parser.add_argument('--output', help="file to write the report to")
+    parser.add_argument('--save', help="write the call count of every case to this JSON baseline file")
+    parser.add_argument('--baseline', help="fail if a case makes more calls than in this JSON baseline file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with get_sink(args.format, path=args.output) as sink:
+        sink.begin(FIELD_NAMES, title="Benchmark results:")
+        for size, name, measurement in run(args.sizes, args.cases):
+            results[f'{size}/{name}'] = measurement
+            top_calls = sorted(measurement['calls'].items(), key=lambda item: -item[1])[:3]
+            sink.write([size, name, round(measurement['seconds'], 3), sum(measurement['calls'].values()),
+                        round(measurement['bytes'] / 1024, 1), ', '.join(f'{method}={count}'
+                                                                         for method, count in top_calls),
+                        measurement['error'] or ''])
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({key: sum(measurement['calls'].values()) for key, measurement in results.items()}, file,
+                      indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file))
+        for message in regressions:
+            print(f"Regression: {message}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
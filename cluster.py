@@ -1,7 +1,8 @@
 from pyVmomi import vim
 from tools.obj_helper import *
+from tools.property_helper import retrieve_properties
 from tools import task
-from prettytable import PrettyTable
+from tools.output_sink import TableSink
 
 
 def add(si, cluster_name, datacenter_name):
@@ -13,22 +14,8 @@ def add(si, cluster_name, datacenter_name):
     :param datacenter_name: name of the datacenter where the cluster will be created
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
     # locate the datacenter by its name
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
     # create a cluster specification
     cluster_spec = vim.cluster.ConfigSpec()
@@ -46,37 +33,11 @@ def delete(si, cluster_name, datacenter_name):
     :param datacenter_name: name of the datacenter containing the cluster
     :return:
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
     # locate the datacenter by its name
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
-
-    container_view = content.viewManager.CreateContainerView(datacenter.hostFolder, [vim.ClusterComputeResource], True)
-    clusters = list(container_view.view)
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    cluster = None
     # locate the cluster by its name within the datacenter
-    for cluster_temp in clusters:
-        if cluster_temp.name == cluster_name:
-            cluster = cluster_temp
-    container_view.Destroy()
-
-    if not cluster:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.ClusterComputeResource]' with name '{cluster_name}' not found."
-        )
+    cluster = get_single_obj(si, [vim.ClusterComputeResource], cluster_name, folder=datacenter.hostFolder)
 
     # delete the cluster
     tasks = [cluster.Destroy_Task()]
@@ -94,37 +55,11 @@ def rename(si, cluster_name, new_name, datacenter_name):
     :param datacenter_name: name of the datacenter containing the cluster
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
     # locate the datacenter by its name
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    container_view = content.viewManager.CreateContainerView(datacenter.hostFolder, [vim.ClusterComputeResource], True)
-    clusters = list(container_view.view)
-
-    cluster = None
     # locate the cluster by its name within the datacenter
-    for cluster_temp in clusters:
-        if cluster_temp.name == cluster_name:
-            cluster = cluster_temp
-    container_view.Destroy()
-
-    if not cluster:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.ClusterComputeResource]' with name '{cluster_name}' not found."
-        )
+    cluster = get_single_obj(si, [vim.ClusterComputeResource], cluster_name, folder=datacenter.hostFolder)
 
     # rename the cluster
     tasks = [cluster.Rename_Task(new_name)]
@@ -132,57 +67,55 @@ def rename(si, cluster_name, new_name, datacenter_name):
     print(f"Cluster {cluster_name} renamed to '{new_name}' successfully.")
 
 
-def info(si, cluster_name, datacenter_name):
+def info(si, cluster_name, datacenter_name, sink=None):
     """
     Display information about a specified cluster in a given datacenter.
 
     :param si: service instance object connected to vCenter
     :param cluster_name: name of the cluster whose information is to be retrieved
     :param datacenter_name: name of the datacenter containing the cluster
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
     # locate the datacenter by its name
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    container_view = content.viewManager.CreateContainerView(datacenter.hostFolder, [vim.ClusterComputeResource], True)
-    clusters = list(container_view.view)
-
-    cluster = None
     # locate the cluster by its name within the datacenter
-    for cluster_temp in clusters:
-        if cluster_temp.name == cluster_name:
-            cluster = cluster_temp
-    container_view.Destroy()
-
-    if not cluster:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.ClusterComputeResource]' with name '{cluster_name}' not found."
-        )
+    cluster = get_single_obj(si, [vim.ClusterComputeResource], cluster_name, folder=datacenter.hostFolder)
 
-    # create a table to display cluster information
-    table = PrettyTable()
-    table.field_names = ["Cluster Name", "Total CPU", 'Total memory', 'vMotion number']
+    sink = sink or TableSink()
 
     # retrieve cluster summary details
     cpu_num = cluster.summary.totalCpu
     memory_size = cluster.summary.totalMemory
     vmotion_num = cluster.summary.numVmotions
 
-    # add the cluster details to the table
-    table.add_row([cluster.name, cpu_num, memory_size, vmotion_num])
-    print(f"Cluster with name '{cluster_name}' information:")
-    print(table)
+    # write the cluster details
+    sink.begin(["Cluster Name", "Total CPU", 'Total memory', 'vMotion number'],
+               title=f"Cluster with name '{cluster_name}' information:")
+    sink.write([cluster.name, cpu_num, memory_size, vmotion_num])
+    sink.end()
+
+
+def summary_rows(si, datacenter_name=None):
+    """
+    Collect the summary of every cluster, read in one paged property collector call.
+
+    :param si: service instance object connected to vCenter
+    :param datacenter_name: optional name of the datacenter whose clusters are listed
+    :return: a tuple of the column names and the list of rows, one per cluster
+    """
+    folder = None
+    if datacenter_name:
+        folder = get_single_obj(si, [vim.Datacenter], datacenter_name).hostFolder
+
+    field_names = ["Cluster Name", "Total CPU", 'Total memory', 'vMotion number']
+    rows = []
+
+    # the whole summary is fetched, numVmotions only exists on the cluster specific summary type
+    for props in retrieve_properties(si, [vim.ClusterComputeResource], ['name', 'summary'], folder=folder):
+        summary = props.get('summary')
+        rows.append([props.get('name'), summary.totalCpu, summary.totalMemory,
+                     getattr(summary, 'numVmotions', None)])
+
+    return field_names, rows
@@ -1,7 +1,8 @@
 from pyVmomi import vim
 from tools.obj_helper import *
 from tools import task
-from prettytable import PrettyTable
+from tools.aggregation import aggregate
+from tools.output_sink import TableSink
 
 
 def add(si, datacenter_name, folder_name=None):
@@ -13,30 +14,15 @@ def add(si, datacenter_name, folder_name=None):
     :param folder_name: optional name of the folder where the datacenter will be created
     :return: none
     """
-    content = si.RetrieveContent()
-
     if len(datacenter_name) > 80:
         raise ValueError("Datacenter name exceeds the maximum allowed length of 80 characters")
 
+    # locate the folder by name, the datacenter is created in the root folder if none is given
     folder = None
-    # locate the folder by name
     if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
+        folder = get_single_obj(si, [vim.Folder], folder_name)
     else:
-        folder = content.rootFolder
+        folder = si.RetrieveContent().rootFolder
 
     folder.CreateDatacenter(datacenter_name)
     print(f"Datacenter '{datacenter_name}' created successfully.")
@@ -51,41 +37,13 @@ def delete(si, datacenter_name, folder_name=None):
     :param folder_name: optional name of the folder containing the datacenter
     :return: none
     """
-    content = si.RetrieveContent()
-
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
     if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-    else:
-        folder = content.rootFolder
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
-    # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(folder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = list()
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter.append(datacenter_temp)
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    # locate the datacenters by name
+    datacenter = get_given_obj(si, [vim.Datacenter], [datacenter_name], folder=folder)
 
     tasks = list()
     for datacenter_temp in datacenter:
@@ -105,41 +63,13 @@ def rename(si, datacenter_name, new_name, folder_name=None):
     :param folder_name: optional name of the folder containing the datacenter
     :return: none
     """
-    content = si.RetrieveContent()
-
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
     if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-    else:
-        folder = content.rootFolder
-
-    # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(folder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
-    datacenter = list()
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter.append(datacenter_temp)
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    # locate the datacenters by name
+    datacenter = get_given_obj(si, [vim.Datacenter], [datacenter_name], folder=folder)
 
     tasks = list()
     for datacenter_temp in datacenter:
@@ -149,77 +79,37 @@ def rename(si, datacenter_name, new_name, folder_name=None):
     print(f"Datacenter '{datacenter_name}' renamed to '{new_name}' successfully.")
 
 
-def info(si, datacenter_name, folder_name=None):
+def info(si, datacenter_name, folder_name=None, sink=None):
     """
     Display information about a datacenter.
 
     :param si: service instance object connected to vCenter
     :param datacenter_name: name of the datacenter
     :param folder_name: optional name of the folder containing the datacenter
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
     if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-    else:
-        folder = content.rootFolder
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
     # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(folder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
-
-    table = PrettyTable()
-    table.field_names = ["Datacenter Name", "Host number", "VM number", "Cluster Number", "Network Number",
-                         "Datastore number", "Template number"]
-
-    # collect information
-    host_num = 0
-    cluster_num = 0
-    for host in datacenter.hostFolder.childEntity:
-        if isinstance(host, vim.ClusterComputeResource):
-            cluster_num += 1
-        elif isinstance(host, vim.ComputeResource):
-            host_num += 1
-
-    machine_num = 0
-    template_num = 0
-    for vm in datacenter.vmFolder.childEntity:
-        if isinstance(vm, vim.VirtualMachine):
-            if vm.config.template:
-                template_num += 1
-            else:
-                machine_num += 1
-
-    network_num = len(datacenter.networkFolder.childEntity)
-    datastore_num = len(datacenter.datastoreFolder.childEntity)
-    table.add_row([datacenter_name, host_num, machine_num, cluster_num, network_num, datastore_num, template_num])
-
-    print(f"Datacenter with name '{datacenter_name}' information:")
-    print(table)
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name, folder=folder)
+
+    sink = sink or TableSink()
+
+    # count everything below the datacenter in one traversal, nested folders included
+    stats = aggregate(si, datacenter)
+    host_num = stats.hosts
+    cluster_num = stats.clusters
+    machine_num = stats.vms
+    template_num = stats.templates
+    network_num = stats.networks
+    datastore_num = stats.datastores
+
+    sink.begin(["Datacenter Name", "Host number", "VM number", "Cluster Number", "Network Number",
+                "Datastore number", "Template number"],
+               title=f"Datacenter with name '{datacenter_name}' information:")
+    sink.write([datacenter_name, host_num, machine_num, cluster_num, network_num, datastore_num, template_num])
+    sink.end()
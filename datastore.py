@@ -1,7 +1,9 @@
 from pyVmomi import vim
 from tools.obj_helper import *
+from tools.capacity_report import DatastoreCapacity
+from tools.property_helper import retrieve_object_properties, retrieve_properties
 from tools import task
-from prettytable import PrettyTable
+from tools.output_sink import TableSink
 
 
 def delete(si, datastore_name, datacenter_name=None):
@@ -13,37 +15,18 @@ def delete(si, datastore_name, datacenter_name=None):
     :param datacenter_name: Name of the datacenter where the datastore is located
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    # locate the datacenter
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    # locate the datacenter by name
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    datastore = None
-    # locate the datastore by name
-    datastores = datacenter.datastore
-    for datastore_temp in datastores:
-        if datastore_temp.name == datastore_name:
-            datastore = datastore_temp
-            break
+    # locate the datastore by name within the datacenter
+    datastores = find_obj(si, [vim.Datastore], [datastore_name], folder=datacenter.datastoreFolder, first=True)
 
-    if not datastore:
+    if not datastores:
         raise ManagedObjectNotFoundError(
             f"Managed object of type '[vim.Datastore]' with name '{datastore_name}' not found in datacenter"
             f" '{datacenter_name}'."
         )
+    datastore = datastores[0]
 
     # delete the datastore
     tasks = [datastore.Destroy_Task()]
@@ -61,38 +44,18 @@ def rename(si, datastore_name, new_name, datacenter_name):
     :param datacenter_name: Name of the datacenter where the datastore is located
     :return: none
     """
-    content = si.RetrieveContent()
-
     # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    # locate the datacenter
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    datastore = None
-    # locate the datastore by name
-    datastores = datacenter.datastore
-    for datastore_temp in datastores:
-        if datastore_temp.name == datastore_name:
-            datastore = datastore_temp
-            break
+    # locate the datastore by name within the datacenter
+    datastores = find_obj(si, [vim.Datastore], [datastore_name], folder=datacenter.datastoreFolder, first=True)
 
-    if not datastore:
+    if not datastores:
         raise ManagedObjectNotFoundError(
             f"Managed object of type '[vim.Datastore]' with name '{datastore_name}' not found in datacenter"
             f" '{datacenter_name}'."
         )
+    datastore = datastores[0]
 
     # rename the datastore
     tasks = [datastore.Rename_Task(new_name)]
@@ -109,38 +72,18 @@ def refresh(si, datastore_name, datacenter_name):
     :param datacenter_name: name of the datacenter where the datastore is located
     :return: none
     """
-    content = si.RetrieveContent()
-
     # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    # locate the datacenter
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    datastore = None
-    # locate the datastore by name
-    datastores = datacenter.datastore
-    for datastore_temp in datastores:
-        if datastore_temp.name == datastore_name:
-            datastore = datastore_temp
-            break
+    # locate the datastore by name within the datacenter
+    datastores = find_obj(si, [vim.Datastore], [datastore_name], folder=datacenter.datastoreFolder, first=True)
 
-    if not datastore:
+    if not datastores:
         raise ManagedObjectNotFoundError(
             f"Managed object of type '[vim.Datastore]' with name '{datastore_name}' not found in datacenter"
             f" '{datacenter_name}'."
         )
+    datastore = datastores[0]
 
     # refresh the datastore and update its storage information
     datastore.Refresh()
@@ -151,79 +94,128 @@ def refresh(si, datastore_name, datacenter_name):
     print(f"Datastore '{datastore_name}' refreshed successfully.")
 
 
-def info(si, datastore_name, datacenter_name):
+def info(si, datastore_name, datacenter_name, sink=None):
     """
     Display information about a specific datastore in a datacenter.
 
     :param si: service instance object connected to vCenter
     :param datastore_name: name of the datastore
     :param datacenter_name: name of the datacenter containing the datastore
+    :param sink: optional OutputSink receiving the rows, defaults to printed tables
     :return: none
     """
-    content = si.RetrieveContent()
-
     # locate the datacenter by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
-    datastore = None
-    # locate the datastore by name
-    datastores = datacenter.datastore
-    for datastore_temp in datastores:
-        if datastore_temp.name == datastore_name:
-            datastore = datastore_temp
-            break
+    # locate the datastore by name within the datacenter
+    datastores = find_obj(si, [vim.Datastore], [datastore_name], folder=datacenter.datastoreFolder, first=True)
 
-    if not datastore:
+    if not datastores:
         raise ManagedObjectNotFoundError(
             f"Managed object of type '[vim.Datastore]' with name '{datastore_name}' not found in datacenter"
             f" '{datacenter_name}'."
         )
+    datastore = datastores[0]
+    sink = sink or TableSink()
+
+    # retrieve datastore details; summary covers every datastore type, info.vmfs only exists on VMFS
+    props = retrieve_object_properties(si, [datastore], vim.Datastore, ['summary', 'info', 'host', 'vm'])[0]
+    summary = props['summary']
+    datastore_type = summary.type
+    if isinstance(props.get('info'), vim.host.VmfsDatastoreInfo):
+        datastore_type += " " + str(props['info'].vmfs.majorVersion)
+    host_num = len(props.get('host') or [])
+    location = summary.url
+
+    # count the templates with one property collector call
+    vms = props.get('vm') or []
+    template_num = sum(1 for vm_props in retrieve_object_properties(si, vms, vim.VirtualMachine,
+                                                                    ['summary.config.template'])
+                       if vm_props.get('summary.config.template'))
+    machine_num = len(vms) - template_num
+
+    free_space = '%.2f' % (summary.freeSpace / (1024 ** 3))
+    capacity = '%.2f' % (summary.capacity / (1024 ** 3))
+    usage = '%.2f' % ((summary.capacity - summary.freeSpace) / (1024 ** 3))
+
+    # write the details and the space usage
+    sink.begin(["Datastore Name", "Type", "Host number", "VM number", "Template Number", "Location"],
+               title=f"Datastore with name '{datastore_name}' information:")
+    sink.write([datastore_name, datastore_type, host_num, machine_num, template_num, location])
+
+    sink.begin(["Free Space", "Used Space", "Capacity"], title="\nSpace usage:")
+    sink.write([free_space + " GB", usage + " GB", capacity + " GB"])
+    sink.end()
+
+
+def summary_rows(si, datacenter_name=None):
+    """
+    Collect the capacity of every datastore, read in one paged property collector call.
+
+    :param si: service instance object connected to vCenter
+    :param datacenter_name: optional name of the datacenter whose datastores are listed
+    :return: a tuple of the column names and the list of rows, one per datastore
+    """
+    folder = None
+    if datacenter_name:
+        folder = get_single_obj(si, [vim.Datacenter], datacenter_name).datastoreFolder
+
+    field_names = ["Datastore Name", "Type", "Host number", "VM number", "Free Space", "Used Space", "Capacity"]
+    rows = []
+
+    for props in retrieve_properties(si, [vim.Datastore], ['name', 'summary', 'host', 'vm'], folder=folder):
+        summary = props.get('summary')
+        free_space = '%.2f' % (summary.freeSpace / (1024 ** 3))
+        usage = '%.2f' % ((summary.capacity - summary.freeSpace) / (1024 ** 3))
+        capacity = '%.2f' % (summary.capacity / (1024 ** 3))
+        rows.append([props.get('name'), summary.type, len(props.get('host') or []), len(props.get('vm') or []),
+                     free_space + " GB", usage + " GB", capacity + " GB"])
+
+    return field_names, rows
 
-    table = PrettyTable()
-    table.field_names = ["Datacenter Name", "Host number", "Machine number", "Cluster Number", "Network Number",
-                         "Datastore number", "Template number"]
-
-    # retrieve datastore details
-    datastore_type = datastore.info.vmfs.type + " " + str(datastore.info.vmfs.majorVersion)
-    host_num = len(datastore.host)
-    location = datastore.info.url
-
-    machine_num = 0
-    template_num = 0
-    for vm in datastore.vm:
-        if isinstance(vm, vim.VirtualMachine):
-            if vm.config.template:
-                template_num += 1
-            else:
-                machine_num += 1
-
-    free_space = '%.2f' % (datastore.info.freeSpace / (1024 ** 3))
-    capacity = '%.2f' % (datastore.info.vmfs.capacity / (1024 ** 3))
-    usage = '%.2f' % ((datastore.info.vmfs.capacity - datastore.info.freeSpace) / (1024 ** 3))
-
-    # create and display tables
-    info_table = PrettyTable()
-    info_table.field_names = ["Datastore Name", "Type", "Host number", "VM number", "Template Number", "Location"]
-    info_table.add_row([datastore_name, datastore_type, host_num, machine_num, template_num, location])
-
-    space_table = PrettyTable()
-    space_table.field_names = ["Free Space", "Used Space", "Capacity"]
-    space_table.add_row([free_space + " GB", usage + " GB", capacity + " GB"])
-
-    print(f"Datastore with name '{datastore_name}' information:")
-    print(info_table)
-    print("\nSpace usage:")
-    print(space_table)
+
+def _percent(ratio):
+    return '-' if ratio != ratio else '%.1f %%' % (ratio * 100)
+
+
+def capacity(si, datacenter_name=None, sort_by='overcommit', sink=None):
+    """
+    Display the capacity of every datastore of every datacenter, read in one property collector pass.
+
+    The used, provisioned and overcommitted ratios are computed for all datastores at once; the
+    provisioned space adds the space thin disks may still take to the used space, and the overcommitted
+    space is the part of it beyond the capacity.
+
+    :param si: service instance object connected to vCenter
+    :param datacenter_name: optional name of the datacenter whose datastores are listed
+    :param sort_by: figure the datastores are sorted by, highest first: 'overcommit', 'provisioned_ratio',
+                    'used_ratio', 'free_space' or 'capacity'
+    :param sink: optional OutputSink receiving the rows, defaults to printed tables
+    :return: the tools.capacity_report.DatastoreCapacity
+    """
+    folder = None
+    if datacenter_name:
+        folder = get_single_obj(si, [vim.Datacenter], datacenter_name)
+
+    report = DatastoreCapacity.load(si, folder=folder)
+    if datacenter_name:
+        # the datacenter the search starts from is not part of its own container view
+        report.datacenters = [datacenter_name] * len(report)
+
+    sink = sink or TableSink()
+    sink.begin(["Datacenter", "Datastore Name", "Type", "Host number", "VM number", "Template Number", "Capacity",
+                "Free Space", "Used", "Provisioned", "Overcommitted"], title="Datastore capacity: {count}")
+    for index in report.order(sort_by):
+        sink.write([report.datacenters[index], report.names[index], report.types[index],
+                    int(report.host_counts[index]), int(report.vm_counts[index]), int(report.template_counts[index]),
+                    '%.2f GB' % (report.capacity[index] / (1024 ** 3)),
+                    '%.2f GB' % (report.free_space[index] / (1024 ** 3)), _percent(report.used_ratio[index]),
+                    _percent(report.provisioned_ratio[index]), _percent(report.overcommit[index])])
+
+    totals = report.totals()
+    sink.begin(["Capacity", "Free Space", "Used", "Provisioned"], title="\nTotal of the accessible datastores:")
+    sink.write(['%.2f GB' % (totals['capacity'] / (1024 ** 3)), '%.2f GB' % (totals['free_space'] / (1024 ** 3)),
+                _percent(totals['used_ratio']), _percent(totals['provisioned_ratio'])])
+    sink.end()
+
+    return report
@@ -1,7 +1,6 @@
 from pyVmomi import vim
 from tools.obj_helper import *
 from tools import task
-from prettytable import PrettyTable
 from tools.folder_helper import *
 
 
@@ -14,27 +13,12 @@ def add_to_folder(si, folder_name, parent_name=None):
     :param parent_name: name of the parent folder
     :return: none
     """
-    content = si.RetrieveContent()
-
     parent = None
     # locate the parent folder or use the root folder
     if parent_name:
-        # parent = get_single_obj(si, [vim.Folder], parent_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        parents = list(container_view.view)
-
-        for parent_temp in parents:
-            if parent_temp.name == parent_name:
-                parent = parent_temp
-                break
-        container_view.Destroy()
-
-        if not parent:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{parent_name}' not found."
-            )
+        parent = get_single_obj(si, [vim.Folder], parent_name)
     else:
-        parent = content.rootFolder
+        parent = si.RetrieveContent().rootFolder
 
     # create the new folder
     parent.CreateFolder(folder_name)
@@ -51,24 +35,8 @@ def add_to_datacenter(si, folder_name, folder_type, datacenter_name):
     :param datacenter_name: name of the datacenter containing the folder
     :return: none
     """
-    content = si.RetrieveContent()
-
-    datacenter = None
     # locate the datacenter by name
-    # datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
     # get the appropriate folder type
     folder_mapping = {
@@ -96,33 +64,17 @@ def delete_from_folder(si, folder_name, parent_name=None):
     :param parent_name: name of the parent folder
     :return: none
     """
-    content = si.RetrieveContent()
-
     parent = None
     # locate the parent folder or use the root folder
     if parent_name:
-        # parent = get_single_obj(si, [vim.Folder], parent_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        parents = list(container_view.view)
-
-        for parent_temp in parents:
-            if parent_temp.name == parent_name:
-                parent = parent_temp
-                break
-        container_view.Destroy()
-
-        if not parent:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{parent_name}' not found."
-            )
+        parent = get_single_obj(si, [vim.Folder], parent_name)
     else:
-        parent = content.rootFolder
+        parent = si.RetrieveContent().rootFolder
 
     tasks = list()
     # locate and delete the folder
-    for child in parent.childEntity:
-        if isinstance(child, vim.Folder) and child.name == folder_name:
-            tasks.append(child.Destroy_Task())
+    for child in find_obj(si, [vim.Folder], [folder_name], folder=parent, recurse=False):
+        tasks.append(child.Destroy_Task())
 
     if not tasks:
         raise ManagedObjectNotFoundError(
@@ -143,24 +95,8 @@ def delete_from_datacenter(si, folder_name, folder_type, datacenter_name):
     :param datacenter_name: name of the datacenter containing the folder
     :return: none
     """
-    content = si.RetrieveContent()
-
-    datacenter = None
     # locate the datacenter by name
-    # datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    for datacenter_temp in datacenters:
-        if datacenter_temp.name == datacenter_name:
-            datacenter = datacenter_temp
-            break
-    container_view.Destroy()
-
-    if not datacenter:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-        )
+    datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
 
     # get the appropriate folder type
     folder_mapping = {
@@ -176,9 +112,8 @@ def delete_from_datacenter(si, folder_name, folder_type, datacenter_name):
 
     # locate and delete the folder
     tasks = list()
-    for child in parent.childEntity:
-        if isinstance(child, vim.Folder) and child.name == folder_name:
-            tasks.append(child.Destroy_Task())
+    for child in find_obj(si, [vim.Folder], [folder_name], folder=parent, recurse=False):
+        tasks.append(child.Destroy_Task())
 
     if not tasks:
         raise ManagedObjectNotFoundError(
@@ -189,27 +124,24 @@ def delete_from_datacenter(si, folder_name, folder_type, datacenter_name):
     print(f"Folder '{folder_name}' deleted successfully from '{folder_type}' in datacenter '{datacenter_name}'.")
 
 
-def info(si, folder_name, folder_type='dataFolder'):
+def info(si, folder_name, folder_type='dataFolder', sink=None):
     """
     Display information about a specified folder type in vCenter.
 
     :param si: the service instance connected to vCenter
     :param folder_name: the name of the folder to locate and analyze
     :param folder_type: the type of the folder
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
     folder = None
     if folder_name:
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name and repr(folder_temp)[18] == get_folder_mapping(folder_type):
+        # the folder type is encoded in the managed object id, e.g. 'group-v3' for a VM folder
+        prefix = 'group-' + get_folder_mapping(folder_type)
+        for folder_temp in find_obj(si, [vim.Folder], [folder_name]):
+            if folder_temp._moId.startswith(prefix):
                 folder = folder_temp
                 break
-        container_view.Destroy()
 
         if not folder:
             raise ManagedObjectNotFoundError(
@@ -217,7 +149,7 @@ def info(si, folder_name, folder_type='dataFolder'):
             )
     else:
         # default to the root folder if no name is provided
-        folder = content.rootFolder
+        folder = si.RetrieveContent().rootFolder
 
     # select the appropriate display function based on folder type
     display_functions = {
@@ -232,8 +164,7 @@ def info(si, folder_name, folder_type='dataFolder'):
     if not display_function:
         raise ValueError(f"Invalid folder type: '{folder_type}'.")
 
-    print(f"Folder '{folder_name}' information:")
-    display_function(folder)
+    display_function(si, folder, sink=sink, title=f"Folder '{folder_name}' information:")
 
 
 def rename(si, folder_name, new_name):
@@ -245,28 +176,13 @@ def rename(si, folder_name, new_name):
     :param new_name: New name to assign to the folder
     :return: none
     """
-    content = si.RetrieveContent()
-
     folder = None
     # locate the folder by its name
     if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], parent_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
+        folder = get_single_obj(si, [vim.Folder], folder_name)
     else:
         # use the root folder if no specific name is provided
-        folder = content.rootFolder
+        folder = si.RetrieveContent().rootFolder
 
     # initiate the rename operation
     tasks = [folder.Rename_Task(new_name)]
@@ -1,122 +1,108 @@
 from pyVmomi import vim
 import re
-from prettytable import PrettyTable
+from tools.host_network import DEFAULT_MAX_HOSTS, run_on_hosts
+from tools.network_audit import NetworkAudit
+from tools.output_sink import TableSink
 from tools.obj_helper import *
 from tools import task
 
 
-def add(si, vswitch_name: str, portgroup_name: str, vlan_id: str, hosts_name: list):
+def add(si, vswitch_name: str, portgroup_name: str, vlan_id: str, hosts_name: list, max_hosts=DEFAULT_MAX_HOSTS,
+        rollback=False, sink=None):
     """
-    Add a port group to the specified virtual switch on the hosts.
+    Add a port group to the specified virtual switch on the hosts, configuring the hosts in parallel.
 
     :param si: service instance object connected to vCenter
     :param vswitch_name: name of the virtual switch to which the port group will be added
     :param portgroup_name: name of the port group to be created
     :param vlan_id: VLAN ID for the port group
     :param hosts_name: list of host names where the port group will be added
+    :param max_hosts: maximum number of hosts configured at once
+    :param rollback: whether to remove the port group again from every host when any host failed
+    :param sink: optional OutputSink receiving the outcome of every host, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
+    # locate the hosts by name
+    hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
 
-    # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    hosts = list()
-    for host_temp in host_view:
-        if host_temp.name in hosts_name:
-            hosts.append(host_temp)
-    container_view.Destroy()
-
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
-
-    for host in hosts:
-        # create the port group specification
-        portgroup_spec = vim.host.PortGroup.Specification()
+    # create the port group specification
+    portgroup_spec = vim.host.PortGroup.Specification()
 
-        portgroup_spec.vswitchName = vswitch_name
-        portgroup_spec.name = portgroup_name
-        portgroup_spec.vlanId = int(vlan_id)
+    portgroup_spec.vswitchName = vswitch_name
+    portgroup_spec.name = portgroup_name
+    portgroup_spec.vlanId = int(vlan_id)
 
-        # set network policy for the port group
-        network_policy = vim.host.NetworkPolicy()
-        network_policy.security = vim.host.NetworkPolicy.SecurityPolicy()
-        network_policy.security.allowPromiscuous = True
-        network_policy.security.macChanges = False
-        network_policy.security.forgedTransmits = False
-        portgroup_spec.policy = network_policy
+    # set network policy for the port group
+    network_policy = vim.host.NetworkPolicy()
+    network_policy.security = vim.host.NetworkPolicy.SecurityPolicy()
+    network_policy.security.allowPromiscuous = True
+    network_policy.security.macChanges = False
+    network_policy.security.forgedTransmits = False
+    portgroup_spec.policy = network_policy
 
-        # add the port group to the host's network system
-        host.configManager.networkSystem.AddPortGroup(portgroup_spec)
+    # add the port group to the network system of the hosts
+    run_on_hosts(si, hosts, lambda props: props['configManager.networkSystem'].AddPortGroup(portgroup_spec),
+                 rollback=_remove_portgroup(portgroup_name) if rollback else None, max_hosts=max_hosts, sink=sink,
+                 title=f"Port group {portgroup_name} on the hosts:")
 
     print(f"Virtual switch {vswitch_name} added successfully with port group {portgroup_name}.")
 
 
-def delete(si, portgroup_name: str, hosts_name: str):
+def delete(si, portgroup_name: str, hosts_name: str, max_hosts=DEFAULT_MAX_HOSTS, rollback=False, sink=None):
     """
-    Delete a port group from the specified hosts.
+    Delete a port group from the specified hosts, configuring the hosts in parallel.
 
     :param si: service instance object connected to vCenter
     :param portgroup_name: name of the port group to be deleted
     :param hosts_name: list of host names from which the port group will be removed
+    :param max_hosts: maximum number of hosts configured at once
+    :param rollback: whether to restore the port group on every host when any host failed
+    :param sink: optional OutputSink receiving the outcome of every host, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
+    # locate the hosts by name
+    hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
 
-    # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
+    # remove the port group from the network system of the hosts, keeping its specification to restore it on failure
+    run_on_hosts(si, hosts, _remove_portgroup(portgroup_name),
+                 rollback=_restore_portgroup(portgroup_name) if rollback else None,
+                 properties=['config.network.portgroup'] if rollback else None, max_hosts=max_hosts, sink=sink,
+                 title=f"Port group {portgroup_name} on the hosts:")
 
-    hosts = list()
-    for host_temp in host_view:
-        if host_temp.name in hosts_name:
-            hosts.append(host_temp)
-    container_view.Destroy()
+    print(f"Port group {portgroup_name} deleted successfully.")
 
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
 
-    for host in hosts:
-        # remove the port group from the host's network system
-        host.configManager.networkSystem.RemovePortGroup(portgroup_name)
+def _remove_portgroup(portgroup_name):
+    def remove(props):
+        props['configManager.networkSystem'].RemovePortGroup(portgroup_name)
 
-    print(f"Port group {portgroup_name} deleted successfully.")
+    return remove
 
 
-def show(si, hosts_name=None):
+def _restore_portgroup(portgroup_name):
+    def restore(props):
+        for portgroup in props.get('config.network.portgroup') or []:
+            if portgroup.spec.name == portgroup_name:
+                props['configManager.networkSystem'].AddPortGroup(portgroup.spec)
+
+    return restore
+
+
+def show(si, hosts_name=None, sink=None):
     """
     Show the port groups on specified hosts.
 
     :param si: service instance object connected to vCenter
     :param hosts_name: list of host names to show the port groups
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    hosts = list()
     if hosts_name:
-        # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-        for host_temp in host_view:
-            if host_temp.name in hosts_name:
-                hosts.append(host_temp)
+        # filter hosts based on provided names
+        hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
     else:
-        # hosts = get_all_obj(si, [vim.HostSystem])
         # if no host names are provided, show all hosts
-        hosts = host_view
-    container_view.Destroy()
-
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
+        hosts = get_all_obj(si, [vim.HostSystem])
 
     # create a dictionary to hold host-port group relationships
     host_port_groups_dict = {}
@@ -124,20 +110,56 @@ def show(si, hosts_name=None):
         port_groups = host.config.network.portgroup
         host_port_groups_dict[host] = port_groups
 
-    # if there are port groups to display, create a pretty table
+    # if there are port groups to display, write them to the sink
     if host_port_groups_dict:
-        table = PrettyTable()
-        table.field_names = ["Host Name", "Port Group", "Vlan ID", "vSwitch Name"]
+        sink = sink or TableSink()
+        sink.begin(["Host Name", "Port Group", "Vlan ID", "vSwitch Name"], title="The port groups are:")
 
         for host, port_groups in host_port_groups_dict.items():
             for port_group in port_groups:
                 portgroup_name = port_group.spec.name
                 vswitch = port_group.spec.vswitchName
                 vlan_id = port_group.spec.vlanId
-                table.add_row([host.name, portgroup_name, vlan_id, vswitch])
+                sink.write([host.name, portgroup_name, vlan_id, vswitch])
+
+        sink.end()
+
+
+def audit(si, cluster_name, datacenter_name=None, sink=None):
+    """
+    Audit the consistency of the port groups and virtual switches of every host of a cluster.
+
+    The virtual switches and port groups of all hosts are read with one property collector call. A port group
+    is expected on every host, on the virtual switch and VLAN most hosts use, and a virtual switch with the
+    MTU most hosts use; the hosts missing one or holding it differently are reported, as they break vMotion.
+
+    :param si: service instance object connected to vCenter
+    :param cluster_name: name of the cluster whose hosts are audited
+    :param datacenter_name: optional name of the datacenter containing the cluster
+    :param sink: optional OutputSink receiving one row per finding, defaults to a printed table
+    :return: the tools.network_audit.NetworkAudit
+    """
+    # locate the cluster by its name, within the datacenter if one is given
+    folder = None
+    if datacenter_name:
+        folder = get_single_obj(si, [vim.Datacenter], datacenter_name).hostFolder
+    cluster = get_single_obj(si, [vim.ClusterComputeResource], cluster_name, folder=folder)
+
+    network_audit = NetworkAudit.load(si, folder=cluster)
+
+    if network_audit.consistent:
+        print(f"The network of the {len(network_audit)} hosts of cluster '{cluster_name}' is consistent.")
+        return network_audit
 
-        print("The port groups are:")
-        print(table)
+    sink = sink or TableSink()
+    sink.begin(["Host Name", "Item", "Issue", "Expected", "Actual"],
+               title=f"Network inconsistencies in cluster '{cluster_name}': {len(network_audit.inconsistent_hosts())} "
+                     f"of {len(network_audit)} hosts")
+    for finding in network_audit.findings():
+        sink.write(list(finding))
+    sink.end()
+
+    return network_audit
 
 
 def rename(si, portgroup_name, new_name, host_name):
@@ -150,27 +172,8 @@ def rename(si, portgroup_name, new_name, host_name):
     :param host_name: name of the host containing the port group
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    host = None
-    if host_name:
-        # host = get_given_obj(si, [vim.HostSystem], host_name)
-        for host_temp in host_view:
-            if host_temp.name == host_name:
-                host = host_temp
-    else:
-        # host = get_all_obj(si, [vim.HostSystem])
-        # if no host names are provided, show all host
-        host = host_view
-    container_view.Destroy()
-
-    if host is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(host_name)}' not found."
-        )
+    # locate the host by name
+    host = get_single_obj(si, [vim.HostSystem], host_name)
 
     port_group = None
     # find the specified port group on the host
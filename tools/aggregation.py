@@ -0,0 +1,154 @@
+from pyVmomi import vim
+from pyVmomi import vmodl
+from .property_helper import DEFAULT_MAX_OBJECTS, iter_filter_pages
+
+# properties read per type, the other objects are only counted
+AGGREGATE_PROPERTIES = {
+    vim.Folder: ['name'],
+    vim.Datacenter: ['name'],
+    vim.ComputeResource: ['name'],
+    vim.HostSystem: ['summary.hardware.numCpuCores', 'summary.hardware.memorySize'],
+    vim.VirtualMachine: ['summary.config.template'],
+    vim.Datastore: ['summary.capacity', 'summary.freeSpace'],
+    vim.Network: [],
+    vim.DistributedVirtualSwitch: [],
+}
+
+
+def build_traversal_specs(into_datacenters=True):
+    """
+    Build the traversal specifications walking the inventory below a folder, a datacenter or a cluster.
+
+    Folders are walked down their childEntity, datacenters down their four root folders, clusters and
+    standalone hosts down to their hosts, hosts down to the virtual machines they run and vApps down to
+    their virtual machines. The property collector follows them on the server, so the whole tree comes
+    back in one retrieval instead of one round trip per level.
+
+    :param into_datacenters: whether to walk into the datacenters found below a folder
+    :return: list of traversal specifications, the first one starting at a folder
+    """
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec
+    selection_spec = vmodl.query.PropertyCollector.SelectionSpec
+
+    folder_names = ['folderChildren', 'computeResourceHosts', 'vAppVms']
+    if into_datacenters:
+        folder_names += ['datacenterHostFolder', 'datacenterVmFolder', 'datacenterDatastoreFolder',
+                         'datacenterNetworkFolder']
+    folder_children = [selection_spec(name=name) for name in folder_names]
+
+    specs = [
+        traversal_spec(name='folderChildren', type=vim.Folder, path='childEntity', skip=False,
+                       selectSet=folder_children),
+        traversal_spec(name='computeResourceHosts', type=vim.ComputeResource, path='host', skip=False,
+                       selectSet=[selection_spec(name='hostVms')]),
+        traversal_spec(name='hostVms', type=vim.HostSystem, path='vm', skip=False),
+        traversal_spec(name='vAppVms', type=vim.VirtualApp, path='vm', skip=False),
+    ]
+    if into_datacenters:
+        for name, path in (('datacenterHostFolder', 'hostFolder'), ('datacenterVmFolder', 'vmFolder'),
+                           ('datacenterDatastoreFolder', 'datastoreFolder'),
+                           ('datacenterNetworkFolder', 'networkFolder')):
+            specs.append(traversal_spec(name=name, type=vim.Datacenter, path=path, skip=False,
+                                        selectSet=[selection_spec(name='folderChildren')]))
+
+    return specs
+
+
+class InventoryStats:
+    """
+    Recursive counts and sums of the objects below a folder, datacenter or cluster.
+
+    The root itself is not counted. Virtual machines found along several paths, e.g. through their folder
+    and through their host, are counted once.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: the folder, datacenter or cluster the statistics are about
+        """
+        self.root = root
+        self.name = None
+        self.folders = 0
+        self.datacenters = 0
+        self.clusters = 0
+        self.standalone_hosts = 0
+        self.hosts = 0
+        self.vms = 0
+        self.templates = 0
+        self.networks = 0
+        self.distributed_switches = 0
+        self.datastores = 0
+        self.datastore_clusters = 0
+        self.cpu_cores = 0
+        self.memory_size = 0
+        self.datastore_capacity = 0
+        self.datastore_free_space = 0
+
+    def add(self, props):
+        """
+        Count one retrieved object.
+
+        :param props: property dictionary of the object, see AGGREGATE_PROPERTIES
+        :return: none
+        """
+        obj = props['obj']
+        if obj == self.root:
+            self.name = props.get('name')
+        elif isinstance(obj, vim.VirtualMachine):
+            if props.get('summary.config.template'):
+                self.templates += 1
+            else:
+                self.vms += 1
+        elif isinstance(obj, vim.HostSystem):
+            self.hosts += 1
+            self.cpu_cores += props.get('summary.hardware.numCpuCores') or 0
+            self.memory_size += props.get('summary.hardware.memorySize') or 0
+        elif isinstance(obj, vim.Datastore):
+            self.datastores += 1
+            self.datastore_capacity += props.get('summary.capacity') or 0
+            self.datastore_free_space += props.get('summary.freeSpace') or 0
+        elif isinstance(obj, vim.ClusterComputeResource):
+            self.clusters += 1
+        elif isinstance(obj, vim.ComputeResource):
+            self.standalone_hosts += 1
+        elif isinstance(obj, vim.StoragePod):
+            self.datastore_clusters += 1
+        elif isinstance(obj, vim.Folder):
+            self.folders += 1
+        elif isinstance(obj, vim.Datacenter):
+            self.datacenters += 1
+        elif isinstance(obj, vim.Network):
+            self.networks += 1
+        elif isinstance(obj, vim.DistributedVirtualSwitch):
+            self.distributed_switches += 1
+
+
+def aggregate(si, root, into_datacenters=True, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Count and sum everything below a folder, datacenter or cluster with one server-side traversal.
+
+    :param si: service instance object connected to vCenter
+    :param root: the folder, datacenter or cluster to start from
+    :param into_datacenters: whether to walk into the datacenters below a folder, counting only them otherwise
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: an InventoryStats
+    """
+    # the specifications whose type does not match an object are ignored for it, so the same set starts at a
+    # folder, a datacenter or a cluster alike
+    select_set = build_traversal_specs(into_datacenters or isinstance(root, vim.Datacenter))
+
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=root, skip=False, selectSet=select_set)
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[obj_spec],
+        propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=paths, all=False)
+                 for vim_type, paths in AGGREGATE_PROPERTIES.items()])
+
+    stats = InventoryStats(root)
+    seen = set()
+    for page in iter_filter_pages(si, filter_spec, max_objects=max_objects):
+        for props in page:
+            if props['obj'] not in seen:
+                seen.add(props['obj'])
+                stats.add(props)
+
+    return stats
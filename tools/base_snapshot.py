@@ -0,0 +1,133 @@
+import threading
+from . import task
+
+# name of the snapshot linked clones are created from
+DEFAULT_BASE_SNAPSHOT = 'clone-base'
+
+# base snapshot registries, keyed by the stub of their service instance
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(si):
+    """
+    Return the base snapshot registry of a service instance, creating it on first use.
+
+    :param si: service instance object connected to vCenter
+    :return: the BaseSnapshotRegistry of this service instance
+    """
+    with _registries_lock:
+        registry = _registries.get(id(si._stub))
+        if registry is None:
+            registry = BaseSnapshotRegistry(si)
+            _registries[id(si._stub)] = registry
+
+    return registry
+
+
+def _find_snapshot(snapshot_trees, snapshot_name):
+    """
+    Search a snapshot tree for a snapshot by name.
+
+    :param snapshot_trees: list of vim.vm.SnapshotTree
+    :param snapshot_name: the snapshot name
+    :return: the vim.vm.Snapshot, or None if there is none of this name
+    """
+    for snapshot_tree in snapshot_trees or []:
+        if snapshot_tree.name == snapshot_name:
+            return snapshot_tree.snapshot
+        snapshot = _find_snapshot(snapshot_tree.childSnapshotList, snapshot_name)
+        if snapshot is not None:
+            return snapshot
+
+    return None
+
+
+class BaseSnapshotRegistry:
+    """
+    Base snapshots linked clones share their disks with, one per source template or virtual machine.
+
+    A linked clone only gets delta disks on top of a snapshot of its source, so it is created in
+    seconds and takes almost no datastore space. The registry looks up the base snapshot of a source
+    once and remembers it, and creates it if the source has none yet. vCenter cannot snapshot a
+    template, so a template is turned into a virtual machine for the snapshot and back into a template
+    afterwards.
+
+    Usage::
+
+        registry = get_registry(si)
+        snapshot = registry.get(template, resource_pool, host)
+    """
+
+    def __init__(self, si, snapshot_name=DEFAULT_BASE_SNAPSHOT):
+        """
+        :param si: service instance object connected to vCenter
+        :param snapshot_name: name of the base snapshots looked up and created
+        """
+        self.si = si
+        self.snapshot_name = snapshot_name
+
+        # moId of the source -> its base snapshot
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, source, resource_pool=None, host=None):
+        """
+        Return the base snapshot of a template or virtual machine, creating it if it is missing.
+
+        :param source: the template or virtual machine linked clones are created from
+        :param resource_pool: resource pool the template is assigned to while it is snapshotted
+        :param host: optional ESXi host the template is assigned to while it is snapshotted
+        :return: the vim.vm.Snapshot
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(source._moId)
+            if snapshot is None:
+                snapshot_info = source.snapshot
+                snapshot = _find_snapshot(snapshot_info.rootSnapshotList if snapshot_info else None,
+                                          self.snapshot_name)
+                if snapshot is None:
+                    snapshot = self._create(source, resource_pool, host)
+                self._snapshots[source._moId] = snapshot
+
+        return snapshot
+
+    def forget(self, source=None):
+        """
+        Drop the remembered base snapshot of a source, e.g. after the template was updated.
+
+        :param source: the template or virtual machine, all sources are forgotten if none is given
+        :return: none
+        """
+        with self._lock:
+            if source is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(source._moId, None)
+
+    def _create(self, source, resource_pool, host):
+        """
+        Create the base snapshot of a source.
+
+        :param source: the template or virtual machine
+        :param resource_pool: resource pool the template is assigned to while it is snapshotted
+        :param host: optional ESXi host the template is assigned to while it is snapshotted
+        :return: the new vim.vm.Snapshot
+        """
+        is_template = source.config.template
+        if is_template:
+            if resource_pool is None:
+                raise ValueError(f"A resource pool is needed to create the base snapshot of template "
+                                 f"'{source.name}'.")
+            source.MarkAsVirtualMachine(pool=resource_pool, host=host)
+
+        try:
+            snapshot_task = source.CreateSnapshot(self.snapshot_name, "Base of linked clones", False, False)
+            snapshot = task.wait_for_tasks(self.si, [snapshot_task]).results[snapshot_task]
+        finally:
+            if is_template:
+                source.MarkAsTemplate()
+
+        print(f"Base snapshot '{self.snapshot_name}' created for '{source.name}'.")
+
+        return snapshot
@@ -0,0 +1,149 @@
+from pyVmomi import vim
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_properties
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# properties read in the single pass of the report; summary works for every datastore type, VMFS, NFS,
+# vSAN and vVol alike, while info.vmfs only exists on VMFS datastores
+CAPACITY_REPORT_PROPERTIES = {
+    vim.Datastore: ['name', 'summary.type', 'summary.accessible', 'summary.capacity', 'summary.freeSpace',
+                    'summary.uncommitted', 'host', 'vm'],
+    vim.VirtualMachine: ['summary.config.template'],
+    vim.Datacenter: ['name', 'datastore'],
+}
+
+
+class DatastoreCapacity:
+    """
+    Capacity figures of many datastores, held column by column in NumPy arrays.
+
+    Every figure is in bytes and every ratio is relative to the capacity of the datastore; the ratios of a
+    datastore without capacity, e.g. an inaccessible one, are NaN. Needs the optional numpy package.
+
+    Usage::
+
+        report = DatastoreCapacity.load(si)
+        for index in report.order('overcommit'):
+            print(report.names[index], report.overcommit[index])
+    """
+
+    def __init__(self, datastores, names, datacenters, types, accessible, host_counts, vm_counts,
+                 template_counts, capacity, free_space, uncommitted):
+        """
+        :param datastores: list of the datastores
+        :param names: list of their names
+        :param datacenters: list of the names of their datacenters
+        :param types: list of their types, e.g. 'VMFS', 'NFS', 'vsan' or 'VVOL'
+        :param accessible: list of whether they are accessible
+        :param host_counts: number of hosts mounting each datastore
+        :param vm_counts: number of virtual machines on each datastore, templates excluded
+        :param template_counts: number of templates on each datastore
+        :param capacity: capacity of each datastore
+        :param free_space: free space of each datastore
+        :param uncommitted: space provisioned but not written yet, thin disks, on each datastore
+        """
+        if numpy is None:
+            raise SystemExit("The datastore capacity report needs the numpy package, "
+                             "install it with 'pip install numpy'.")
+
+        self.datastores = datastores
+        self.names = names
+        self.datacenters = datacenters
+        self.types = types
+        self.accessible = numpy.array(accessible, dtype=bool)
+        self.host_counts = numpy.array(host_counts, dtype=numpy.int64)
+        self.vm_counts = numpy.array(vm_counts, dtype=numpy.int64)
+        self.template_counts = numpy.array(template_counts, dtype=numpy.int64)
+        self.capacity = numpy.array(capacity, dtype=float)
+        self.free_space = numpy.array(free_space, dtype=float)
+        self.uncommitted = numpy.array(uncommitted, dtype=float)
+
+        # derived figures, computed for every datastore at once
+        self.used = self.capacity - self.free_space
+        self.provisioned = self.used + self.uncommitted
+        self.used_ratio = self._ratio(self.used)
+        self.provisioned_ratio = self._ratio(self.provisioned)
+        # provisioned space beyond the capacity, above 0 when the thin disks could fill the datastore up
+        self.overcommit = self._ratio(numpy.maximum(self.provisioned - self.capacity, 0))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _ratio(self, values):
+        return numpy.divide(values, self.capacity, out=numpy.full(len(values), numpy.nan), where=self.capacity > 0)
+
+    @classmethod
+    def load(cls, si, folder=None, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        Read the capacity of every datastore with one paged property collector pass.
+
+        :param si: service instance object connected to vCenter
+        :param folder: optional folder or datacenter to start the search from, the root folder otherwise
+        :param max_objects: maximum number of objects fetched per property collector page
+        :return: the DatastoreCapacity
+        """
+        datastore_props = []
+        templates = set()
+        datacenter_names = {}
+        for props in retrieve_properties(si, list(CAPACITY_REPORT_PROPERTIES), CAPACITY_REPORT_PROPERTIES,
+                                         folder=folder, max_objects=max_objects):
+            obj = props['obj']
+            if isinstance(obj, vim.Datastore):
+                datastore_props.append(props)
+            elif isinstance(obj, vim.VirtualMachine):
+                if props.get('summary.config.template'):
+                    templates.add(obj)
+            else:
+                for datastore in props.get('datastore') or []:
+                    datacenter_names[datastore] = props.get('name')
+
+        columns = {'datastores': [], 'names': [], 'datacenters': [], 'types': [], 'accessible': [],
+                   'host_counts': [], 'vm_counts': [], 'template_counts': [], 'capacity': [], 'free_space': [],
+                   'uncommitted': []}
+        for props in datastore_props:
+            vms = props.get('vm') or []
+            template_count = sum(1 for vm in vms if vm in templates)
+            columns['datastores'].append(props['obj'])
+            columns['names'].append(props.get('name'))
+            columns['datacenters'].append(datacenter_names.get(props['obj']))
+            columns['types'].append(props.get('summary.type'))
+            columns['accessible'].append(props.get('summary.accessible') is not False)
+            columns['host_counts'].append(len(props.get('host') or []))
+            columns['vm_counts'].append(len(vms) - template_count)
+            columns['template_counts'].append(template_count)
+            columns['capacity'].append(props.get('summary.capacity') or 0)
+            columns['free_space'].append(props.get('summary.freeSpace') or 0)
+            columns['uncommitted'].append(props.get('summary.uncommitted') or 0)
+
+        return cls(**columns)
+
+    def order(self, sort_by='overcommit'):
+        """
+        Return the datastore positions sorted by a figure, highest first and datastores without one last.
+
+        :param sort_by: name of a figure, e.g. 'overcommit', 'used_ratio', 'free_space' or 'capacity'
+        :return: a NumPy array of positions
+        """
+        values = getattr(self, sort_by, None)
+        if not isinstance(values, numpy.ndarray) or values.dtype.kind not in 'fi':
+            raise ValueError(f"Cannot sort datastores by '{sort_by}'.")
+
+        values = values.astype(float)
+        return numpy.argsort(numpy.where(numpy.isnan(values), numpy.inf, -values), kind='stable')
+
+    def totals(self):
+        """
+        Sum the figures over the accessible datastores.
+
+        :return: a dictionary with the capacity, free_space, used, provisioned, used_ratio and provisioned_ratio
+        """
+        capacity = float(self.capacity[self.accessible].sum())
+        totals = {name: float(getattr(self, name)[self.accessible].sum())
+                  for name in ('capacity', 'free_space', 'used', 'provisioned')}
+        totals['used_ratio'] = totals['used'] / capacity if capacity else float('nan')
+        totals['provisioned_ratio'] = totals['provisioned'] / capacity if capacity else float('nan')
+
+        return totals
@@ -0,0 +1,379 @@
+from pyVmomi import vim
+from .obj_helper import ManagedObjectNotFoundError, find_obj
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_object_properties
+from .scheduler import run_tasks
+
+# properties of a virtual machine a change set is validated against
+CHANGE_SET_PROPERTIES = ['name', 'config.changeVersion', 'config.hardware.device', 'config.hardware.numCPU',
+                         'config.hardware.numCoresPerSocket', 'config.hardware.memoryMB']
+
+# label prefix of the virtual disks, followed by their index
+DISK_PREFIX = "Hard disk "
+
+# unit number of the SCSI controller itself, never used by a disk
+SCSI_CONTROLLER_UNIT = 7
+
+
+def find_networks(si, portgroup_names, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Locate the port groups new network adapters are connected to, all with one lookup.
+
+    :param si: service instance object connected to vCenter
+    :param portgroup_names: list of port group names
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: a dictionary mapping every port group name to its network
+    """
+    networks = {}
+    portgroup_names = sorted(set(portgroup_names))
+    if portgroup_names:
+        for network in find_obj(si, [vim.Network], portgroup_names, max_objects=max_objects):
+            networks.setdefault(network.name, network)
+        for portgroup_name in portgroup_names:
+            if portgroup_name not in networks:
+                raise ManagedObjectNotFoundError(
+                    f"Managed object of type '[vim.Network]' with name '{portgroup_name}' not found."
+                )
+
+    return networks
+
+
+class ChangeSet:
+    """
+    CPU, memory, disk and network adapter changes of a virtual machine, applied with one reconfiguration.
+
+    Every change used to be a ReconfigVM_Task of its own, each after its own lookup of the virtual machine.
+    A change set collects the changes first, validates all of them against one read of the virtual
+    hardware and submits a single ConfigSpec holding every device change. The same change set can be
+    applied to many virtual machines at once, under the TaskScheduler caps.
+
+    Usage::
+
+        changes = ChangeSet().set_cpu(4, 2).set_memory(16).add_disk(100).add_disk(200).add_nic('VM Network')
+        changes.apply(si, vms)
+    """
+
+    def __init__(self):
+        self.cpu_num = None
+        self.core_num = None
+        self.memory_size = None
+        # list of (operation, arguments) tuples, in the order they were added
+        self.device_changes = []
+
+    def __len__(self):
+        count = len(self.device_changes)
+        if self.cpu_num is not None or self.core_num is not None:
+            count += 1
+        if self.memory_size is not None:
+            count += 1
+
+        return count
+
+    def set_cpu(self, cpu_num=None, core_num=None):
+        """
+        Change the number of CPUs and cores per CPU.
+
+        :param cpu_num: number of CPUs, unchanged if none is given
+        :param core_num: number of cores per CPU, unchanged if none is given
+        :return: the change set
+        """
+        self.cpu_num = cpu_num
+        self.core_num = core_num
+        return self
+
+    def set_memory(self, memory_size):
+        """
+        Change the memory size.
+
+        :param memory_size: memory size in GB
+        :return: the change set
+        """
+        self.memory_size = memory_size
+        return self
+
+    def add_disk(self, disk_size, disk_mode='persistent', disk_provision='thin'):
+        """
+        Add a new virtual disk on the first SCSI controller.
+
+        :param disk_size: size of the new disk in GB
+        :param disk_mode: mode of the virtual disk
+        :param disk_provision: disk provisioning type
+        :return: the change set
+        """
+        self.device_changes.append(('add_disk', (disk_size, disk_mode, disk_provision)))
+        return self
+
+    def edit_disk(self, disk_index=1, disk_size=None, disk_mode=None, scsi_controller=None):
+        """
+        Change a virtual disk.
+
+        :param disk_index: index of the virtual disk, as in its label 'Hard disk <index>'
+        :param disk_size: new size for the disk in GB; must be greater than the current size
+        :param disk_mode: new disk mode
+        :param scsi_controller: new unit number of the disk on its SCSI controller
+        :return: the change set
+        """
+        self.device_changes.append(('edit_disk', (disk_index, disk_size, disk_mode, scsi_controller)))
+        return self
+
+    def remove_disk(self, disk_index):
+        """
+        Remove a virtual disk.
+
+        :param disk_index: index of the virtual disk, as in its label 'Hard disk <index>'
+        :return: the change set
+        """
+        self.device_changes.append(('remove_disk', (disk_index,)))
+        return self
+
+    def add_nic(self, portgroup_name):
+        """
+        Add a network adapter connected to a port group.
+
+        :param portgroup_name: name of the port group
+        :return: the change set
+        """
+        self.device_changes.append(('add_nic', (portgroup_name,)))
+        return self
+
+    def remove_nic(self, portgroup_name):
+        """
+        Remove the network adapter connected to a port group.
+
+        :param portgroup_name: name of the port group associated with the network adapter
+        :return: the change set
+        """
+        self.device_changes.append(('remove_nic', (portgroup_name,)))
+        return self
+
+    def portgroup_names(self):
+        """
+        Return the names of the port groups new network adapters are connected to.
+
+        :return: a list of port group names
+        """
+        return [args[0] for operation, args in self.device_changes if operation == 'add_nic']
+
+    def build_spec(self, props, networks=None):
+        """
+        Validate the changes against the hardware of a virtual machine and build its ConfigSpec.
+
+        :param props: property dictionary of the virtual machine holding CHANGE_SET_PROPERTIES
+        :param networks: dictionary mapping the port group names of new network adapters to their networks
+        :return: a vim.vm.ConfigSpec
+        """
+        vm_name = props.get('name')
+        devices = list(props.get('config.hardware.device') or [])
+
+        config_spec = vim.vm.ConfigSpec()
+        # fail instead of overwriting changes made by someone else since the hardware was read
+        config_spec.changeVersion = props.get('config.changeVersion')
+
+        if self.cpu_num is not None or self.core_num is not None:
+            cpu_num = self.cpu_num or props.get('config.hardware.numCPU')
+            core_num = self.core_num or props.get('config.hardware.numCoresPerSocket') or 1
+            if cpu_num % core_num:
+                raise ValueError(f"The number of CPUs ({cpu_num}) of virtual machine '{vm_name}' must be a multiple "
+                                 f"of the number of cores per CPU ({core_num}).")
+            config_spec.numCPUs = cpu_num
+            config_spec.numCoresPerSocket = core_num
+
+        if self.memory_size is not None:
+            # convert memory size from GB to MB
+            config_spec.memoryMB = int(self.memory_size * 1024)
+
+        device_specs = []
+        removed = set()
+        # keys of the disks edited, a second edit would change the same device object again
+        edited = set()
+        # temporary keys of the devices added, vCenter assigns the real ones
+        new_keys = iter(range(-1, -1000, -1))
+        # unit numbers taken per controller, including the disks added by this change set
+        used_units = {}
+        for device in devices:
+            if isinstance(device, vim.vm.device.VirtualDisk):
+                used_units.setdefault(device.controllerKey, set()).add(device.unitNumber)
+
+        for operation, args in self.device_changes:
+            if operation == 'add_disk':
+                device_specs.append(self._add_disk_spec(vm_name, devices, used_units, next(new_keys), *args))
+            elif operation == 'edit_disk':
+                device_specs.append(self._edit_disk_spec(vm_name, devices, removed, edited, used_units, *args))
+            elif operation == 'remove_disk':
+                disk = self._find_disk(vm_name, devices, removed, args[0])
+                removed.add(disk.key)
+                device_specs.append(vim.vm.device.VirtualDeviceSpec(
+                    operation=vim.vm.device.VirtualDeviceSpec.Operation.remove, device=disk))
+            elif operation == 'add_nic':
+                device_specs.append(self._add_nic_spec((networks or {}).get(args[0]), next(new_keys), *args))
+            elif operation == 'remove_nic':
+                nic = None
+                for device in devices:
+                    if (isinstance(device, vim.vm.device.VirtualEthernetCard) and device.key not in removed and
+                            device.deviceInfo.summary == args[0]):
+                        nic = device
+                if not nic:
+                    raise ManagedObjectNotFoundError(
+                        f"Network adapter with name {args[0]} not found in virtual machine {vm_name}."
+                    )
+                removed.add(nic.key)
+                device_specs.append(vim.vm.device.VirtualDeviceSpec(
+                    operation=vim.vm.device.VirtualDeviceSpec.Operation.remove, device=nic))
+
+        if device_specs:
+            config_spec.deviceChange = device_specs
+
+        return config_spec
+
+    def apply(self, si, vms, max_objects=DEFAULT_MAX_OBJECTS, **limits):
+        """
+        Apply the changes to virtual machines, each with a single reconfiguration task.
+
+        The hardware of all virtual machines is read in one property collector call and every specification
+        is built before the first task starts, so an invalid change fails before any virtual machine is
+        touched.
+
+        :param si: service instance object connected to vCenter
+        :param vms: list of virtual machines
+        :param max_objects: maximum number of objects fetched per property collector page
+        :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+        :return: a TaskBatchResult keyed by virtual machine
+        """
+        vms = list(vms)
+        networks = find_networks(si, self.portgroup_names(), max_objects=max_objects)
+
+        specs = {}
+        for props in retrieve_object_properties(si, vms, vim.VirtualMachine, CHANGE_SET_PROPERTIES,
+                                                max_objects=max_objects):
+            specs[props['obj']] = self.build_spec(props, networks)
+
+        return run_tasks(si, vms, lambda vm: vm.ReconfigVM_Task(spec=specs[vm]), **limits)
+
+    @staticmethod
+    def _find_disk(vm_name, devices, removed, disk_index):
+        """
+        Find a virtual disk by the index in its label.
+        """
+        for device in devices:
+            if (isinstance(device, vim.vm.device.VirtualDisk) and device.key not in removed and
+                    device.deviceInfo.label[len(DISK_PREFIX):] == str(disk_index)):
+                return device
+
+        raise ManagedObjectNotFoundError(
+            f"VirtualDisk {disk_index} of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
+        )
+
+    @staticmethod
+    def _add_disk_spec(vm_name, devices, used_units, key, disk_size, disk_mode, disk_provision):
+        """
+        Build the device specification of a new virtual disk on the first SCSI controller.
+        """
+        scsi_controller = None
+        for device in devices:
+            if isinstance(device, vim.vm.device.VirtualSCSIController):
+                scsi_controller = device
+                break
+
+        if scsi_controller is None:
+            raise ValueError("No available SCSI controller found.")
+
+        # take the lowest free unit number, number 7 is reserved for the SCSI controller
+        units = used_units.setdefault(scsi_controller.key, set())
+        unit_number = next((unit for unit in range(65) if unit != SCSI_CONTROLLER_UNIT and unit not in units), None)
+        if unit_number is None:
+            raise ValueError(f"Maximum number of disks reached for virtual machine '{vm_name}'.")
+        units.add(unit_number)
+
+        disk_spec = vim.vm.device.VirtualDeviceSpec()
+        disk_spec.fileOperation = "create"
+        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+        disk_spec.device = vim.vm.device.VirtualDisk()
+        disk_spec.device.key = key
+        disk_spec.device.backing = vim.vm.device.VirtualDisk.FlatVer2BackingInfo()
+
+        # set provisioning type and mode
+        if disk_provision == 'thin':
+            disk_spec.device.backing.thinProvisioned = True
+        disk_spec.device.backing.diskMode = disk_mode
+        disk_spec.device.unitNumber = unit_number
+        disk_spec.device.capacityInKB = int(disk_size) * (1024 ** 2)
+        disk_spec.device.controllerKey = scsi_controller.key
+
+        return disk_spec
+
+    def _edit_disk_spec(self, vm_name, devices, removed, edited, used_units, disk_index, disk_size, disk_mode,
+                        scsi_controller):
+        """
+        Build the device specification changing a virtual disk.
+        """
+        disk_spec = vim.vm.device.VirtualDeviceSpec()
+        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+        disk_spec.device = self._find_disk(vm_name, devices, removed, disk_index)
+        if disk_spec.device.key in edited:
+            raise ValueError(f"VirtualDisk {disk_index} of virtual machine '{vm_name}' is edited more than once.")
+        edited.add(disk_spec.device.key)
+
+        # validate the new disk size if provided
+        if disk_size:
+            new_disk_kb = int(disk_size) * (1024 ** 2)
+            if new_disk_kb <= disk_spec.device.capacityInKB:
+                raise ValueError(
+                    f"New disk size ({disk_size} GB) must be greater than the current size "
+                    f"({disk_spec.device.capacityInKB // (1024 ** 2)} GB)."
+                )
+            disk_spec.device.capacityInKB = new_disk_kb
+
+        if disk_mode:
+            disk_spec.device.backing.diskMode = disk_mode
+
+        if scsi_controller:
+            if scsi_controller not in range(65) or scsi_controller == SCSI_CONTROLLER_UNIT:
+                raise ValueError(
+                    f"SCSI controller unit number ({scsi_controller}) must be in the range 0-6 or 8-64."
+                )
+            # move the disk to the new unit, so the disks added later by this change set do not take it
+            units = used_units.setdefault(disk_spec.device.controllerKey, set())
+            if scsi_controller != disk_spec.device.unitNumber:
+                if scsi_controller in units:
+                    raise ValueError(f"SCSI controller unit number ({scsi_controller}) is already used by another "
+                                     f"disk of virtual machine '{vm_name}'.")
+                units.discard(disk_spec.device.unitNumber)
+                units.add(scsi_controller)
+            disk_spec.device.unitNumber = scsi_controller
+
+        return disk_spec
+
+    @staticmethod
+    def _add_nic_spec(network, key, portgroup_name):
+        """
+        Build the device specification of a new network adapter.
+        """
+        nic_spec = vim.vm.device.VirtualDeviceSpec()
+        nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+
+        nic_spec.device = vim.vm.device.VirtualE1000()
+        nic_spec.device.key = key
+        nic_spec.device.deviceInfo = vim.Description()
+        nic_spec.device.deviceInfo.summary = portgroup_name
+
+        if isinstance(network, vim.OpaqueNetwork):
+            nic_spec.device.backing = vim.vm.device.VirtualEthernetCard.OpaqueNetworkBackingInfo(
+                opaqueNetworkType=network.summary.opaqueNetworkType,
+                opaqueNetworkId=network.summary.opaqueNetworkId
+            )
+        else:
+            nic_spec.device.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                useAutoDetect=False,
+                deviceName=portgroup_name
+            )
+
+        nic_spec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo(
+            startConnected=True,
+            allowGuestControl=True,
+            connected=False,
+            status='untried'
+        )
+
+        nic_spec.device.wakeOnLanEnabled = True
+        nic_spec.device.addressType = 'assigned'
+
+        return nic_spec
@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .output_sink import TableSink
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_properties
+from .service_instance import connect
+
+# environment variable holding a comma separated list of vCenter servers
+ENV_HOSTS = 'VSPHERE_HOSTS'
+
+# name of the column added to merged results
+VCENTER_COLUMN = 'vCenter'
+
+
+class FederatedResult:
+    """
+    Merged outcome of a query run against every vCenter of a federation.
+    """
+
+    def __init__(self, field_names, rows, errors, elapsed):
+        """
+        :param field_names: column names, starting with the vCenter column
+        :param rows: merged rows, each starting with the name of the vCenter it came from
+        :param errors: dictionary mapping the name of every failed vCenter to its exception
+        :param elapsed: seconds the whole fan-out took
+        """
+        self.field_names = field_names
+        self.rows = rows
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class Federation:
+    """
+    Several vCenter connections queried as one.
+
+    Queries run against every vCenter in parallel threads and their rows are merged into one result
+    tagged with a vCenter column, so a fleet-wide report takes as long as the slowest vCenter instead
+    of the sum of all of them. A failing vCenter does not fail the report, its error is kept aside.
+
+    Row functions take a service instance as first argument and return a tuple of column names and rows,
+    like vmachine.show_rows, cluster.summary_rows or datastore.summary_rows.
+
+    Usage::
+
+        federation = Federation.connect(['vc1.example.com', 'vc2.example.com'])
+        federation.show(vmachine.show_rows)
+        result = federation.query(cluster.summary_rows)
+    """
+
+    def __init__(self, service_instances, max_workers=None, errors=None):
+        """
+        :param service_instances: dictionary mapping vCenter names to their service instances
+        :param max_workers: maximum number of vCenters queried at once, defaults to all of them
+        :param errors: optional dictionary mapping the names of the vCenters that could not be connected to the error
+        """
+        self.service_instances = dict(service_instances)
+        self.max_workers = max_workers or max(len(self.service_instances), 1)
+        self.errors = dict(errors or {})
+
+    @classmethod
+    def connect(cls, hosts=None, user=None, password=None, port=None, disable_ssl_verification=True,
+                max_workers=None):
+        """
+        Connect to several vCenters in parallel.
+
+        A vCenter that cannot be connected does not fail the federation, its error is kept in the errors
+        attribute and the federation holds the other vCenters; only a federation without any vCenter fails.
+
+        :param hosts: list of vCenter server addresses, defaults to the comma separated $VSPHERE_HOSTS
+        :param user: vCenter username shared by all vCenters, defaults to $VSPHERE_USER
+        :param password: vCenter password shared by all vCenters, defaults to $VSPHERE_PASSWORD
+        :param port: vSphere API port, defaults to $VSPHERE_PORT or 443
+        :param disable_ssl_verification: whether to disable SSL certificate verification
+        :param max_workers: maximum number of vCenters queried at once, defaults to all of them
+        :return: the connected Federation
+        """
+        if hosts is None:
+            hosts = [host.strip() for host in os.environ.get(ENV_HOSTS, '').split(',') if host.strip()]
+        if not hosts:
+            raise SystemExit(f"No vCenter servers given, set the {ENV_HOSTS} environment variable.")
+
+        def connect_host(host):
+            return connect(disable_ssl_verification, host=host, user=user, password=password, port=port)
+
+        service_instances = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(hosts)) as executor:
+            futures = {host: executor.submit(connect_host, host) for host in hosts}
+            for host, future in futures.items():
+                # connect() raises SystemExit when it cannot log in, which must not end the other connections
+                try:
+                    service_instances[host] = future.result()
+                except (SystemExit, Exception) as error:
+                    errors[host] = error
+
+        for host, error in errors.items():
+            print(f"vCenter '{host}' could not be connected: {error}", file=sys.stderr)
+        if not service_instances:
+            raise SystemExit(f"None of the vCenter servers {', '.join(hosts)} could be connected.")
+
+        return cls(service_instances, max_workers=max_workers, errors=errors)
+
+    def __len__(self):
+        return len(self.service_instances)
+
+    def map(self, func, *args, **kwargs):
+        """
+        Call a function with the service instance of every vCenter in parallel.
+
+        :param func: callable taking a service instance as first argument
+        :param args: further positional arguments passed to the function
+        :param kwargs: keyword arguments passed to the function
+        :return: a tuple of two dictionaries mapping vCenter names to results and to exceptions
+        """
+        results = {}
+        errors = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {name: executor.submit(func, si, *args, **kwargs)
+                       for name, si in self.service_instances.items()}
+            for name, future in futures.items():
+                error = future.exception()
+                if error is None:
+                    results[name] = future.result()
+                else:
+                    errors[name] = error
+
+        return results, errors
+
+    def query(self, row_func, *args, **kwargs):
+        """
+        Run a row function against every vCenter and merge the rows.
+
+        :param row_func: callable taking a service instance and returning a tuple of column names and rows
+        :param args: further positional arguments passed to the row function
+        :param kwargs: keyword arguments passed to the row function
+        :return: a FederatedResult whose rows start with the vCenter they came from
+        """
+        start_time = time.monotonic()
+        results, errors = self.map(row_func, *args, **kwargs)
+
+        field_names = None
+        rows = []
+        # keep the order in which the vCenters were given
+        for name in self.service_instances:
+            if name not in results:
+                continue
+            names, vcenter_rows = results[name]
+            field_names = field_names or [VCENTER_COLUMN] + list(names)
+            rows.extend([name] + list(row) for row in vcenter_rows)
+
+        return FederatedResult(field_names or [VCENTER_COLUMN], rows, errors, time.monotonic() - start_time)
+
+    def retrieve_properties(self, vim_type, path_set, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        Retrieve properties of all managed objects of a type from every vCenter.
+
+        :param vim_type: list of managed object types to retrieve
+        :param path_set: list of property paths to retrieve for every object
+        :param max_objects: maximum number of objects returned per page
+        :return: a FederatedResult whose rows are property dictionaries with an additional vCenter key
+        """
+        start_time = time.monotonic()
+        results, errors = self.map(retrieve_properties, vim_type, path_set, max_objects=max_objects)
+
+        rows = []
+        for name in self.service_instances:
+            for props in results.get(name, []):
+                props[VCENTER_COLUMN] = name
+                rows.append(props)
+
+        return FederatedResult([VCENTER_COLUMN, 'obj'] + list(path_set), rows, errors,
+                               time.monotonic() - start_time)
+
+    def show(self, row_func, *args, sink=None, **kwargs):
+        """
+        Display the merged rows of a row function run against every vCenter.
+
+        :param row_func: callable taking a service instance and returning a tuple of column names and rows
+        :param args: further positional arguments passed to the row function
+        :param sink: optional OutputSink receiving the merged rows, defaults to a printed table
+        :param kwargs: keyword arguments passed to the row function
+        :return: none
+        """
+        result = self.query(row_func, *args, **kwargs)
+
+        sink = sink or TableSink()
+        sink.begin(result.field_names, title=f"Rows from {len(self) - len(result.errors)} of {len(self)} vCenters: "
+                                             f"{{count}} ({result.elapsed:.2f} s)")
+        sink.write_rows(result.rows)
+        sink.end()
+
+        # errors go to stderr so they do not mix with machine readable output
+        for name, error in result.errors.items():
+            print(f"vCenter '{name}' failed: {error}", file=sys.stderr)
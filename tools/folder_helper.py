@@ -1,5 +1,5 @@
-from pyVmomi import vim
-from prettytable import PrettyTable
+from .aggregation import aggregate
+from .output_sink import TableSink
 
 
 def get_folder_mapping(folder_type):
@@ -20,119 +20,106 @@ def get_folder_mapping(folder_type):
     return folder_mapping[folder_type]
 
 
-def display_data_folder(folder):
+def display_data_folder(si, folder, sink=None, title=None):
     """
-    Display information about a data folder, including the number of datacenters it contains.
+    Display information about a data folder, including the number of datacenters below it, nested folders included.
 
+    :param si: service instance object connected to vCenter
     :param folder: the folder object to analyze
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
+    :param title: optional heading displayed above the row
     :return: none
     """
-    table = PrettyTable()
-    table.field_names = ['Name', 'Datacenter number']
+    field_names = ['Name', 'Datacenter number']
 
-    datacenter_num = 0
-    # count the number of datacenters in the folder
-    for child in folder.childEntity:
-        if isinstance(child, vim.Datacenter):
-            datacenter_num += 1
+    # count the datacenters of the folder tree without walking into them
+    stats = aggregate(si, folder, into_datacenters=False)
 
-    table.add_row([folder.name, datacenter_num])
-    print(table)
+    sink = sink or TableSink()
+    sink.begin(field_names, title=title)
+    sink.write([stats.name, stats.datacenters])
+    sink.end()
 
 
-def display_host_folder(folder):
+def display_host_folder(si, folder, sink=None, title=None):
     """
-    Display information about a host folder, including the number of clusters, hosts, and VMs.
+    Display information about a host folder, including the number of clusters, hosts, and VMs below it.
 
+    :param si: service instance object connected to vCenter
     :param folder: the folder object to analyze
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
+    :param title: optional heading displayed above the row
     :return: none
     """
-    table = PrettyTable()
-    table.field_names = ['Name', 'Cluster number', 'Host number', 'VM number']
+    field_names = ['Name', 'Cluster number', 'Host number', 'VM number']
 
-    cluster_num = 0
-    host_num = 0
-    vm_num = 0
+    # clusters, hosts and the VMs they run are counted in one traversal, nested folders included
+    stats = aggregate(si, folder)
 
-    # iterate through child entities to count clusters, hosts, and VMs
-    for child in folder.childEntity:
-        if isinstance(child, (vim.ComputeResource, vim.ClusterComputeResource)):
-            cluster_num += 1
-            for host in child.host:
-                host_num += 1
-                for vm in host.vm:
-                    if not vm.config.template:
-                        vm_num += 1
+    sink = sink or TableSink()
+    sink.begin(field_names, title=title)
+    sink.write([stats.name, stats.clusters, stats.hosts, stats.vms])
+    sink.end()
 
-    table.add_row([folder.name, cluster_num, host_num, vm_num])
-    print(table)
 
-
-def display_vm_folder(folder):
+def display_vm_folder(si, folder, sink=None, title=None):
     """
-    Display information about a VM folder, including the number of VMs and templates.
+    Display information about a VM folder, including the number of VMs and templates below it.
 
+    :param si: service instance object connected to vCenter
     :param folder: the folder object to analyze
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
+    :param title: optional heading displayed above the row
     :return: none
     """
-    table = PrettyTable()
-    table.field_names = ['Name', 'VM number', 'Template number']
+    field_names = ['Name', 'VM number', 'Template number']
 
-    vm_num = 0
-    template_num = 0
-    # count the number of VMs and templates in the folder
-    for child in folder.childEntity:
-        if isinstance(child, vim.VirtualMachine):
-            if child.config.template:
-                template_num += 1
-            else:
-                vm_num += 1
+    # count the VMs and templates of the folder tree, vApps included
+    stats = aggregate(si, folder)
 
-    table.add_row([folder.name, vm_num, template_num])
-    print(table)
+    sink = sink or TableSink()
+    sink.begin(field_names, title=title)
+    sink.write([stats.name, stats.vms, stats.templates])
+    sink.end()
 
 
-def display_datastore_folder(folder):
+def display_datastore_folder(si, folder, sink=None, title=None):
     """
     Display information about a datastore folder, including the number of datastores and datastore clusters.
 
+    :param si: service instance object connected to vCenter
     :param folder: the folder object to analyze
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
+    :param title: optional heading displayed above the row
     :return: none
     """
-    table = PrettyTable()
-    table.field_names = ['Name', 'Datastore number', 'Datastore cluster number']
+    field_names = ['Name', 'Datastore number', 'Datastore cluster number']
 
-    datastore_num = 0
-    datastore_cluster_num = 0
-    # count datastores and datastore clusters
-    for child in folder.childEntity:
-        if isinstance(child, vim.Datastore):
-            datastore_num += 1
-        elif isinstance(child, vim.StoragePod):
-            datastore_cluster_num += 1
+    # count datastores and datastore clusters, the datastores inside datastore clusters included
+    stats = aggregate(si, folder)
 
-    table.add_row([folder.name, datastore_num, datastore_cluster_num])
-    print(table)
+    sink = sink or TableSink()
+    sink.begin(field_names, title=title)
+    sink.write([stats.name, stats.datastores, stats.datastore_clusters])
+    sink.end()
 
 
-def display_network_folder(folder):
+def display_network_folder(si, folder, sink=None, title=None):
     """
     Display information about a network folder, including the number of networks and distributed switches.
 
+    :param si: service instance object connected to vCenter
     :param folder: the folder object to analyze
+    :param sink: optional OutputSink receiving the row, defaults to a printed table
+    :param title: optional heading displayed above the row
     :return: none
     """
-    table = PrettyTable()
-    table.field_names = ['Name', 'Network number', 'Distributed switch number']
-
-    network_num = 0
-    dswitch_num = 0
-    # count networks and distributed switches
-    for child in folder.childEntity:
-        if isinstance(child, vim.Network):
-            network_num += 1
-        elif isinstance(child, vim.dvs.VmwareDistributedVirtualSwitch):
-            dswitch_num += 1
-
-    table.add_row([folder.name, network_num, dswitch_num])
-    print(table)
+    field_names = ['Name', 'Network number', 'Distributed switch number']
+
+    # count networks and distributed switches, nested folders included
+    stats = aggregate(si, folder)
+
+    sink = sink or TableSink()
+    sink.begin(field_names, title=title)
+    sink.write([stats.name, stats.networks, stats.distributed_switches])
+    sink.end()
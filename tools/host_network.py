@@ -0,0 +1,379 @@
+import copy
+import threading
+from concurrent import futures
+from pyVmomi import vim
+from pyVmomi import vmodl
+from .output_sink import TableSink
+from .property_helper import retrieve_object_properties
+from .task_engine import TaskBatchError, TaskBatchResult
+
+# default number of hosts configured at once
+DEFAULT_MAX_HOSTS = 16
+
+# host properties read for every rollout, operations find the network system of their host in them
+HOST_NETWORK_PROPERTIES = ['name', 'configManager.networkSystem']
+
+# keys of a desired network layout document and of its virtual switch and port group entries
+NETWORK_LAYOUT_KEYS = ['vswitches', 'portgroups']
+VSWITCH_KEYS = ['name', 'nics', 'mtu', 'num_ports']
+PORTGROUP_KEYS = ['name', 'vswitch', 'vlan_id']
+
+# number of ports of the virtual switches added without a num_ports, like vswitch.add
+DEFAULT_NUM_PORTS = 1024
+
+
+class HostSkippedError(Exception):
+    """
+    Recorded for the hosts a rollout did not configure because another host had failed.
+    """
+
+
+class HostNetworkResult(TaskBatchResult):
+    """
+    Per-host outcome of a network rollout: which hosts were configured, which failed and which were rolled back.
+    """
+
+    def __init__(self, hosts, host_futures, names, rolled_back=None, rollback_errors=None):
+        """
+        :param hosts: list of hosts, in the order they were given
+        :param host_futures: list of finished futures, one per host and in the same order
+        :param names: dictionary mapping the hosts to their names
+        :param rolled_back: list of the hosts whose change was undone
+        :param rollback_errors: dictionary mapping the hosts whose change could not be undone to the error
+        """
+        super().__init__(hosts, host_futures)
+        self.names = names
+        self.rolled_back = list(rolled_back or [])
+        self.rollback_errors = dict(rollback_errors or {})
+
+    def status(self, host):
+        """
+        Return the state a rollout left a host in.
+
+        :param host: one of the hosts of the rollout
+        :return: 'configured', 'failed', 'skipped', 'rolled back' or 'rollback failed'
+        """
+        if host in self.rollback_errors:
+            return 'rollback failed'
+        if host in self.rolled_back:
+            return 'rolled back'
+        if isinstance(self.errors.get(host), HostSkippedError):
+            return 'skipped'
+        if host in self.errors:
+            return 'failed'
+
+        return 'configured'
+
+    def rows(self):
+        """
+        Build one row per host with its name, its state and the error it failed with.
+
+        :return: list of [host name, state, error message] rows, in the order the hosts were given
+        """
+        rows = []
+        for host in self.tasks:
+            error = self.rollback_errors.get(host) or self.errors.get(host)
+            message = ''
+            if error is not None:
+                # faults without a message are named by their type, e.g. vim.fault.AlreadyExists
+                message = getattr(error, 'msg', None) or (type(error).__name__ if isinstance(error, vmodl.MethodFault)
+                                                          else str(error))
+            rows.append([self.names.get(host, host._moId), self.status(host), message])
+
+        return rows
+
+    def raise_for_errors(self):
+        """
+        Raise if any host failed; a single failed host is raised as the fault it reported, the skipped hosts aside.
+
+        :return: none
+        """
+        failures = [error for error in self.errors.values() if not isinstance(error, HostSkippedError)]
+        if len(failures) == 1:
+            raise failures[0]
+        if self.errors:
+            raise TaskBatchError(self)
+
+
+class HostNetworkExecutor:
+    """
+    Runs host network configuration calls on many ESXi hosts in parallel.
+
+    The name and the network system of every host are read with one property collector call, then the
+    operation runs on a thread pool capped at max_hosts hosts at once, so a change rolled out to a large
+    cluster takes about as long as the slowest host instead of the sum of all of them. Every host gets its
+    own outcome, so a failure on one host neither stops the others silently nor hides which hosts were
+    changed. When a rollback operation is given, the hosts not started yet are skipped after the first
+    failure and the hosts already configured are reverted, leaving the hosts as they were.
+
+    Usage::
+
+        executor = HostNetworkExecutor(si, max_hosts=8)
+        result = executor.run(hosts, lambda props: props['configManager.networkSystem'].AddPortGroup(spec),
+                              rollback=lambda props: props['configManager.networkSystem'].RemovePortGroup(name))
+        result.raise_for_errors()
+    """
+
+    def __init__(self, si, max_hosts=DEFAULT_MAX_HOSTS):
+        """
+        :param si: service instance object connected to vCenter
+        :param max_hosts: maximum number of hosts configured at once
+        """
+        self.si = si
+        self.max_hosts = max_hosts
+
+    def read(self, hosts, properties=None):
+        """
+        Read the properties the operations need for every host with one property collector call.
+
+        :param hosts: list of hosts
+        :param properties: optional list of further host properties, e.g. 'config.network.portgroup'
+        :return: a dictionary mapping the hosts to their property dictionaries
+        """
+        path_set = HOST_NETWORK_PROPERTIES + [path for path in properties or [] if path not in HOST_NETWORK_PROPERTIES]
+
+        return {props['obj']: props for props in retrieve_object_properties(self.si, list(hosts), vim.HostSystem,
+                                                                            path_set)}
+
+    def run(self, hosts, operation, rollback=None, properties=None, host_props=None):
+        """
+        Run an operation on every host and wait for all of them.
+
+        :param hosts: list of hosts
+        :param operation: callable taking the property dictionary of a host, see HOST_NETWORK_PROPERTIES
+        :param rollback: optional callable taking the property dictionary of a host and undoing the operation,
+                         called on the configured hosts when any host failed
+        :param properties: optional list of further host properties read for the operations, e.g. 'config.network'
+        :param host_props: optional property dictionaries of the hosts already returned by read()
+        :return: a HostNetworkResult keyed by host
+        """
+        hosts = list(hosts)
+        if not hosts:
+            return HostNetworkResult([], [], {})
+
+        if host_props is None:
+            host_props = self.read(hosts, properties)
+        names = {host: props.get('name') for host, props in host_props.items()}
+
+        # set on the first failure of a rollout that can be rolled back, the hosts not started yet are skipped
+        failed = threading.Event()
+
+        def configure(host):
+            if failed.is_set():
+                raise HostSkippedError("Skipped after a failure on another host.")
+            try:
+                return operation(host_props[host])
+            except Exception:
+                if rollback is not None:
+                    failed.set()
+                raise
+
+        with futures.ThreadPoolExecutor(max_workers=self.max_hosts or len(hosts)) as executor:
+            host_futures = [executor.submit(configure, host) for host in hosts]
+        result = HostNetworkResult(hosts, host_futures, names)
+
+        if rollback is not None and result.errors and result.succeeded:
+            with futures.ThreadPoolExecutor(max_workers=self.max_hosts or len(hosts)) as executor:
+                rollback_futures = {host: executor.submit(rollback, host_props[host]) for host in result.succeeded}
+            for host, future in rollback_futures.items():
+                error = future.exception()
+                if error is None:
+                    result.rolled_back.append(host)
+                else:
+                    result.rollback_errors[host] = error
+
+        return result
+
+
+def run_on_hosts(si, hosts, operation, rollback=None, properties=None, max_hosts=DEFAULT_MAX_HOSTS, sink=None,
+                 title=None, host_props=None):
+    """
+    Run a network operation on every host in parallel, write the per-host outcome and raise if any host failed.
+
+    :param si: service instance object connected to vCenter
+    :param hosts: list of hosts
+    :param operation: callable taking the property dictionary of a host, see HostNetworkExecutor.run
+    :param rollback: optional callable undoing the operation on a host, see HostNetworkExecutor.run
+    :param properties: optional list of further host properties read for the operations
+    :param max_hosts: maximum number of hosts configured at once
+    :param sink: optional OutputSink receiving one row per host, defaults to a printed table
+    :param title: optional heading displayed above the rows
+    :param host_props: optional property dictionaries of the hosts already returned by HostNetworkExecutor.read
+    :return: the HostNetworkResult
+    """
+    result = HostNetworkExecutor(si, max_hosts=max_hosts).run(hosts, operation, rollback=rollback,
+                                                              properties=properties, host_props=host_props)
+
+    # the outcome of every host, so a partial rollout is never left unnoticed
+    sink = sink or TableSink()
+    sink.begin(["Host Name", "Status", "Error"], title=title)
+    for row in result.rows():
+        sink.write(row)
+    sink.end()
+
+    result.raise_for_errors()
+
+    return result
+
+
+def _check_keys(entries, allowed, required, kind):
+    for entry in entries:
+        unknown = sorted(set(entry) - set(allowed))
+        if unknown:
+            raise ValueError(f"Unknown {kind} keys: {', '.join(unknown)}, expected {allowed}.")
+        missing = [key for key in required if entry.get(key) is None]
+        if missing:
+            raise ValueError(f"The {kind} {entry} misses {', '.join(missing)}.")
+
+
+def diff_network(host_name, vswitches, portgroups, layout, prune=False):
+    """
+    Compute the changes bringing the virtual switches and port groups of a host to a desired layout.
+
+    The desired layout document is a dictionary with any of these keys, a missing key is left as it is:
+
+    - vswitches: list of virtual switches, each a dictionary with the name and the optional nics (physical
+      NIC uplinks, e.g. ['vmnic1']), mtu and num_ports, only the values given are compared
+    - portgroups: list of port groups, each a dictionary with the name, the vswitch and the optional vlan_id;
+      an existing port group keeps its VLAN when none is given, a new one is untagged (VLAN 0)
+
+    Port groups are matched by name, a port group on another virtual switch or VLAN is edited in place and
+    keeps its policy. Virtual switches missing from the layout are never removed; when pruning, the port
+    groups of the virtual switches of the layout that are missing from it are removed.
+
+    :param host_name: name of the host, for the error messages
+    :param vswitches: list of the vim.host.VirtualSwitch of the host, its config.network.vswitch
+    :param portgroups: list of the vim.host.PortGroup of the host, its config.network.portgroup
+    :param layout: the desired layout document
+    :param prune: whether to remove the port groups of the layout virtual switches missing from the layout
+    :return: a tuple of the vim.host.NetworkConfig, holding no change if the host matches, and the list of
+             change descriptions
+    """
+    unknown = sorted(set(layout) - set(NETWORK_LAYOUT_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown network layout keys: {', '.join(unknown)}, expected {NETWORK_LAYOUT_KEYS}.")
+    desired_vswitches = layout.get('vswitches') or []
+    desired_portgroups = layout.get('portgroups') or []
+    _check_keys(desired_vswitches, VSWITCH_KEYS, ['name'], 'virtual switch')
+    _check_keys(desired_portgroups, PORTGROUP_KEYS, ['name', 'vswitch'], 'port group')
+
+    current_vswitches = {vswitch.name: vswitch for vswitch in vswitches or []}
+    current_portgroups = {portgroup.spec.name: portgroup for portgroup in portgroups or []}
+    config = vim.host.NetworkConfig(vswitch=[], portgroup=[])
+    changes = []
+
+    # virtual switches, added or edited with only the values given
+    for desired in desired_vswitches:
+        name = desired['name']
+        nics = desired.get('nics')
+        vswitch = current_vswitches.get(name)
+        if vswitch is None:
+            spec = vim.host.VirtualSwitch.Specification(numPorts=desired.get('num_ports') or DEFAULT_NUM_PORTS,
+                                                         mtu=desired.get('mtu'))
+            if nics:
+                spec.bridge = vim.host.VirtualSwitch.BondBridge(nicDevice=list(nics))
+            config.vswitch.append(vim.host.VirtualSwitch.Config(changeOperation='add', name=name, spec=spec))
+            changes.append(f"add vSwitch {name}")
+            continue
+
+        spec = copy.deepcopy(vswitch.spec)
+        vswitch_changes = []
+        current_nics = list(getattr(spec.bridge, 'nicDevice', None) or [])
+        if nics is not None and sorted(nics) != sorted(current_nics):
+            spec.bridge = vim.host.VirtualSwitch.BondBridge(nicDevice=list(nics))
+            # the teaming policy names the uplinks of the former bridge, they become the active uplinks
+            nic_order = getattr(getattr(spec.policy, 'nicTeaming', None), 'nicOrder', None)
+            if nic_order is not None:
+                nic_order.activeNic = list(nics)
+                nic_order.standbyNic = []
+            vswitch_changes.append(f"uplinks {', '.join(current_nics) or '-'} -> {', '.join(nics) or '-'}")
+        if desired.get('mtu') is not None and desired['mtu'] != spec.mtu:
+            vswitch_changes.append(f"MTU {spec.mtu} -> {desired['mtu']}")
+            spec.mtu = desired['mtu']
+        if desired.get('num_ports') is not None and desired['num_ports'] != spec.numPorts:
+            vswitch_changes.append(f"ports {spec.numPorts} -> {desired['num_ports']}")
+            spec.numPorts = desired['num_ports']
+        if vswitch_changes:
+            config.vswitch.append(vim.host.VirtualSwitch.Config(changeOperation='edit', name=name, spec=spec))
+            changes.append(f"vSwitch {name} {', '.join(vswitch_changes)}")
+
+    # port groups, a port group needs its virtual switch on the host or in the layout
+    vswitch_names = set(current_vswitches) | {desired['name'] for desired in desired_vswitches}
+    for desired in desired_portgroups:
+        name = desired['name']
+        vswitch_name = desired['vswitch']
+        vlan_id = desired.get('vlan_id')
+        if vswitch_name not in vswitch_names:
+            raise ValueError(f"Port group '{name}' needs virtual switch '{vswitch_name}', missing on host "
+                             f"'{host_name}' and in the layout.")
+
+        portgroup = current_portgroups.get(name)
+        if portgroup is None:
+            # a new port group without a VLAN is untagged
+            vlan_id = int(vlan_id or 0)
+            spec = vim.host.PortGroup.Specification(name=name, vswitchName=vswitch_name, vlanId=vlan_id,
+                                                    policy=vim.host.NetworkPolicy())
+            config.portgroup.append(vim.host.PortGroup.Config(changeOperation='add', spec=spec))
+            changes.append(f"add port group {name} on {vswitch_name} VLAN {vlan_id}")
+            continue
+
+        spec = copy.deepcopy(portgroup.spec)
+        portgroup_changes = []
+        if spec.vswitchName != vswitch_name:
+            portgroup_changes.append(f"vSwitch {spec.vswitchName} -> {vswitch_name}")
+            spec.vswitchName = vswitch_name
+        if vlan_id is not None and spec.vlanId != int(vlan_id):
+            portgroup_changes.append(f"VLAN {spec.vlanId} -> {vlan_id}")
+            spec.vlanId = int(vlan_id)
+        if portgroup_changes:
+            config.portgroup.append(vim.host.PortGroup.Config(changeOperation='edit', spec=spec))
+            changes.append(f"port group {name} {', '.join(portgroup_changes)}")
+
+    if prune:
+        layout_vswitches = {desired['name'] for desired in desired_vswitches}
+        wanted = {desired['name'] for desired in desired_portgroups}
+        for name, portgroup in current_portgroups.items():
+            if portgroup.spec.vswitchName in layout_vswitches and name not in wanted:
+                config.portgroup.append(vim.host.PortGroup.Config(changeOperation='remove', spec=portgroup.spec))
+                changes.append(f"remove port group {name}")
+
+    return config, changes
+
+
+def invert_network_config(vswitches, portgroups, config):
+    """
+    Build the network configuration undoing a change computed by diff_network.
+
+    :param vswitches: list of the vim.host.VirtualSwitch of the host before the change
+    :param portgroups: list of the vim.host.PortGroup of the host before the change
+    :param config: the vim.host.NetworkConfig of the change
+    :return: a vim.host.NetworkConfig restoring the virtual switches and port groups the change touched
+    """
+    current_vswitches = {vswitch.name: vswitch for vswitch in vswitches or []}
+    current_portgroups = {portgroup.spec.name: portgroup for portgroup in portgroups or []}
+    inverse = vim.host.NetworkConfig(vswitch=[], portgroup=[])
+
+    added_vswitches = set()
+    for vswitch_config in config.vswitch or []:
+        if vswitch_config.changeOperation == 'add':
+            inverse.vswitch.append(vim.host.VirtualSwitch.Config(changeOperation='remove', name=vswitch_config.name))
+            added_vswitches.add(vswitch_config.name)
+        else:
+            inverse.vswitch.append(vim.host.VirtualSwitch.Config(
+                changeOperation='edit', name=vswitch_config.name, spec=current_vswitches[vswitch_config.name].spec))
+
+    for portgroup_config in config.portgroup or []:
+        name = portgroup_config.spec.name
+        if portgroup_config.changeOperation == 'add':
+            # removing a virtual switch removes its port groups along
+            if portgroup_config.spec.vswitchName not in added_vswitches:
+                inverse.portgroup.append(vim.host.PortGroup.Config(changeOperation='remove',
+                                                                   spec=portgroup_config.spec))
+        elif portgroup_config.changeOperation == 'remove':
+            inverse.portgroup.append(vim.host.PortGroup.Config(changeOperation='add',
+                                                               spec=current_portgroups[name].spec))
+        else:
+            inverse.portgroup.append(vim.host.PortGroup.Config(changeOperation='edit',
+                                                               spec=current_portgroups[name].spec))
+
+    return inverse
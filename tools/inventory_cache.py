@@ -0,0 +1,178 @@
+import threading
+from pyVmomi import vim
+from pyVmomi import vmodl
+from .name_index import NameIndex
+from .property_helper import DEFAULT_MAX_OBJECTS, build_container_filter_spec
+
+# inventory caches currently running, keyed by the stub of their service instance
+_active_caches = {}
+_active_caches_lock = threading.Lock()
+
+
+def get_cache(si):
+    """
+    Return the running inventory cache of a service instance.
+
+    :param si: service instance object connected to vCenter
+    :return: the InventoryCache started for this service instance, or None
+    """
+    with _active_caches_lock:
+        cache = _active_caches.get(id(si._stub))
+
+    if cache is None or not cache.running:
+        return None
+
+    return cache
+
+
+class InventoryCache:
+    """
+    In-memory copy of the vCenter inventory, kept fresh by a long-lived property collector filter.
+
+    The inventory is loaded once, then a background thread applies the incremental changes returned
+    by WaitForUpdatesEx. While a cache is started for a service instance, the lookup helpers of
+    tools/obj_helper and tools/power_helper answer from its name index instead of walking the inventory
+    remotely. When following the changes fails, the cache stops answering lookups and keeps the exception
+    in its error attribute for the caller to report.
+
+    Usage::
+
+        with InventoryCache(si):
+            vm = get_single_obj(si, [vim.VirtualMachine], 'web01')
+    """
+
+    def __init__(self, si, properties=None, max_objects=DEFAULT_MAX_OBJECTS, wait_seconds=30):
+        """
+        :param si: service instance object connected to vCenter
+        :param properties: dictionary mapping managed object types to the property paths to cache,
+                           defaults to the properties of the name index
+        :param max_objects: maximum number of object updates returned by one WaitForUpdatesEx call
+        :param wait_seconds: how long one WaitForUpdatesEx call waits for changes before returning
+        """
+        self.si = si
+        self.index = NameIndex(properties)
+        self.properties = self.index.properties
+        self.max_objects = max_objects
+        self.wait_seconds = wait_seconds
+        self.version = None
+        self.error = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._property_collector = None
+        self._container_view = None
+        self._filter = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Load the inventory and start following changes in a background thread.
+
+        :return: the cache itself
+        """
+        content = self.si.RetrieveContent()
+        vim_type = list(self.properties)
+        self.index.root_folder = content.rootFolder
+
+        # use a dedicated property collector so other WaitForUpdates callers are not disturbed
+        self._property_collector = content.propertyCollector.CreatePropertyCollector()
+        self._container_view = content.viewManager.CreateContainerView(content.rootFolder, vim_type, True)
+        filter_spec = build_container_filter_spec(self._container_view, vim_type, self.properties)
+        self._filter = self._property_collector.CreateFilter(filter_spec, False)
+
+        # initial load: the first updates report every object as entering the filter
+        self._poll(wait_seconds=0)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='inventory-cache', daemon=True)
+        self._thread.start()
+
+        with _active_caches_lock:
+            _active_caches[id(self.si._stub)] = self
+
+        return self
+
+    def stop(self):
+        """
+        Stop following changes and release the server-side filter, view and property collector.
+
+        :return: none
+        """
+        with _active_caches_lock:
+            if _active_caches.get(id(self.si._stub)) is self:
+                del _active_caches[id(self.si._stub)]
+
+        self._stop.set()
+        if self._thread is not None:
+            try:
+                self._property_collector.CancelWaitForUpdates()
+            except vmodl.MethodFault:
+                pass
+            self._thread.join()
+            self._thread = None
+
+        if self._filter is not None:
+            self._filter.Destroy()
+            self._filter = None
+        if self._container_view is not None:
+            self._container_view.Destroy()
+            self._container_view = None
+        if self._property_collector is not None:
+            self._property_collector.Destroy()
+            self._property_collector = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._poll(wait_seconds=self.wait_seconds)
+            except vmodl.fault.RequestCanceled:
+                break
+            except Exception as error:
+                # an unusable cache must not answer lookups, the helpers fall back to live retrieval
+                if not self._stop.is_set():
+                    self.error = error
+                break
+
+    def _poll(self, wait_seconds):
+        """
+        Fetch and apply pending updates; keeps calling while the server reports truncated results.
+
+        :param wait_seconds: how long the server may wait for the first change
+        :return: none
+        """
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=wait_seconds,
+                                                            maxObjectUpdates=self.max_objects)
+        while True:
+            update = self._property_collector.WaitForUpdatesEx(self.version or '', options)
+            if update is None:
+                return
+
+            self._apply(update)
+            self.version = update.version
+            if not update.truncated:
+                return
+
+    def _apply(self, update):
+        for filter_set in update.filterSet:
+            for obj_set in filter_set.objectSet:
+                if obj_set.kind == 'leave':
+                    self.index.remove(obj_set.obj)
+                    continue
+
+                changes = {}
+                removed = []
+                for change in obj_set.changeSet:
+                    if change.op in ('remove', 'indirectRemove'):
+                        removed.append(change.name)
+                    else:
+                        changes[change.name] = change.val
+                self.index.update(obj_set.obj, changes, removed)
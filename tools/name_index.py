@@ -0,0 +1,241 @@
+import re
+import threading
+from pyVmomi import vim
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_properties
+
+# managed object types indexed by default and the properties kept for each of them
+INDEXED_PROPERTIES = {
+    vim.Folder: ['name', 'parent'],
+    vim.Datacenter: ['name', 'parent'],
+    vim.ComputeResource: ['name', 'parent'],
+    vim.HostSystem: ['name', 'parent'],
+    vim.ResourcePool: ['name', 'parent'],
+    vim.Datastore: ['name', 'parent'],
+    vim.Network: ['name', 'parent'],
+    vim.VirtualMachine: ['name', 'parent', 'summary.config.template', 'runtime.powerState'],
+}
+
+
+class NameIndex:
+    """
+    Index of managed entities by name, type and inventory path.
+
+    vSphere allows the same name in different datacenters or folders, so every name maps to all
+    entities carrying it; lookups narrow them down by type, by containing folder or by the full
+    inventory path (e.g. 'dc1/vm/prod/web01').
+    """
+
+    def __init__(self, properties=None):
+        """
+        :param properties: dictionary mapping managed object types to the property paths kept per entity
+        """
+        self.properties = properties or INDEXED_PROPERTIES
+        self.root_folder = None
+
+        # moId -> property dictionary ('obj' holds the managed object itself)
+        self._objects = {}
+        # name -> {moId: managed object}
+        self._names = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, si, properties=None, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        Build a snapshot index of the whole inventory in one paged property retrieval.
+
+        :param si: service instance object connected to vCenter
+        :param properties: dictionary mapping managed object types to the property paths kept per entity
+        :param max_objects: maximum number of objects fetched per property collector page
+        :return: the populated NameIndex
+        """
+        index = cls(properties)
+        index.root_folder = si.RetrieveContent().rootFolder
+
+        vim_type = list(index.properties)
+        for props in retrieve_properties(si, vim_type, index.properties, max_objects=max_objects):
+            index.update(props['obj'], props)
+
+        return index
+
+    def __len__(self):
+        return len(self._objects)
+
+    def update(self, obj, changes, removed=()):
+        """
+        Add an entity or update its indexed properties.
+
+        :param obj: the managed object
+        :param changes: dictionary of property paths and their new values
+        :param removed: property paths whose values were removed
+        :return: none
+        """
+        with self._lock:
+            mo_id = obj._moId
+            props = self._objects.setdefault(mo_id, {'obj': obj})
+            old_name = props.get('name')
+
+            for path, value in changes.items():
+                if path != 'obj':
+                    props[path] = value
+            for path in removed:
+                props.pop(path, None)
+
+            if props.get('name') != old_name:
+                self._unindex(mo_id, old_name)
+                self._names.setdefault(props.get('name'), {})[mo_id] = obj
+
+    def remove(self, obj):
+        """
+        Remove an entity from the index.
+
+        :param obj: the managed object
+        :return: none
+        """
+        with self._lock:
+            props = self._objects.pop(obj._moId, None)
+            if props is not None:
+                self._unindex(obj._moId, props.get('name'))
+
+    def _unindex(self, mo_id, name):
+        entries = self._names.get(name)
+        if entries is not None:
+            entries.pop(mo_id, None)
+            if not entries:
+                del self._names[name]
+
+    def covers(self, vim_type, path_set=()):
+        """
+        Check whether the index holds the given types and property paths.
+
+        :param vim_type: list of managed object types
+        :param path_set: property paths that must be indexed for all of these types
+        :return: True if lookups for these types and paths can be answered from the index
+        """
+        for obj_type in vim_type:
+            paths = None
+            for indexed_type, indexed_paths in self.properties.items():
+                if issubclass(obj_type, indexed_type):
+                    paths = indexed_paths
+                    break
+            if paths is None or not set(path_set) <= set(paths):
+                return False
+
+        return True
+
+    def get_property(self, obj, path, default=None):
+        """
+        Read an indexed property of a managed object.
+
+        :param obj: the managed object
+        :param path: the property path
+        :param default: value returned when the object or property is not indexed
+        :return: the indexed property value
+        """
+        with self._lock:
+            props = self._objects.get(obj._moId)
+            if props is None:
+                return default
+            return props.get(path, default)
+
+    def path(self, obj):
+        """
+        Compute the inventory path of an entity, e.g. 'dc1/vm/prod/web01'.
+
+        The root folder is not part of the path, matching SearchIndex.FindByInventoryPath.
+
+        :param obj: the managed object
+        :return: the inventory path, or None if the entity is not indexed
+        """
+        with self._lock:
+            names = []
+            props = self._objects.get(obj._moId)
+            while props is not None:
+                names.append(props.get('name'))
+                parent = props.get('parent')
+                if parent is None or parent == self.root_folder:
+                    return '/'.join(reversed(names))
+                props = self._objects.get(parent._moId)
+
+        return None
+
+    def _in_folder(self, props, folder, recurse):
+        if folder is None:
+            return True
+
+        parent = props.get('parent')
+        if not recurse:
+            return parent == folder
+
+        # walk up the indexed parent chain
+        while parent is not None:
+            if parent == folder:
+                return True
+            parent_props = self._objects.get(parent._moId)
+            parent = parent_props.get('parent') if parent_props else None
+
+        return False
+
+    def find(self, vim_type, names=None, regex=None, path=None, folder=None, recurse=True, filters=None):
+        """
+        Find indexed managed objects.
+
+        :param vim_type: list of managed object types to look for
+        :param names: optional list of names, looked up through the name index
+        :param regex: optional regex pattern the object names must match
+        :param path: optional inventory path (e.g. 'dc1/vm/prod/web01') of the object
+        :param folder: only return objects below this folder
+        :param recurse: whether objects in sub folders of the folder are returned
+        :param filters: optional dictionary of property paths and the values they must have;
+                        for boolean values an unset property counts as False
+        :return: a list of managed objects
+        """
+        vim_type = tuple(vim_type)
+        # the root folder contains the whole inventory
+        if folder is not None and folder == self.root_folder:
+            folder = None
+        if path is not None:
+            names = [path.rstrip('/').rsplit('/', 1)[-1]]
+
+        with self._lock:
+            if names is not None:
+                candidates = []
+                for name in names:
+                    candidates.extend(self._names.get(name, {}).keys())
+            else:
+                candidates = list(self._objects)
+
+            pattern = re.compile(regex) if regex is not None else None
+            objs = []
+            for mo_id in candidates:
+                props = self._objects[mo_id]
+                if not isinstance(props['obj'], vim_type):
+                    continue
+                if pattern is not None and not pattern.match(props.get('name', '')):
+                    continue
+                if filters and not match_filters(props, filters):
+                    continue
+                if not self._in_folder(props, folder, recurse):
+                    continue
+                if path is not None and self.path(props['obj']) != path.strip('/'):
+                    continue
+                objs.append(props['obj'])
+
+        return objs
+
+
+def match_filters(props, filters):
+    """
+    Check a property dictionary against filters; for boolean values an unset property counts as False.
+
+    :param props: dictionary of property paths and values
+    :param filters: dictionary of property paths and the values they must have
+    :return: True if all filters match
+    """
+    for path, value in (filters or {}).items():
+        actual = props.get(path)
+        if isinstance(value, bool):
+            actual = bool(actual)
+        if actual != value:
+            return False
+
+    return True
@@ -0,0 +1,175 @@
+from pyVmomi import vim
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_properties
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# host properties read in the single pass of the audit
+NETWORK_AUDIT_PROPERTIES = ['name', 'config.network.vswitch', 'config.network.portgroup']
+
+# VLAN ids go up to 4095, a (virtual switch, VLAN) pair is encoded as one integer
+_VLAN_RANGE = 4096
+
+
+def _majority(values, present):
+    """
+    Return the most common value of every column among the present cells, the lowest one on a tie.
+
+    :param values: (hosts x columns) integer matrix
+    :param present: boolean matrix of the same shape, the cells holding a value
+    :return: an integer array with one value per column, -1 for the columns without any value
+    """
+    columns = values.shape[1]
+    reference = numpy.full(columns, -1, dtype=numpy.int64)
+    rows, cols = numpy.nonzero(present)
+    if not len(cols):
+        return reference
+
+    # count every (column, value) pair at once, then keep the most frequent value of each column
+    pairs, counts = numpy.unique(numpy.stack([cols, values[rows, cols]], axis=1), axis=0, return_counts=True)
+    order = numpy.lexsort((pairs[:, 1], -counts, pairs[:, 0]))
+    first = numpy.unique(pairs[order, 0], return_index=True)[1]
+    reference[pairs[order[first], 0]] = pairs[order[first], 1]
+
+    return reference
+
+
+class NetworkAudit:
+    """
+    Consistency of the standard switch networking of many hosts, held as host x port group matrices.
+
+    Every port group found on any of the hosts is a column, its VLAN and virtual switch on each host are
+    encoded in integer matrices and the reference of a column is the most common (virtual switch, VLAN)
+    pair among the hosts holding it. Hosts missing a port group, or holding it on another virtual switch or
+    VLAN, break vMotion between the hosts; they are found for all hosts and port groups at once, so
+    auditing hundreds of hosts takes one property collector pass and a few array operations. The MTU of the
+    virtual switches is audited the same way. Needs the optional numpy package.
+
+    Usage::
+
+        audit = NetworkAudit.load(si, cluster)
+        for host_name, item, issue, expected, actual in audit.findings():
+            print(host_name, item, issue, expected, actual)
+    """
+
+    def __init__(self, host_names, vswitches, portgroups):
+        """
+        :param host_names: list of the host names
+        :param vswitches: list with the vim.host.VirtualSwitch list of each host
+        :param portgroups: list with the vim.host.PortGroup list of each host
+        """
+        if numpy is None:
+            raise SystemExit("The network audit needs the numpy package, install it with 'pip install numpy'.")
+
+        self.host_names = list(host_names)
+        self.portgroup_names = sorted({portgroup.spec.name for host_portgroups in portgroups
+                                       for portgroup in host_portgroups or []})
+        self.vswitch_names = sorted({vswitch.name for host_vswitches in vswitches
+                                     for vswitch in host_vswitches or []} |
+                                    {portgroup.spec.vswitchName for host_portgroups in portgroups
+                                     for portgroup in host_portgroups or []})
+        portgroup_columns = {name: column for column, name in enumerate(self.portgroup_names)}
+        vswitch_codes = {name: code for code, name in enumerate(self.vswitch_names)}
+
+        shape = (len(self.host_names), len(self.portgroup_names))
+        self.vlan = numpy.full(shape, -1, dtype=numpy.int64)
+        self.vswitch = numpy.full(shape, -1, dtype=numpy.int64)
+        self.mtu = numpy.full((len(self.host_names), len(self.vswitch_names)), -1, dtype=numpy.int64)
+        for row, host_portgroups in enumerate(portgroups):
+            for portgroup in host_portgroups or []:
+                column = portgroup_columns[portgroup.spec.name]
+                self.vlan[row, column] = portgroup.spec.vlanId or 0
+                self.vswitch[row, column] = vswitch_codes[portgroup.spec.vswitchName]
+        for row, host_vswitches in enumerate(vswitches):
+            for vswitch in host_vswitches or []:
+                self.mtu[row, vswitch_codes[vswitch.name]] = vswitch.mtu or 0
+
+        # port groups, compared as (virtual switch, VLAN) pairs with the most common pair of their column
+        self.present = self.vswitch >= 0
+        keys = self.vswitch * _VLAN_RANGE + self.vlan
+        reference = _majority(keys, self.present)
+        self.reference_vswitch = numpy.where(reference >= 0, reference // _VLAN_RANGE, -1)
+        self.reference_vlan = numpy.where(reference >= 0, reference % _VLAN_RANGE, -1)
+        self.missing = ~self.present
+        self.mismatched = self.present & (keys != reference)
+
+        # virtual switches, compared by MTU
+        self.vswitch_present = self.mtu >= 0
+        self.reference_mtu = _majority(self.mtu, self.vswitch_present)
+        self.vswitch_missing = ~self.vswitch_present
+        self.mtu_mismatched = self.vswitch_present & (self.mtu != self.reference_mtu)
+
+    def __len__(self):
+        return len(self.host_names)
+
+    @classmethod
+    def load(cls, si, folder=None, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        Read the virtual switches and port groups of every host with one paged property collector pass.
+
+        :param si: service instance object connected to vCenter
+        :param folder: optional cluster, folder or datacenter holding the hosts, the root folder otherwise
+        :param max_objects: maximum number of objects fetched per property collector page
+        :return: the NetworkAudit
+        """
+        host_props = sorted(retrieve_properties(si, [vim.HostSystem], NETWORK_AUDIT_PROPERTIES, folder=folder,
+                                                max_objects=max_objects), key=lambda props: props.get('name') or '')
+
+        return cls([props.get('name') for props in host_props],
+                   [props.get('config.network.vswitch') for props in host_props],
+                   [props.get('config.network.portgroup') for props in host_props])
+
+    @property
+    def consistent(self):
+        """
+        Whether every host holds the same port groups and virtual switches, on the same VLANs and MTUs.
+        """
+        return not (self.missing.any() or self.mismatched.any() or self.vswitch_missing.any() or
+                    self.mtu_mismatched.any())
+
+    def inconsistent_hosts(self):
+        """
+        Return the names of the hosts with at least one finding.
+
+        :return: list of host names
+        """
+        rows = numpy.nonzero(self.missing.any(axis=1) | self.mismatched.any(axis=1) |
+                             self.vswitch_missing.any(axis=1) | self.mtu_mismatched.any(axis=1))[0]
+
+        return [self.host_names[row] for row in rows]
+
+    def findings(self):
+        """
+        List every missing or mismatched port group and virtual switch, host by host.
+
+        :return: list of (host name, item, issue, expected, actual) tuples, the item being 'port group <name>'
+                 or 'vSwitch <name>'
+        """
+        findings = []
+        for row, column in zip(*numpy.nonzero(self.vswitch_missing | self.mtu_mismatched)):
+            name = self.vswitch_names[column]
+            expected = f"MTU {self.reference_mtu[column]}"
+            if self.vswitch_missing[row, column]:
+                findings.append((row, self.host_names[row], f"vSwitch {name}", 'missing', expected, '-'))
+            else:
+                findings.append((row, self.host_names[row], f"vSwitch {name}", 'mismatched', expected,
+                                 f"MTU {self.mtu[row, column]}"))
+
+        for row, column in zip(*numpy.nonzero(self.missing | self.mismatched)):
+            name = self.portgroup_names[column]
+            expected = self._describe(self.reference_vswitch[column], self.reference_vlan[column])
+            if self.missing[row, column]:
+                findings.append((row, self.host_names[row], f"port group {name}", 'missing', expected, '-'))
+            else:
+                findings.append((row, self.host_names[row], f"port group {name}", 'mismatched', expected,
+                                 self._describe(self.vswitch[row, column], self.vlan[row, column])))
+
+        # host by host, in the order of the hosts
+        findings.sort(key=lambda finding: (finding[0], finding[2]))
+
+        return [finding[1:] for finding in findings]
+
+    def _describe(self, vswitch_code, vlan_id):
+        return f"{self.vswitch_names[vswitch_code]} VLAN {vlan_id}"
@@ -1,4 +1,8 @@
 import re
+from pyVmomi import vim
+from .inventory_cache import get_cache
+from .name_index import match_filters
+from .property_helper import DEFAULT_MAX_OBJECTS, iter_properties, retrieve_object_properties
 
 
 class ManagedObjectNotFoundError(Exception):
@@ -8,74 +12,162 @@ class ManagedObjectNotFoundError(Exception):
     pass
 
 
-def get_all_obj(si, vim_type, folder=None, recurse=True):
+def type_name(vim_type):
     """
-    Retrieves all managed objects of a specified type from vSphere.
+    Format a list of managed object types for messages, e.g. '[vim.VirtualMachine]'.
+
+    :param vim_type: list of managed object types
+    :return: the formatted type names
+    """
+    return '[' + ', '.join(obj_type.__name__ for obj_type in vim_type) + ']'
+
+
+def get_index(si, vim_type, path_set=()):
+    """
+    Return the name index of the running inventory cache if it can answer a lookup.
+
+    :param si: service instance object connected to vCenter
+    :param vim_type: list of managed object types looked up
+    :param path_set: property paths the lookup needs
+    :return: the NameIndex of the inventory cache, or None
+    """
+    cache = get_cache(si)
+    if cache is not None and cache.index.covers(vim_type, path_set):
+        return cache.index
+
+    return None
+
+
+def _find_by_path(si, vim_type, path, filters=None):
+    """
+    Resolve an inventory path (e.g. 'dc1/vm/prod/web01') with one SearchIndex call.
+    """
+    obj = si.RetrieveContent().searchIndex.FindByInventoryPath(path.strip('/'))
+    if obj is None or not isinstance(obj, tuple(vim_type)):
+        return None
+
+    if filters:
+        props = retrieve_object_properties(si, [obj], type(obj), list(filters))
+        if not props or not match_filters(props[0], filters):
+            return None
+
+    return obj
+
+
+def find_obj(si, vim_type, obj_names, folder=None, recurse=True, filters=None, first=False,
+             max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Finds managed objects by name or by inventory path.
+
+    Names containing '/' are treated as inventory paths such as 'dc1/vm/prod/web01', which tells
+    apart objects sharing a name in different datacenters or folders. Lookups are answered from the
+    name index of the inventory cache when one is running; otherwise plain names are resolved with one
+    paged property retrieval and paths with SearchIndex.FindByInventoryPath.
 
     :param si: service instance object connected to vCenter
     :param vim_type: the type of managed object to retrieve
-    :param folder: the folder to start the search from
+    :param obj_names: list of object names or inventory paths
+    :param folder: the folder to start the search from; ignored for inventory paths
     :param recurse: whether to search recursively
-    :return: a list of managed objects of the specified type
+    :param filters: optional dictionary of property paths and the values they must have
+                    (e.g. {'summary.config.template': False})
+    :param first: stop at the first matching object
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: a list of matching managed objects
     """
-    content = si.RetrieveContent()
+    names = set(name for name in obj_names if '/' not in name)
+    paths = [name for name in obj_names if '/' in name]
+    filters = filters or {}
+
+    index = get_index(si, vim_type, list(filters))
+    if index is not None:
+        objs = []
+        if names:
+            objs.extend(index.find(vim_type, names=names, folder=folder, recurse=recurse, filters=filters))
+        for path in paths:
+            objs.extend(index.find(vim_type, path=path, filters=filters))
+        return objs[:1] if first else objs
+
+    objs = []
+    for path in paths:
+        obj = _find_by_path(si, vim_type, path, filters)
+        if obj is not None:
+            objs.append(obj)
+            if first:
+                return objs
+
+    if not names:
+        return objs
+
+    # fetch the names of all objects in a few paged calls instead of one call per object
+    pages = iter_properties(si, vim_type, ['name'] + list(filters), folder=folder, recurse=recurse,
+                            max_objects=max_objects)
+    try:
+        for page in pages:
+            for props in page:
+                if props.get('name') in names and match_filters(props, filters):
+                    objs.append(props['obj'])
+                    if first:
+                        return objs
+    finally:
+        # stop paging as soon as the object is found
+        pages.close()
 
-    # the root folder if no folder is specified
-    if not folder:
-        folder = content.rootFolder
+    return objs
 
-    # create a container view to retrieve objects of the specified type
-    container_view = content.viewManager.CreateContainerView(folder, vim_type, recurse)
-    objs = list(container_view.view)
 
-    # destroy the container view after use
-    container_view.Destroy()
+def get_all_obj(si, vim_type, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieves all managed objects of a specified type from vSphere.
+
+    :param si: service instance object connected to vCenter
+    :param vim_type: the type of managed object to retrieve
+    :param folder: the folder to start the search from
+    :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: a list of managed objects of the specified type
+    """
+    index = get_index(si, vim_type)
+    if index is not None:
+        objs = index.find(vim_type, folder=folder, recurse=recurse)
+    else:
+        objs = []
+        # no property is needed, the property collector only reports the object references
+        for page in iter_properties(si, vim_type, [], folder=folder, recurse=recurse, max_objects=max_objects):
+            objs.extend(props['obj'] for props in page)
 
     # Raise an exception if no objects are found
     if not objs:
         raise ManagedObjectNotFoundError(
-            f"No managed objects of type '{vim_type}' found."
+            f"No managed objects of type '{type_name(vim_type)}' found."
         )
 
     return objs
 
 
-def get_given_obj(si, vim_type, obj_names, folder=None, recurse=True):
+def get_given_obj(si, vim_type, obj_names, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
     """
     Retrieves specific managed objects by name.
 
     :param si: service instance object connected to vCenter
     :param vim_type: the type of managed object to retrieve
-    :param obj_names: list of object names to retrieve
+    :param obj_names: list of object names or inventory paths to retrieve
     :param folder: the folder to start the search from
     :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects fetched per property collector page
     :return: a list of managed objects matching the specified names
     """
-    content = si.RetrieveContent()
-
-    # the root folder if no folder is specified
-    if not folder:
-        folder = content.rootFolder
-
-    container_view = content.viewManager.CreateContainerView(folder, vim_type, recurse)
-    objs = list(container_view.view)
-
-    matched_objs = []
-    for obj in objs:
-        if obj.name in obj_names:
-            matched_objs.append(obj)
-
-    container_view.Destroy()
+    matched_objs = find_obj(si, vim_type, obj_names, folder=folder, recurse=recurse, max_objects=max_objects)
 
     if not matched_objs:
         raise ManagedObjectNotFoundError(
-            f"Managed objects of type '{vim_type}' with names {', '.join(obj_names)} not found."
+            f"Managed objects of type '{type_name(vim_type)}' with names {', '.join(obj_names)} not found."
         )
 
     return matched_objs
 
 
-def get_matched_obj(si, vim_type, regex, folder=None, recurse=True):
+def get_matched_obj(si, vim_type, regex, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
     """
     Retrieves managed objects whose names match a regex pattern.
 
@@ -84,63 +176,91 @@ def get_matched_obj(si, vim_type, regex, folder=None, recurse=True):
     :param regex: the regex pattern to match object names
     :param folder: the folder to start the search from
     :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects fetched per property collector page
     :return: a list of managed objects matching the regex pattern
     """
-    content = si.RetrieveContent()
-
-    # the root folder if no folder is specified
-    if not folder:
-        folder = content.rootFolder
-
-    container_view = content.viewManager.CreateContainerView(folder, vim_type, recurse)
-    objs = list(container_view.view)
-
-    matched_objs = []
-    for obj in objs:
-        if re.match(regex, obj.name):
-            matched_objs.append(obj)
-
-    container_view.Destroy()
+    index = get_index(si, vim_type)
+    if index is not None:
+        matched_objs = index.find(vim_type, regex=regex, folder=folder, recurse=recurse)
+    else:
+        pattern = re.compile(regex)
+
+        matched_objs = []
+        for page in iter_properties(si, vim_type, ['name'], folder=folder, recurse=recurse,
+                                    max_objects=max_objects):
+            for props in page:
+                if pattern.match(props.get('name', '')):
+                    matched_objs.append(props['obj'])
 
     if not matched_objs:
         raise ManagedObjectNotFoundError(
-            f"No managed objects of type '{vim_type}' matching regex '{regex}' found."
+            f"No managed objects of type '{type_name(vim_type)}' matching regex '{regex}' found."
         )
 
     return matched_objs
 
 
-def get_single_obj(si, vim_type, obj_name, folder=None, recurse=True):
+def get_single_obj(si, vim_type, obj_name, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
     """
     Retrieves a single managed object by name.
 
     :param si: service instance object connected to vCenter
     :param vim_type: the type of managed object to retrieve
-    :param obj_name: name of the object to retrieve
+    :param obj_name: name of the object to retrieve, or its inventory path (e.g. 'dc1/host/cluster1')
     :param folder: the folder to start the search from
     :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects fetched per property collector page
     :return: the managed object matching the specified name
     """
-    content = si.RetrieveContent()
+    objs = find_obj(si, vim_type, [obj_name], folder=folder, recurse=recurse, first=True, max_objects=max_objects)
 
-    # the root folder if no folder is specified
-    if not folder:
-        folder = content.rootFolder
+    if not objs:
+        raise ManagedObjectNotFoundError(
+            f"Managed object of type '{type_name(vim_type)}' with name '{obj_name}' not found."
+        )
 
-    container_view = content.viewManager.CreateContainerView(folder, vim_type, recurse)
-    objs = list(container_view.view)
-    obj = None
+    return objs[0]
 
-    for obj_temp in objs:
-        if obj_temp.name == obj_name:
-            obj = obj_temp
-            break
 
-    container_view.Destroy()
+def get_single_vm(si, vm_name, folder=None, template=False, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieves a single virtual machine, or template, by name.
 
-    if not obj:
+    :param si: service instance object connected to vCenter
+    :param vm_name: name of the virtual machine, or its inventory path (e.g. 'dc1/vm/prod/web01')
+    :param folder: the folder to start the search from
+    :param template: whether to look for a template instead of a virtual machine
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: the virtual machine matching the specified name
+    """
+    objs = find_obj(si, [vim.VirtualMachine], [vm_name], folder=folder, filters={'summary.config.template': template},
+                    first=True, max_objects=max_objects)
+
+    if not objs:
         raise ManagedObjectNotFoundError(
-            f"Managed object of type '{vim_type}' with name '{obj_name}' not found."
+            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
         )
 
-    return obj
+    return objs[0]
+
+
+def get_obj_property(si, objs, vim_type, path, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieves one property of many managed objects at once.
+
+    :param si: service instance object connected to vCenter
+    :param objs: list of managed objects
+    :param vim_type: the managed object type shared by the objects
+    :param path: the property path to retrieve (e.g. 'runtime.powerState')
+    :param max_objects: maximum number of objects fetched per property collector page
+    :return: a dictionary mapping each managed object to the property value
+    """
+    index = get_index(si, [vim_type], [path])
+    if index is not None:
+        return {obj: index.get_property(obj, path) for obj in objs}
+
+    values = {obj: None for obj in objs}
+    for props in retrieve_object_properties(si, objs, vim_type, [path], max_objects=max_objects):
+        values[props['obj']] = props.get(path)
+
+    return values
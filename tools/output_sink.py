@@ -0,0 +1,306 @@
+import csv
+import datetime
+import json
+import sys
+from prettytable import PrettyTable
+
+# rows buffered by an Arrow sink before they are written as one record batch
+DEFAULT_BATCH_SIZE = 10000
+
+
+def _plain(value):
+    """
+    Convert a cell value into a value every output format can represent.
+
+    :param value: the cell value, e.g. a number, a string, an enum or a managed object
+    :return: the value itself for None, booleans, numbers and strings, otherwise its string form
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    return str(value)
+
+
+class OutputSink:
+    """
+    Destination of the rows produced by the show and info commands.
+
+    A command starts a section with its column names, writes its rows one by one and closes the sink
+    when it is done. Commands displaying several tables start one section per table. Every sink is also
+    a context manager that closes itself.
+
+    Usage::
+
+        with get_sink('jsonl') as sink:
+            sink.begin(['Name', 'Power State'])
+            for row in rows:
+                sink.write(row)
+    """
+
+    def __init__(self, stream=None, close_stream=False):
+        """
+        :param stream: text stream to write to, defaults to the standard output
+        :param close_stream: whether closing the sink also closes the stream
+        """
+        self.stream = stream
+        self.close_stream = close_stream
+        self.field_names = None
+        self.title = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def begin(self, field_names, title=None):
+        """
+        Start a new section of rows.
+
+        :param field_names: list of column names of the section
+        :param title: optional heading of the section, only displayed by human readable sinks
+        :return: none
+        """
+        self.end()
+        self.field_names = list(field_names)
+        self.title = title
+        self.count = 0
+
+    def write(self, row):
+        """
+        Write one row of the current section.
+
+        :param row: list of values, in the order of the column names
+        :return: none
+        """
+        self.count += 1
+
+    def write_rows(self, rows):
+        """
+        Write several rows of the current section.
+
+        :param rows: iterable of rows
+        :return: none
+        """
+        for row in rows:
+            self.write(row)
+
+    def end(self):
+        """
+        Finish the current section, a no-op if no section is open.
+
+        :return: none
+        """
+        self.field_names = None
+
+    def close(self):
+        """
+        Finish the current section and flush the output.
+
+        :return: none
+        """
+        self.end()
+        stream = self.stream or sys.stdout
+        if self.close_stream and not stream.closed:
+            stream.close()
+        elif not stream.closed:
+            stream.flush()
+
+
+class TableSink(OutputSink):
+    """
+    Human readable sink printing every section as a PrettyTable.
+
+    The title of a section is printed above its table; a '{count}' placeholder in the title is replaced
+    with the number of rows. Rows are buffered until the section ends, or printed every page_size rows.
+    """
+
+    def __init__(self, stream=None, close_stream=False, page_size=None):
+        """
+        :param stream: text stream to print to, defaults to the standard output
+        :param close_stream: whether closing the sink also closes the stream
+        :param page_size: optional number of rows after which the rows buffered so far are printed
+        """
+        super().__init__(stream, close_stream)
+        self.page_size = page_size
+        self._rows = []
+
+    def write(self, row):
+        super().write(row)
+        self._rows.append(row)
+        if self.page_size and len(self._rows) >= self.page_size:
+            self._print()
+
+    def end(self):
+        if self.field_names is not None and (self._rows or not self.page_size or not self.count):
+            self._print()
+        super().end()
+
+    def _print(self):
+        stream = self.stream or sys.stdout
+
+        table = PrettyTable()
+        table.field_names = self.field_names
+        for row in self._rows:
+            table.add_row(row)
+        self._rows = []
+
+        if self.title:
+            print(self.title.replace('{count}', str(self.count)), file=stream)
+        print(table, file=stream)
+
+
+class JsonLinesSink(OutputSink):
+    """
+    Streaming sink writing every row as one JSON object per line, keyed by the column names.
+    """
+
+    def write(self, row):
+        super().write(row)
+        record = {name: _plain(value) for name, value in zip(self.field_names, row)}
+        (self.stream or sys.stdout).write(json.dumps(record) + '\n')
+
+
+class CsvSink(OutputSink):
+    """
+    Streaming sink writing rows as CSV, with a header line at the start of every section.
+    """
+
+    def __init__(self, stream=None, close_stream=False):
+        """
+        :param stream: text stream to write to, defaults to the standard output
+        :param close_stream: whether closing the sink also closes the stream
+        """
+        super().__init__(stream, close_stream)
+        self._writer = None
+        self._sections = 0
+
+    def begin(self, field_names, title=None):
+        super().begin(field_names, title)
+        stream = self.stream or sys.stdout
+        if self._writer is None:
+            self._writer = csv.writer(stream)
+        if self._sections:
+            # separate the sections of a command displaying several tables
+            stream.write('\n')
+        self._sections += 1
+        self._writer.writerow(self.field_names)
+
+    def write(self, row):
+        super().write(row)
+        self._writer.writerow([_plain(value) for value in row])
+
+
+class ArrowSink(OutputSink):
+    """
+    Batch sink writing rows to an Arrow IPC file, or to a Parquet file if the path ends with '.parquet'.
+
+    Rows are converted to record batches of batch_size rows, so memory stays bounded by one batch. The
+    column types are inferred from the first batch. Needs the optional pyarrow package.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param path: path of the Arrow or Parquet file to write
+        :param batch_size: number of rows converted and written at once
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise SystemExit("The Arrow and Parquet output formats need the pyarrow package, "
+                             "install it with 'pip install pyarrow'.")
+
+        super().__init__()
+        self._pyarrow = pyarrow
+        self.path = path
+        self.batch_size = batch_size
+        self._schema = None
+        self._writer = None
+        self._rows = []
+
+    def begin(self, field_names, title=None):
+        if self._schema is not None and list(field_names) != self._schema.names:
+            raise ValueError(f"An Arrow file holds a single table, cannot add columns {list(field_names)} "
+                             f"to the columns {self._schema.names}.")
+        super().begin(field_names, title)
+
+    def write(self, row):
+        super().write(row)
+        self._rows.append([_plain(value) for value in row])
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def end(self):
+        if self._rows:
+            self._flush()
+        super().end()
+
+    def close(self):
+        self.end()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _flush(self):
+        pa = self._pyarrow
+        columns = list(zip(*self._rows))
+        self._rows = []
+
+        if self._schema is None:
+            fields = []
+            for name, values in zip(self.field_names, columns):
+                column_type = pa.array(values).type
+                # a column without any value in the first batch cannot be typed, store it as text
+                if pa.types.is_null(column_type):
+                    column_type = pa.string()
+                fields.append(pa.field(name, column_type))
+            self._schema = pa.schema(fields)
+
+            if self.path.endswith('.parquet'):
+                import pyarrow.parquet
+                self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+
+        batch = pa.record_batch([pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+                                schema=self._schema)
+        if self.path.endswith('.parquet'):
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+
+# output formats accepted by get_sink()
+OUTPUT_FORMATS = ['table', 'jsonl', 'csv', 'arrow', 'parquet']
+
+
+def get_sink(output_format='table', path=None, **options):
+    """
+    Create the sink of an output format.
+
+    :param output_format: one of OUTPUT_FORMATS
+    :param path: file to write to; the standard output is used for table, jsonl and csv if none is given,
+                 arrow and parquet require one
+    :param options: further options of the sink, e.g. page_size for table or batch_size for arrow
+    :return: the OutputSink; a file opened here is closed together with the sink
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Invalid output format: '{output_format}', expected one of {OUTPUT_FORMATS}.")
+
+    if output_format in ('arrow', 'parquet'):
+        if not path:
+            raise ValueError(f"The {output_format} output format needs a file path.")
+        if output_format == 'parquet' and not path.endswith('.parquet'):
+            path += '.parquet'
+        return ArrowSink(path, **options)
+
+    stream = None
+    if path:
+        stream = open(path, 'w', newline='' if output_format == 'csv' else None)
+
+    sink_class = {'table': TableSink, 'jsonl': JsonLinesSink, 'csv': CsvSink}[output_format]
+
+    return sink_class(stream=stream, close_stream=stream is not None, **options)
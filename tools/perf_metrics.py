@@ -0,0 +1,261 @@
+import warnings
+from pyVmomi import vim
+from .obj_helper import ManagedObjectNotFoundError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# metric name -> (performance counter 'group.name.rollup', scale applied to the raw values)
+# cpu.usage and mem.usage come in hundredths of a percent, mem.active in KB; cpu.ready is a summation
+# in milliseconds per sample and is turned into a percentage of the sample interval when stored
+METRICS = {
+    'cpu.usage': ('cpu.usage.average', 0.01),
+    'cpu.ready': ('cpu.ready.summation', None),
+    'mem.usage': ('mem.usage.average', 0.01),
+    'mem.active': ('mem.active.average', 1 / 1024),
+    'disk.latency': ('disk.maxTotalLatency.latest', 1),
+}
+
+# units of the stored metric values, for display
+METRIC_UNITS = {'cpu.usage': '%', 'cpu.ready': '%', 'mem.usage': '%', 'mem.active': 'MB', 'disk.latency': 'ms'}
+
+DEFAULT_METRICS = ['cpu.ready', 'cpu.usage', 'mem.usage', 'disk.latency']
+
+# the real-time statistics interval of vCenter, in seconds
+REALTIME_INTERVAL = 20
+
+# samples kept per entity and metric, one hour of real-time samples
+DEFAULT_CAPACITY = 180
+
+# entities queried per QueryPerf call
+DEFAULT_QUERY_BATCH = 250
+
+# statistics accepted by MetricsCollector.stat()
+STATS = ['mean', 'max', 'min', 'last', 'p50', 'p90', 'p95', 'p99']
+
+
+class MetricsCollector:
+    """
+    Real-time performance samples of many entities, kept in NumPy ring buffers.
+
+    The counter ids of the metrics are resolved once from the performance manager. Every collect()
+    sends one QueryPerf call per DEFAULT_QUERY_BATCH entities and only asks for the samples newer than
+    the ones already stored. The samples of each metric live in one matrix with a row per entity used
+    as a ring buffer of the last capacity samples, so averages, percentiles and top-N rankings are
+    computed over the whole fleet at once instead of entity by entity.
+
+    Needs the optional numpy package.
+
+    Usage::
+
+        collector = MetricsCollector(si)
+        collector.collect(vms)
+        for vm, ready in collector.top('cpu.ready', stat='p95', count=10):
+            print(vm, ready)
+    """
+
+    def __init__(self, si, metrics=None, capacity=DEFAULT_CAPACITY, batch_size=DEFAULT_QUERY_BATCH):
+        """
+        :param si: service instance object connected to vCenter
+        :param metrics: names of the metrics to collect, see METRICS, defaults to DEFAULT_METRICS
+        :param capacity: number of samples kept per entity and metric
+        :param batch_size: number of entities queried per QueryPerf call
+        """
+        if numpy is None:
+            raise SystemExit("The performance metrics need the numpy package, install it with 'pip install numpy'.")
+
+        self.metrics = list(metrics or DEFAULT_METRICS)
+        unknown = [metric for metric in self.metrics if metric not in METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(unknown)}, expected one of {list(METRICS)}.")
+
+        self.si = si
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.perf_manager = si.RetrieveContent().perfManager
+
+        # counter id -> metric name, read once
+        self.counter_ids = self._counter_ids()
+        self._metric_ids = [vim.PerformanceManager.MetricId(counterId=counter_id, instance='')
+                            for counter_id in self.counter_ids]
+
+        # entity -> its row in the buffers
+        self.rows = {}
+        self.entities = []
+        # metric name -> (entities x capacity) matrix of samples, NaN where there is none
+        self._values = {metric: numpy.full((0, capacity), numpy.nan) for metric in self.metrics}
+        # per entity: number of samples written so far and timestamp of the last one
+        self._written = numpy.zeros(0, dtype=numpy.int64)
+        self._last_time = []
+
+    def _counter_ids(self):
+        """
+        Map the performance counters of the metrics to their ids on this vCenter.
+
+        :return: a dictionary mapping counter ids to metric names
+        """
+        wanted = {METRICS[metric][0]: metric for metric in self.metrics}
+        counter_ids = {}
+        for counter in self.perf_manager.perfCounter:
+            full_name = f"{counter.groupInfo.key}.{counter.nameInfo.key}.{counter.rollupType}"
+            if full_name in wanted:
+                counter_ids[counter.key] = wanted[full_name]
+
+        missing = sorted(set(wanted.values()) - set(counter_ids.values()))
+        if missing:
+            raise ManagedObjectNotFoundError(f"Performance counters not found: {', '.join(missing)}.")
+
+        return counter_ids
+
+    def _row(self, entity):
+        """
+        Return the buffer row of an entity, growing the buffers when the entity is new.
+        """
+        row = self.rows.get(entity)
+        if row is None:
+            row = len(self.entities)
+            if row == len(self._written):
+                # double the number of rows, so adding entities one by one stays cheap
+                grow = max(row, 16)
+                for metric, values in self._values.items():
+                    self._values[metric] = numpy.vstack([values, numpy.full((grow, self.capacity), numpy.nan)])
+                self._written = numpy.concatenate([self._written, numpy.zeros(grow, dtype=numpy.int64)])
+            self.rows[entity] = row
+            self.entities.append(entity)
+            self._last_time.append(None)
+
+        return row
+
+    def collect(self, entities):
+        """
+        Fetch the samples of entities newer than the ones stored, in batches of batch_size entities per call.
+
+        :param entities: list of virtual machines, hosts or other entities with real-time statistics
+        :return: the number of samples stored
+        """
+        entities = list(entities)
+        stored = 0
+        for start in range(0, len(entities), self.batch_size):
+            specs = []
+            for entity in entities[start:start + self.batch_size]:
+                last_time = self._last_time[self._row(entity)]
+                # the first query fills the buffer, later ones only ask for what is new
+                specs.append(vim.PerformanceManager.QuerySpec(
+                    entity=entity, metricId=self._metric_ids, intervalId=REALTIME_INTERVAL, format='normal',
+                    startTime=last_time, maxSample=None if last_time else self.capacity))
+
+            for entity_metric in self.perf_manager.QueryPerf(querySpec=specs) or []:
+                stored += self._store(entity_metric)
+
+        return stored
+
+    def _store(self, entity_metric):
+        """
+        Write the samples of one vim.PerformanceManager.EntityMetric into the ring buffers.
+
+        :return: the number of samples stored
+        """
+        row = self._row(entity_metric.entity)
+        sample_info = entity_metric.sampleInfo or []
+        last_time = self._last_time[row]
+
+        # skip the samples already stored, the start time of a query is inclusive on some versions
+        keep = numpy.array([last_time is None or info.timestamp > last_time for info in sample_info], dtype=bool)
+        count = int(keep.sum())
+        if not count:
+            return 0
+
+        # positions of the new samples in the ring
+        positions = (self._written[row] + numpy.arange(count)) % self.capacity
+        intervals = numpy.array([info.interval for info in sample_info], dtype=float)[keep]
+        for series in entity_metric.value or []:
+            metric = self.counter_ids.get(series.id.counterId)
+            if metric is None:
+                continue
+            values = numpy.array(series.value, dtype=float)[keep]
+            # -1 marks a sample without data
+            values[values < 0] = numpy.nan
+            scale = METRICS[metric][1]
+            if scale is None:
+                # milliseconds of ready time per interval, as a percentage of the interval
+                values = values / (intervals * 10)
+            else:
+                values = values * scale
+            self._values[metric][row, positions] = values
+
+        self._written[row] += count
+        self._last_time[row] = max(info.timestamp for info in sample_info)
+
+        return count
+
+    def stat(self, metric, stat='mean'):
+        """
+        Compute a statistic of a metric for every entity at once.
+
+        :param metric: name of a collected metric
+        :param stat: one of STATS, 'p95' is the 95th percentile
+        :return: a NumPy array aligned with self.entities, NaN for entities without samples
+        """
+        if metric not in self._values:
+            raise ValueError(f"Metric '{metric}' is not collected, collected metrics are {self.metrics}.")
+        if stat not in STATS:
+            raise ValueError(f"Unknown statistic '{stat}', expected one of {STATS}.")
+
+        values = self._values[metric][:len(self.entities)]
+        if stat == 'last':
+            last = (self._written[:len(self.entities)] - 1) % self.capacity
+            return values[numpy.arange(len(self.entities)), last]
+
+        # entities without samples give NaN, without a warning
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if stat == 'mean':
+                return numpy.nanmean(values, axis=1)
+            if stat == 'max':
+                return numpy.nanmax(values, axis=1)
+            if stat == 'min':
+                return numpy.nanmin(values, axis=1)
+            return numpy.nanpercentile(values, float(stat[1:]), axis=1)
+
+    def top(self, metric, stat='p95', count=10, entities=None):
+        """
+        Rank the entities with the highest value of a statistic.
+
+        :param metric: name of a collected metric
+        :param stat: one of STATS
+        :param count: number of entities returned
+        :param entities: optional list of entities ranked, all collected entities otherwise
+        :return: a list of (entity, value) tuples, highest value first
+        """
+        values = self.stat(metric, stat)
+        if entities is None:
+            rows = numpy.arange(len(self.entities))
+        else:
+            rows = numpy.array([self.rows[entity] for entity in entities if entity in self.rows], dtype=numpy.int64)
+        values = values[rows]
+
+        # highest first, entities without samples last
+        order = numpy.argsort(numpy.where(numpy.isnan(values), numpy.inf, -values), kind='stable')[:count]
+
+        return [(self.entities[rows[index]], float(values[index])) for index in order if not numpy.isnan(values[index])]
+
+    def fleet(self, metric, stat='p95'):
+        """
+        Compute a statistic of a metric over all the samples of all entities.
+
+        :param metric: name of a collected metric
+        :param stat: one of STATS except 'last'
+        :return: the value, NaN if no sample was collected
+        """
+        if stat not in STATS or stat == 'last':
+            raise ValueError(f"Unknown fleet statistic '{stat}', expected one of "
+                             f"{[name for name in STATS if name != 'last']}.")
+
+        values = self._values[metric][:len(self.entities)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if stat.startswith('p'):
+                return float(numpy.nanpercentile(values, float(stat[1:])))
+            return float(getattr(numpy, 'nan' + stat)(values))
@@ -0,0 +1,336 @@
+from pyVmomi import vim
+from .obj_helper import ManagedObjectNotFoundError, find_obj, type_name
+from .name_index import match_filters
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_properties
+
+# properties loaded per type, the name and whatever the clone defaults are derived from
+PLACEMENT_PROPERTIES = {
+    vim.Datacenter: ['name', 'vmFolder'],
+    vim.Folder: ['name', 'parent'],
+    vim.Datastore: ['name'],
+    vim.ClusterComputeResource: ['name', 'resourcePool'],
+    vim.ResourcePool: ['name'],
+    vim.HostSystem: ['name'],
+    vim.VirtualMachine: ['name', 'parent', 'datastore', 'summary.config.template', 'runtime.powerState'],
+}
+
+
+class Placement:
+    """
+    Resolved managed objects of one clone: where the new virtual machine goes and what it is cloned from.
+    """
+
+    def __init__(self, template, datacenter, folder, datastore, cluster, resource_pool, host):
+        self.template = template
+        self.datacenter = datacenter
+        self.folder = folder
+        self.datastore = datastore
+        self.cluster = cluster
+        self.resource_pool = resource_pool
+        self.host = host
+
+    def relocate_spec(self):
+        """
+        Build the relocation specification placing a clone.
+
+        :return: a vim.vm.RelocateSpec
+        """
+        relospec = vim.vm.RelocateSpec()
+        relospec.datastore = self.datastore
+        relospec.pool = self.resource_pool
+        relospec.host = self.host
+
+        return relospec
+
+    def resource_keys(self):
+        """
+        Resources a clone with this placement loads, as used by the TaskScheduler caps.
+
+        :return: a list of resource keys, e.g. ('datastore', 'datastore-12')
+        """
+        keys = []
+        if self.host is not None:
+            keys.append(('host', self.host._moId))
+        if self.datastore is not None:
+            keys.append(('datastore', self.datastore._moId))
+        if self.cluster is not None:
+            keys.append(('cluster', self.cluster._moId))
+
+        return keys
+
+
+class PlacementCache:
+    """
+    Names of the placement objects of clones, loaded with one property collector pass and reused.
+
+    vmachine.clone used to resolve the template, datacenter, folder, datastore, cluster, resource pool and
+    host of every clone with a scan of its own, plus one more scan to check the new name is free. The
+    cache reads the names of every object type it needs in a single paged retrieval, so resolving the
+    placement of hundreds of clones costs one pass over the inventory. Inventory paths (names containing
+    '/') are resolved with SearchIndex and cached as well.
+
+    Usage::
+
+        cache = PlacementCache(si)
+        placements = cache.resolve_all(clone_requests)
+    """
+
+    def __init__(self, si, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        :param si: service instance object connected to vCenter
+        :param max_objects: maximum number of objects fetched per property collector page
+        """
+        self.si = si
+        self.max_objects = max_objects
+        self.loaded = set()
+
+        # type -> name -> list of property dictionaries
+        self._by_name = {}
+        # managed object -> property dictionary
+        self._props = {}
+        # (type, inventory path) -> managed object
+        self._paths = {}
+
+    def load(self, vim_types):
+        """
+        Load the placement properties of every object of the given types not loaded yet, in one pass.
+
+        :param vim_types: list of managed object types
+        :return: none
+        """
+        missing = [obj_type for obj_type in vim_types if obj_type not in self.loaded]
+        if not missing:
+            return
+
+        path_set = {obj_type: PLACEMENT_PROPERTIES[obj_type] for obj_type in missing}
+        for obj_type in missing:
+            self._by_name[obj_type] = {}
+        for props in retrieve_properties(self.si, missing, path_set, max_objects=self.max_objects):
+            obj = props['obj']
+            self._props[obj] = props
+            for obj_type in missing:
+                if isinstance(obj, obj_type):
+                    self._by_name[obj_type].setdefault(props.get('name'), []).append(props)
+
+        self.loaded.update(missing)
+
+    def add(self, obj, props):
+        """
+        Record an object created after the cache was loaded, e.g. a clone that just finished.
+
+        :param obj: the new managed object
+        :param props: its placement properties
+        :return: none
+        """
+        props = dict(props, obj=obj)
+        self._props[obj] = props
+        for obj_type, by_name in self._by_name.items():
+            if isinstance(obj, obj_type):
+                by_name.setdefault(props.get('name'), []).append(props)
+
+    def get(self, vim_type, name, filters=None):
+        """
+        Resolve a name, or an inventory path, to a managed object.
+
+        :param vim_type: the managed object type
+        :param name: the object name or inventory path
+        :param filters: optional dictionary of property paths and the values they must have
+        :return: the first matching managed object
+        """
+        if '/' in name:
+            key = (vim_type, name)
+            if key not in self._paths:
+                objs = find_obj(self.si, [vim_type], [name], filters=filters, first=True)
+                self._paths[key] = objs[0] if objs else None
+            obj = self._paths[key]
+        else:
+            self.load([vim_type])
+            obj = None
+            for props in self._by_name[vim_type].get(name, []):
+                if match_filters(props, filters):
+                    obj = props['obj']
+                    break
+
+        if obj is None:
+            raise ManagedObjectNotFoundError(
+                f"Managed object of type '{type_name([vim_type])}' with name '{name}' not found."
+            )
+
+        return obj
+
+    def first(self, vim_type):
+        """
+        Return the first object of a type, as the defaults of vmachine.clone do.
+
+        :param vim_type: the managed object type
+        :return: the managed object, or None if there is none
+        """
+        self.load([vim_type])
+        for props_list in self._by_name[vim_type].values():
+            return props_list[0]['obj']
+
+        return None
+
+    def property(self, obj, path):
+        """
+        Return a loaded property of a cached object, reading it from vCenter if it was not loaded.
+
+        :param obj: the managed object
+        :param path: the property path
+        :return: the property value
+        """
+        props = self._props.get(obj)
+        if props is not None and path in PLACEMENT_PROPERTIES.get(type(obj), ()):
+            return props.get(path)
+
+        value = obj
+        for part in path.split('.'):
+            value = getattr(value, part)
+
+        return value
+
+    def name_exists(self, vm_name, folder):
+        """
+        Check whether a virtual machine or template of this name exists in a folder or its sub folders.
+
+        :param vm_name: the virtual machine name
+        :param folder: the folder searched
+        :return: True if the name is taken
+        """
+        self.load([vim.VirtualMachine, vim.Folder])
+        for props in self._by_name[vim.VirtualMachine].get(vm_name, []):
+            parent = props.get('parent')
+            while parent is not None:
+                if parent == folder:
+                    return True
+                parent = self._props.get(parent, {}).get('parent')
+
+        return False
+
+    def source(self, clone_request):
+        """
+        Resolve the template, or the running parent of an instant clone, a clone is made from.
+
+        :param clone_request: clone request dictionary, see resolve()
+        :return: the template or virtual machine
+        """
+        if clone_request.get('mode') == 'instant':
+            # instant clones fork the memory of a running virtual machine, not a template
+            template = self.get(vim.VirtualMachine, clone_request['template_name'],
+                                filters={'summary.config.template': False})
+            if self.property(template, 'runtime.powerState') != 'poweredOn':
+                raise ValueError(f"Instant clones need a running parent, virtual machine "
+                                 f"'{clone_request['template_name']}' is not powered on.")
+        else:
+            template = self.get(vim.VirtualMachine, clone_request['template_name'],
+                                filters={'summary.config.template': True})
+
+        return template
+
+    def resolve(self, clone_request, engine=None):
+        """
+        Resolve the placement of one clone, with the same defaults as vmachine.clone.
+
+        :param clone_request: dictionary with the vmachine.clone arguments: vm_name, template_name and the
+                              optional mode, datacenter_name, folder_name, datastore_name, cluster_name,
+                              resource_pool_name and esxi_name
+        :param engine: optional PlacementEngine choosing the host and the datastore when they are not given,
+                       otherwise the first host and the first datastore of the template are used
+        :return: the Placement of the clone
+        """
+        template = self.source(clone_request)
+
+        # the datacenter, the first one if none is given
+        if clone_request.get('datacenter_name'):
+            datacenter = self.get(vim.Datacenter, clone_request['datacenter_name'])
+        else:
+            datacenter = self.first(vim.Datacenter)
+            if datacenter is None:
+                raise ManagedObjectNotFoundError("No managed objects of type '[vim.Datacenter]' found.")
+
+        # the folder, the virtual machine folder of the datacenter if none is given
+        if clone_request.get('folder_name'):
+            folder = self.get(vim.Folder, clone_request['folder_name'])
+        else:
+            folder = self.property(datacenter, 'vmFolder')
+
+        datastore = None
+        if clone_request.get('datastore_name'):
+            datastore = self.get(vim.Datastore, clone_request['datastore_name'])
+
+        cluster = None
+        if clone_request.get('cluster_name'):
+            cluster = self.get(vim.ClusterComputeResource, clone_request['cluster_name'])
+
+        resource_pool = None
+        if clone_request.get('resource_pool_name'):
+            resource_pool = self.get(vim.ResourcePool, clone_request['resource_pool_name'])
+
+        host = None
+        if clone_request.get('esxi_name'):
+            host = self.get(vim.HostSystem, clone_request['esxi_name'])
+
+        if engine is not None:
+            # let the engine spread the clones over the least loaded hosts and datastores, and book the
+            # clones placed by hand as well
+            host, datastore = engine.place(template, clone_request.get('mode') or 'full', datacenter=datacenter,
+                                           cluster=cluster, host=host, datastore=datastore)
+            if cluster is None and isinstance(engine.compute_resource(host), vim.ClusterComputeResource):
+                cluster = engine.compute_resource(host)
+            if resource_pool is None:
+                resource_pool = engine.resource_pool(host)
+
+        # without an engine: the first datastore of the template, the first cluster and its root resource
+        # pool and the first ESXi host
+        if datastore is None:
+            datastore = self.property(template, 'datastore')[0]
+        if cluster is None and engine is None:
+            cluster = self.first(vim.ClusterComputeResource)
+        if resource_pool is None:
+            if cluster is not None:
+                resource_pool = self.property(cluster, 'resourcePool')
+            else:
+                resource_pool = self.first(vim.ResourcePool)
+        if host is None:
+            host = self.first(vim.HostSystem)
+            if host is None:
+                raise ManagedObjectNotFoundError("No managed objects of type '[vim.HostSystem]' found.")
+
+        return Placement(template, datacenter, folder, datastore, cluster, resource_pool, host)
+
+    def resolve_all(self, clone_requests, engine=None):
+        """
+        Resolve the placement of many clones, loading every needed object type in a single pass.
+
+        :param clone_requests: list of clone request dictionaries, see resolve()
+        :param engine: optional PlacementEngine, see resolve()
+        :return: a list of Placements, in the order of the requests
+        """
+        clone_requests = list(clone_requests)
+
+        vim_types = {vim.VirtualMachine, vim.Datacenter, vim.ClusterComputeResource, vim.HostSystem, vim.Folder}
+        for clone_request in clone_requests:
+            if clone_request.get('datastore_name'):
+                vim_types.add(vim.Datastore)
+            if clone_request.get('resource_pool_name'):
+                vim_types.add(vim.ResourcePool)
+        self.load(list(vim_types))
+
+        if engine is not None:
+            # read the size of all templates with one call
+            engine.load_demands([self.source(clone_request) for clone_request in clone_requests])
+
+        placements = []
+        names = set()
+        for clone_request in clone_requests:
+            vm_name = clone_request['vm_name']
+            placement = self.resolve(clone_request, engine=engine)
+
+            # check if the VM name already exists, in the inventory or earlier in the same batch
+            if (vm_name, placement.folder) in names or self.name_exists(vm_name, placement.folder):
+                raise ValueError(f"Managed Object of type '[vim.VirtualMachine]' with name {vm_name} has existed.")
+            names.add((vm_name, placement.folder))
+
+            placements.append(placement)
+
+        return placements
@@ -0,0 +1,305 @@
+import threading
+from pyVmomi import vim
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_object_properties, retrieve_properties
+
+# share of the CPU, memory and datastore capacity kept free, hosts and datastores fuller than that are skipped
+DEFAULT_HEADROOM = 0.2
+
+# share of its vCPUs a new virtual machine is expected to keep busy
+CPU_DEMAND_RATIO = 0.25
+
+# properties of the placement candidates, retrieved together in one pass
+CAPACITY_PROPERTIES = {
+    vim.HostSystem: ['name', 'parent', 'datastore', 'vm', 'runtime.connectionState', 'runtime.inMaintenanceMode',
+                     'summary.hardware.cpuMhz', 'summary.hardware.numCpuCores', 'summary.hardware.memorySize',
+                     'summary.quickStats.overallCpuUsage', 'summary.quickStats.overallMemoryUsage'],
+    vim.Datastore: ['name', 'summary.accessible', 'summary.maintenanceMode', 'summary.capacity',
+                    'summary.freeSpace'],
+    vim.ComputeResource: ['name', 'resourcePool'],
+}
+
+# properties of the templates giving the resources a clone needs and where the disks it shares are
+DEMAND_PROPERTIES = ['summary.config.numCpu', 'summary.config.memorySizeMB', 'summary.storage.committed',
+                     'summary.storage.uncommitted', 'datastore', 'runtime.host']
+
+
+class PlacementError(Exception):
+    """
+    Raised when no host or datastore has enough capacity left for a virtual machine.
+    """
+    pass
+
+
+class HostLoad:
+    """
+    CPU and memory of an ESXi host, including the virtual machines placed on it by the engine so far.
+    """
+
+    def __init__(self, props):
+        """
+        :param props: property dictionary of the host, see CAPACITY_PROPERTIES
+        """
+        self.host = props['obj']
+        self.name = props.get('name')
+        self.compute_resource = props.get('parent')
+        self.datastores = list(props.get('datastore') or [])
+        self.available = (props.get('runtime.connectionState') == 'connected' and
+                          not props.get('runtime.inMaintenanceMode'))
+
+        self.cpu_mhz = props.get('summary.hardware.cpuMhz') or 0
+        self.cpu_capacity = self.cpu_mhz * (props.get('summary.hardware.numCpuCores') or 0)
+        self.memory_capacity = (props.get('summary.hardware.memorySize') or 0) // 1024 ** 2
+        self.cpu_used = props.get('summary.quickStats.overallCpuUsage') or 0
+        self.memory_used = props.get('summary.quickStats.overallMemoryUsage') or 0
+        self.vm_count = len(props.get('vm') or [])
+
+    def usage(self, num_cpu=0, memory_mb=0):
+        """
+        Return the CPU and memory usage ratios of the host, with an additional virtual machine if given.
+
+        :param num_cpu: number of vCPUs of the additional virtual machine
+        :param memory_mb: memory of the additional virtual machine in MB
+        :return: a tuple of the CPU and memory usage ratios
+        """
+        if not self.cpu_capacity or not self.memory_capacity:
+            return 1.0, 1.0
+
+        cpu = (self.cpu_used + num_cpu * self.cpu_mhz * CPU_DEMAND_RATIO) / self.cpu_capacity
+        memory = (self.memory_used + memory_mb) / self.memory_capacity
+
+        return cpu, memory
+
+
+class DatastoreLoad:
+    """
+    Free space of a datastore, minus the disks placed on it by the engine so far.
+    """
+
+    def __init__(self, props):
+        """
+        :param props: property dictionary of the datastore, see CAPACITY_PROPERTIES
+        """
+        self.datastore = props['obj']
+        self.name = props.get('name')
+        self.available = (props.get('summary.accessible') is not False and
+                          props.get('summary.maintenanceMode') in (None, 'normal'))
+        self.capacity = props.get('summary.capacity') or 0
+        self.free_space = props.get('summary.freeSpace') or 0
+
+    def free_ratio(self, disk_bytes=0):
+        """
+        Return the share of the datastore left free, after an additional disk if given.
+
+        :param disk_bytes: size of the additional disk in bytes
+        :return: the free space ratio
+        """
+        if not self.capacity:
+            return 0.0
+
+        return (self.free_space - disk_bytes) / self.capacity
+
+
+class PlacementEngine:
+    """
+    Picks the ESXi host and the datastore of new virtual machines from their current load.
+
+    The CPU and memory usage of every host, the free space of every datastore and the virtual machine
+    counts are read with one property collector pass per datacenter. Clones go to the least loaded
+    host, the one whose busier resource, CPU or memory, stays lowest with the clone added, and to the
+    emptiest datastore mounted on it; hosts and datastores that would drop below the headroom are
+    skipped. Every decision is booked against the loaded figures right away, so the clones of one batch
+    spread over the hosts and datastores instead of all picking the same emptiest one. Linked and instant
+    clones only go to hosts mounting the datastores of their source, whose disks they read, and instant
+    clones stay on the host or cluster of their running parent.
+
+    Usage::
+
+        engine = PlacementEngine(si, headroom=0.1)
+        host, datastore = engine.place(template, datacenter=datacenter)
+    """
+
+    def __init__(self, si, headroom=DEFAULT_HEADROOM, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        :param si: service instance object connected to vCenter
+        :param headroom: share of the host CPU and memory and of the datastore capacity kept free
+        :param max_objects: maximum number of objects fetched per property collector page
+        """
+        self.si = si
+        self.headroom = headroom
+        self.max_objects = max_objects
+
+        # datacenter moId (None for the whole inventory) -> list of HostLoad
+        self._hosts = {}
+        # host -> HostLoad, shared by the datacenters loaded so bookings count everywhere
+        self._host_loads = {}
+        # datastore -> DatastoreLoad
+        self._datastores = {}
+        # compute resource -> its root resource pool
+        self._resource_pools = {}
+        # template -> (number of vCPUs, memory in MB, provisioned disk bytes)
+        self._demands = {}
+        # template -> (datastores holding its disks, host it is registered on)
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def load(self, datacenter=None):
+        """
+        Load the capacity of the hosts and datastores of a datacenter, unless it is loaded already.
+
+        :param datacenter: the datacenter, the whole inventory is loaded if none is given
+        :return: the list of HostLoad of the datacenter
+        """
+        key = datacenter._moId if datacenter is not None else None
+        if key not in self._hosts:
+            hosts = []
+            for props in retrieve_properties(self.si, list(CAPACITY_PROPERTIES), CAPACITY_PROPERTIES,
+                                             folder=datacenter, max_objects=self.max_objects):
+                obj = props['obj']
+                if isinstance(obj, vim.HostSystem):
+                    hosts.append(self._host_loads.setdefault(obj, HostLoad(props)))
+                elif isinstance(obj, vim.Datastore):
+                    self._datastores.setdefault(obj, DatastoreLoad(props))
+                else:
+                    self._resource_pools[obj] = props.get('resourcePool')
+            self._hosts[key] = hosts
+
+        return self._hosts[key]
+
+    def load_demands(self, templates):
+        """
+        Read the size of templates not read yet, all with one property collector call.
+
+        :param templates: list of templates or virtual machines clones are made from
+        :return: none
+        """
+        missing = [template for template in set(templates) if template not in self._demands]
+        for props in retrieve_object_properties(self.si, missing, vim.VirtualMachine, DEMAND_PROPERTIES,
+                                                max_objects=self.max_objects):
+            self._demands[props['obj']] = (props.get('summary.config.numCpu') or 0,
+                                           props.get('summary.config.memorySizeMB') or 0,
+                                           (props.get('summary.storage.committed') or 0) +
+                                           (props.get('summary.storage.uncommitted') or 0))
+            self._sources[props['obj']] = (list(props.get('datastore') or []), props.get('runtime.host'))
+
+    def demand(self, template, mode='full'):
+        """
+        Return the resources a clone of a template takes.
+
+        :param template: the template or virtual machine the clone is made from
+        :param mode: the clone mode, linked and instant clones share the disks of their source
+        :return: a tuple of the number of vCPUs, the memory in MB and the datastore space in bytes
+        """
+        self.load_demands([template])
+        num_cpu, memory_mb, disk_bytes = self._demands[template]
+
+        # every clone gets a swap file as large as its memory; only full clones copy the disks
+        swap_bytes = memory_mb * 1024 ** 2
+        if mode != 'full':
+            disk_bytes = 0
+
+        return num_cpu, memory_mb, disk_bytes + swap_bytes
+
+    def compute_resource(self, host):
+        """
+        Return the cluster, or standalone compute resource, of a placed host.
+
+        :param host: an ESXi host returned by place()
+        :return: the compute resource, or None if the host was not loaded
+        """
+        host_load = self._host_loads.get(host)
+
+        return host_load.compute_resource if host_load is not None else None
+
+    def resource_pool(self, host):
+        """
+        Return the root resource pool of the cluster, or standalone compute resource, of a placed host.
+
+        :param host: an ESXi host returned by place()
+        :return: the resource pool, or None if the host was not loaded
+        """
+        return self._resource_pools.get(self.compute_resource(host))
+
+    def place(self, template, mode='full', datacenter=None, cluster=None, host=None, datastore=None):
+        """
+        Choose the host and the datastore of a clone and book its resources on them.
+
+        :param template: the template or virtual machine the clone is made from
+        :param mode: the clone mode, see demand()
+        :param datacenter: optional datacenter the clone is placed in
+        :param cluster: optional cluster the host is chosen from
+        :param host: optional host given by the caller, only the datastore is chosen then
+        :param datastore: optional datastore given by the caller, only the host is chosen then
+        :return: a tuple of the host and the datastore
+        """
+        num_cpu, memory_mb, disk_bytes = self.demand(template, mode)
+
+        with self._lock:
+            hosts = self.load(datacenter)
+            source_datastores, source_host = self._sources[template]
+            source_compute_resource = self.compute_resource(source_host)
+
+            candidates = []
+            for host_load in hosts:
+                if host is not None and host_load.host != host:
+                    continue
+                if host is None and not host_load.available:
+                    continue
+                if cluster is not None and host_load.compute_resource != cluster:
+                    continue
+                if datastore is not None and datastore not in host_load.datastores:
+                    continue
+                # linked and instant clones read the disks of their source, its datastores must be mounted
+                if mode != 'full' and not set(source_datastores) <= set(host_load.datastores):
+                    continue
+                # instant clones share the memory of their running parent, on its host or cluster
+                if mode == 'instant' and host_load.host != source_host and (
+                        source_compute_resource is None or host_load.compute_resource != source_compute_resource):
+                    continue
+
+                cpu, memory = host_load.usage(num_cpu, memory_mb)
+                # a host given by the caller is used whatever its load
+                if host is None and max(cpu, memory) > 1 - self.headroom:
+                    continue
+                candidates.append((max(cpu, memory), host_load.vm_count, host_load.name, host_load))
+
+            # least loaded host first, the one running fewer virtual machines on a tie
+            for _, _, _, host_load in sorted(candidates, key=lambda candidate: candidate[:3]):
+                datastore_load = self._choose_datastore(host_load, datastore, disk_bytes)
+                if datastore_load is None:
+                    continue
+
+                # book the clone, so the next placement of the batch sees it
+                host_load.cpu_used += num_cpu * host_load.cpu_mhz * CPU_DEMAND_RATIO
+                host_load.memory_used += memory_mb
+                host_load.vm_count += 1
+                datastore_load.free_space -= disk_bytes
+
+                return host_load.host, datastore_load.datastore
+
+        raise PlacementError(f"No host and datastore with {self.headroom:.0%} headroom left for a clone of "
+                             f"{num_cpu} vCPUs, {memory_mb} MB memory and {disk_bytes // 1024 ** 3} GB disk.")
+
+    def _choose_datastore(self, host_load, datastore, disk_bytes):
+        """
+        Choose the emptiest datastore of a host with room for a disk.
+
+        :param host_load: the HostLoad of the chosen host
+        :param datastore: optional datastore given by the caller
+        :param disk_bytes: datastore space the clone takes
+        :return: the DatastoreLoad, or None if no datastore of the host has room left
+        """
+        if datastore is not None:
+            # a datastore given by the caller is used whatever its free space
+            return self._datastores.get(datastore) or DatastoreLoad({'obj': datastore})
+
+        best = None
+        for candidate in host_load.datastores:
+            datastore_load = self._datastores.get(candidate)
+            if datastore_load is None or not datastore_load.available:
+                continue
+            if datastore_load.free_ratio(disk_bytes) < self.headroom:
+                continue
+            if best is None or datastore_load.free_ratio(disk_bytes) > best.free_ratio(disk_bytes):
+                best = datastore_load
+
+        return best
@@ -0,0 +1,175 @@
+from pyVmomi import vim
+from pyVmomi import vmodl
+
+# default number of objects returned by the property collector per page
+DEFAULT_MAX_OBJECTS = 1000
+
+
+def build_container_filter_spec(container_view, vim_type, path_set):
+    """
+    Build a filter specification that collects properties of every object in a container view.
+
+    :param container_view: container view whose objects should be collected
+    :param vim_type: list of managed object types to collect properties for
+    :param path_set: list of property paths to collect (e.g. ['name', 'runtime.powerState']),
+                     or a dictionary mapping each type to its own list of property paths
+    :return: a property collector filter specification
+    """
+    # traverse from the container view to the objects it holds
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+        name='traverseView',
+        path='view',
+        skip=False,
+        type=vim.view.ContainerView
+    )
+
+    # start at the view itself, but do not report it in the result
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(
+        obj=container_view,
+        skip=True,
+        selectSet=[traversal_spec]
+    )
+
+    # one property specification per requested type
+    prop_specs = []
+    for obj_type in vim_type:
+        paths = path_set[obj_type] if isinstance(path_set, dict) else path_set
+        prop_specs.append(vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=list(paths), all=False))
+
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+    filter_spec.objectSet = [obj_spec]
+    filter_spec.propSet = prop_specs
+
+    return filter_spec
+
+
+def build_object_filter_spec(objs, vim_type, path_set):
+    """
+    Build a filter specification that collects properties of an explicit list of managed objects.
+
+    :param objs: list of managed objects to collect properties for
+    :param vim_type: managed object type shared by the objects
+    :param path_set: list of property paths to collect
+    :return: a property collector filter specification
+    """
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+    filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objs]
+    filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=list(path_set),
+                                                                      all=False)]
+
+    return filter_spec
+
+
+def object_content_to_dict(object_content):
+    """
+    Convert an ObjectContent returned by the property collector into a dictionary.
+
+    :param object_content: the ObjectContent to convert
+    :return: a dictionary mapping 'obj' and each retrieved property path to its value
+    """
+    props = {'obj': object_content.obj}
+    for prop in object_content.propSet:
+        props[prop.name] = prop.val
+
+    return props
+
+
+def iter_filter_pages(si, filter_spec, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieve the result of a filter specification page by page.
+
+    Uses RetrievePropertiesEx for the first page and ContinueRetrievePropertiesEx for the
+    following ones, so the whole result is fetched in len(result) / max_objects round trips.
+
+    :param si: service instance object connected to vCenter
+    :param filter_spec: the property collector filter specification
+    :param max_objects: maximum number of objects returned per page
+    :return: a generator yielding one list of property dictionaries per page
+    """
+    property_collector = si.content.propertyCollector
+    options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=max_objects)
+
+    result = property_collector.RetrievePropertiesEx([filter_spec], options)
+    token = None
+    try:
+        while result:
+            token = result.token
+            yield [object_content_to_dict(object_content) for object_content in result.objects]
+
+            if not token:
+                break
+            result = property_collector.ContinueRetrievePropertiesEx(token)
+            token = None
+    finally:
+        # release the server-side result set if the caller stopped early
+        if token:
+            property_collector.CancelRetrievePropertiesEx(token)
+
+
+def iter_properties(si, vim_type, path_set, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieve properties of all managed objects of a type below a folder, page by page.
+
+    :param si: service instance object connected to vCenter
+    :param vim_type: list of managed object types to retrieve
+    :param path_set: list of property paths to retrieve for every object
+    :param folder: the folder to start the search from
+    :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects returned per page
+    :return: a generator yielding one list of property dictionaries per page
+    """
+    content = si.RetrieveContent()
+
+    # the root folder if no folder is specified
+    if not folder:
+        folder = content.rootFolder
+
+    container_view = content.viewManager.CreateContainerView(folder, vim_type, recurse)
+    try:
+        filter_spec = build_container_filter_spec(container_view, vim_type, path_set)
+        yield from iter_filter_pages(si, filter_spec, max_objects=max_objects)
+    finally:
+        # destroy the container view after use
+        container_view.Destroy()
+
+
+def retrieve_properties(si, vim_type, path_set, folder=None, recurse=True, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieve properties of all managed objects of a type below a folder.
+
+    :param si: service instance object connected to vCenter
+    :param vim_type: list of managed object types to retrieve
+    :param path_set: list of property paths to retrieve for every object
+    :param folder: the folder to start the search from
+    :param recurse: whether to search recursively
+    :param max_objects: maximum number of objects returned per page
+    :return: a list of property dictionaries, one per managed object
+    """
+    objs = []
+    for page in iter_properties(si, vim_type, path_set, folder=folder, recurse=recurse, max_objects=max_objects):
+        objs.extend(page)
+
+    return objs
+
+
+def retrieve_object_properties(si, objs, vim_type, path_set, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Retrieve properties of an explicit list of managed objects.
+
+    :param si: service instance object connected to vCenter
+    :param objs: list of managed objects to retrieve properties for
+    :param vim_type: managed object type shared by the objects
+    :param path_set: list of property paths to retrieve for every object
+    :param max_objects: maximum number of objects returned per page
+    :return: a list of property dictionaries, one per managed object
+    """
+    if not objs:
+        return []
+
+    filter_spec = build_object_filter_spec(objs, vim_type, path_set)
+
+    props = []
+    for page in iter_filter_pages(si, filter_spec, max_objects=max_objects):
+        props.extend(page)
+
+    return props
@@ -0,0 +1,109 @@
+from collections import Counter
+from pyVmomi import vim
+from .change_set import DISK_PREFIX, ChangeSet
+
+# keys of a desired state document, besides vm_name
+DESIRED_STATE_KEYS = ['cpu_num', 'core_num', 'memory_size', 'disks', 'nics']
+
+
+def _disk_index(disk):
+    """
+    Return the index of a virtual disk, taken from its label 'Hard disk <index>'.
+    """
+    try:
+        return int(disk.deviceInfo.label[len(DISK_PREFIX):])
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def diff_hardware(props, desired, prune=False):
+    """
+    Compute the changes bringing the hardware of a virtual machine to its desired state.
+
+    The desired state document is a dictionary with any of these keys, a missing key is left as it is:
+
+    - cpu_num and core_num: number of CPUs and cores per CPU
+    - memory_size: memory size in GB
+    - disks: list of disks in the order of their labels, each a dictionary with size in GB and the optional
+      mode and provision ('thin' by default, only used for new disks)
+    - nics: list of the port group names the network adapters are connected to
+
+    Disks only grow, a disk larger than desired is an error. Surplus disks and network adapters are only
+    removed when pruning.
+
+    :param props: property dictionary of the virtual machine holding tools.change_set.CHANGE_SET_PROPERTIES
+    :param desired: the desired state document
+    :param prune: whether to remove the disks and network adapters missing from the desired state
+    :return: a tuple of the ChangeSet, empty if the virtual machine matches, and the list of change descriptions
+    """
+    unknown = sorted(set(desired) - set(DESIRED_STATE_KEYS) - {'vm_name'})
+    if unknown:
+        raise ValueError(f"Unknown desired state keys: {', '.join(unknown)}, expected {DESIRED_STATE_KEYS}.")
+
+    vm_name = props.get('name')
+    devices = props.get('config.hardware.device') or []
+    change_set = ChangeSet()
+    changes = []
+
+    # CPU, only the values given are compared
+    num_cpu = props.get('config.hardware.numCPU')
+    num_cores = props.get('config.hardware.numCoresPerSocket')
+    cpu_num = desired.get('cpu_num')
+    core_num = desired.get('core_num')
+    if (cpu_num is not None and cpu_num != num_cpu) or (core_num is not None and core_num != num_cores):
+        change_set.set_cpu(cpu_num, core_num)
+        changes.append(f"CPU {num_cpu}x{num_cores} -> {cpu_num or num_cpu}x{core_num or num_cores}")
+
+    # memory
+    memory_mb = props.get('config.hardware.memoryMB')
+    memory_size = desired.get('memory_size')
+    if memory_size is not None and int(memory_size * 1024) != memory_mb:
+        change_set.set_memory(memory_size)
+        changes.append(f"memory {memory_mb / 1024:g} -> {memory_size:g} GB")
+
+    # disks, matched by their position
+    if desired.get('disks') is not None:
+        disks = sorted((device for device in devices if isinstance(device, vim.vm.device.VirtualDisk)),
+                       key=_disk_index)
+        for position, desired_disk in enumerate(desired['disks']):
+            size = desired_disk['size']
+            mode = desired_disk.get('mode')
+            if position >= len(disks):
+                change_set.add_disk(size, mode or 'persistent', desired_disk.get('provision', 'thin'))
+                changes.append(f"add {size} GB disk")
+                continue
+
+            disk = disks[position]
+            disk_index = _disk_index(disk)
+            current_size = disk.capacityInKB // (1024 ** 2)
+            if size < current_size:
+                raise ValueError(f"Disk {disk_index} of virtual machine '{vm_name}' is {current_size} GB, "
+                                 f"it cannot shrink to {size} GB.")
+            new_size = size if size > current_size else None
+            new_mode = mode if mode and mode != disk.backing.diskMode else None
+            if new_size or new_mode:
+                change_set.edit_disk(disk_index, disk_size=new_size, disk_mode=new_mode)
+                if new_size:
+                    changes.append(f"disk {disk_index} {current_size} -> {new_size} GB")
+                if new_mode:
+                    changes.append(f"disk {disk_index} mode {disk.backing.diskMode} -> {new_mode}")
+
+        if prune:
+            for disk in disks[len(desired['disks']):]:
+                change_set.remove_disk(_disk_index(disk))
+                changes.append(f"remove disk {_disk_index(disk)}")
+
+    # network adapters, compared as a multiset of port group names
+    if desired.get('nics') is not None:
+        current = Counter(device.deviceInfo.summary for device in devices
+                          if isinstance(device, vim.vm.device.VirtualEthernetCard))
+        wanted = Counter(desired['nics'])
+        for portgroup_name in (wanted - current).elements():
+            change_set.add_nic(portgroup_name)
+            changes.append(f"add network adapter on {portgroup_name}")
+        if prune:
+            for portgroup_name in (current - wanted).elements():
+                change_set.remove_nic(portgroup_name)
+                changes.append(f"remove network adapter on {portgroup_name}")
+
+    return change_set, changes
@@ -0,0 +1,71 @@
+import re
+from datetime import datetime, timezone
+
+# removals running at once per datastore, each one merges a delta disk into its parent and is I/O heavy
+DEFAULT_MAX_REMOVALS_PER_DATASTORE = 2
+
+
+class RetentionPolicy:
+    """
+    Rules deciding which snapshots of a virtual machine are kept.
+
+    Only the snapshots whose name matches the name pattern are subject to the policy, the others are
+    never removed nor counted. Of those, a snapshot is removed when it is older than the maximum age or
+    when the virtual machine has more than the maximum count, oldest first. The newest keep_last ones
+    are always kept, whatever their age.
+
+    Usage::
+
+        policy = RetentionPolicy(max_age=timedelta(days=7), keep_last=1, name_regex='^nightly-')
+        plan = policy.plan(SnapshotIndex(si).load(folder=folder))
+    """
+
+    def __init__(self, max_age=None, max_count=None, keep_last=0, name_regex=None):
+        """
+        :param max_age: optional datetime.timedelta, snapshots older than that are removed
+        :param max_count: optional maximum number of snapshots kept per virtual machine
+        :param keep_last: number of newest snapshots per virtual machine always kept
+        :param name_regex: optional regular expression matching the names of the snapshots the policy applies to
+        """
+        if max_age is None and max_count is None:
+            raise ValueError("A retention policy needs a max_age or a max_count.")
+        if (max_count is not None and max_count < 0) or keep_last < 0:
+            raise ValueError("max_count and keep_last cannot be negative.")
+
+        self.max_age = max_age
+        self.max_count = max_count
+        self.keep_last = keep_last
+        self.name_regex = name_regex
+
+    def plan(self, index, now=None):
+        """
+        Evaluate the policy on every virtual machine of a snapshot index.
+
+        :param index: a loaded tools.snapshot_index.SnapshotIndex
+        :param now: reference time of the age rule, defaults to the current time
+        :return: a list of (SnapshotRecord, reason) tuples to remove, oldest first per virtual machine
+        """
+        now = now or datetime.now(timezone.utc)
+
+        # the snapshots subject to the policy, grouped by virtual machine
+        per_vm = {}
+        for record in index:
+            if self.name_regex and not re.search(self.name_regex, record.name or ''):
+                continue
+            per_vm.setdefault(record.vm, []).append(record)
+
+        plan = []
+        for records in per_vm.values():
+            # newest first, so the position is the number of newer snapshots
+            records.sort(key=lambda record: record.create_time, reverse=True)
+            removals = []
+            for position, record in enumerate(records):
+                if position < self.keep_last:
+                    continue
+                if self.max_count is not None and position >= self.max_count:
+                    removals.append((record, f"more than {self.max_count} snapshots"))
+                elif self.max_age is not None and record.age(now) > self.max_age:
+                    removals.append((record, f"older than {self.max_age}"))
+            plan.extend(reversed(removals))
+
+        return plan
@@ -0,0 +1,267 @@
+import itertools
+import queue
+import time
+from collections import Counter, deque
+from concurrent import futures
+from pyVmomi import vim
+from .property_helper import retrieve_object_properties
+from .task_engine import TaskBatchResult, get_engine
+
+# default concurrency caps, None disables a cap
+DEFAULT_MAX_TASKS = 32
+DEFAULT_MAX_PER_HOST = 8
+DEFAULT_MAX_PER_DATASTORE = 8
+DEFAULT_MAX_PER_CLUSTER = 16
+# vCenter runs one task at a time per virtual machine, further tasks fail while one is running
+DEFAULT_MAX_PER_VM = 1
+
+
+class TaskScheduler:
+    """
+    Runs task-producing operations on virtual machines under concurrency caps.
+
+    Operations are started as soon as a slot is free globally and on the ESXi host, the datastores and
+    the cluster of their virtual machine, so large selections neither flood the vCenter task queue nor
+    cause boot storms on a shared datastore. Operations on the same virtual machine run one after the
+    other, as vCenter rejects a task while another one runs on the machine. Virtual machines are pulled
+    lazily from the given iterable, which may be a generator, and their placement is read with one
+    property collector call per chunk; an item given more than once runs once.
+
+    Usage::
+
+        scheduler = TaskScheduler(si, max_tasks=16, max_per_datastore=4)
+        batch = scheduler.run(vms, lambda vm: vm.PowerOn())
+        batch.raise_for_errors()
+    """
+
+    def __init__(self, si, max_tasks=DEFAULT_MAX_TASKS, max_per_host=DEFAULT_MAX_PER_HOST,
+                 max_per_datastore=DEFAULT_MAX_PER_DATASTORE, max_per_cluster=DEFAULT_MAX_PER_CLUSTER,
+                 max_per_vm=DEFAULT_MAX_PER_VM, progress_interval=5):
+        """
+        :param si: service instance object connected to vCenter
+        :param max_tasks: maximum number of tasks running at once
+        :param max_per_host: maximum number of running tasks per ESXi host
+        :param max_per_datastore: maximum number of running tasks per datastore
+        :param max_per_cluster: maximum number of running tasks per cluster
+        :param max_per_vm: maximum number of running tasks per virtual machine
+        :param progress_interval: seconds between two progress reports, None disables the reports
+        """
+        self.si = si
+        self.max_tasks = max_tasks
+        self.limits = {
+            'host': max_per_host,
+            'datastore': max_per_datastore,
+            'cluster': max_per_cluster,
+            'vm': max_per_vm,
+        }
+        # a cap below one would keep the operations queued forever
+        for name, limit in [('tasks', max_tasks)] + [(f"per_{key}", limit) for key, limit in self.limits.items()]:
+            if limit is not None and limit < 1:
+                raise ValueError(f"max_{name} must be at least 1 or None, got {limit}.")
+        self.progress_interval = progress_interval
+
+        # statistics of the last run
+        self.started = 0
+        self.finished = 0
+        self.failed = 0
+        self.running = 0
+        self.queued = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """
+        Finished tasks per second in the last run.
+        """
+        return self.finished / self.elapsed if self.elapsed else 0.0
+
+    def run(self, vms, operation, resource_keys=None, on_done=None):
+        """
+        Run an operation on every virtual machine and wait for the resulting tasks.
+
+        :param vms: iterable of virtual machines, or of any other items the operation accepts
+        :param operation: callable taking a virtual machine and returning the task it started
+        :param resource_keys: optional callable taking a list of items and returning the resource keys of each
+                              item, defaults to the virtual machine itself and its host, datastores and cluster
+        :param on_done: optional callable taking an item and the finished future of its task, called as soon
+                        as the task ends
+        :return: a TaskBatchResult keyed by virtual machine
+        """
+        engine = get_engine(self.si)
+        resource_keys = resource_keys or self._resource_keys
+        pending_vms = iter(vms)
+        exhausted = False
+        chunk_size = self.max_tasks or 100
+
+        order = []
+        seen = set()
+        outcomes = {}
+        waiting = deque()
+        done = queue.Queue()
+        in_use = Counter()
+
+        self.started = self.finished = self.failed = self.running = 0
+        start_time = last_report = time.monotonic()
+
+        while True:
+            # keep enough virtual machines queued to fill every free slot, a chunk of repeated items queues none
+            while not exhausted and len(waiting) < chunk_size:
+                chunk = list(itertools.islice(pending_vms, chunk_size))
+                exhausted = len(chunk) < chunk_size
+                # an item given twice would overwrite the outcome of its first task, it runs once
+                chunk = [vm for vm in dict.fromkeys(chunk) if vm not in seen]
+                seen.update(chunk)
+                for vm, keys in zip(chunk, resource_keys(chunk)):
+                    order.append(vm)
+                    waiting.append((vm, keys))
+                if waiting:
+                    break
+
+            # start every queued operation whose resources have a free slot, in submission order
+            blocked = deque()
+            started = []
+            while waiting and (self.max_tasks is None or self.running < self.max_tasks):
+                vm, keys = waiting.popleft()
+                if not self._has_slot(in_use, keys):
+                    blocked.append((vm, keys))
+                    continue
+
+                in_use.update(keys)
+                self.running += 1
+                self.started += 1
+                started.append((vm, keys, self._start(vm, operation)))
+            blocked.extend(waiting)
+            waiting = blocked
+            self.queued = len(waiting)
+
+            # track the tasks started in this round with a single property filter
+            tasks = [outcome for _, _, outcome in started if not isinstance(outcome, futures.Future)]
+            try:
+                task_futures = iter(engine.submit(tasks))
+            except Exception as error:
+                # the tasks could not be tracked, report them as failed so their slots are released
+                task_futures = iter([self._failed_future(error) for _ in tasks])
+            for vm, keys, outcome in started:
+                future = outcome if isinstance(outcome, futures.Future) else next(task_futures)
+                outcomes[vm] = future
+                future.add_done_callback(lambda _, vm=vm, keys=keys: done.put((vm, keys)))
+
+            if not self.running and not waiting and exhausted:
+                break
+
+            # release the slots of every finished task, then try to start the next operations
+            finished = []
+            if self.running:
+                try:
+                    finished.append(done.get(timeout=self.progress_interval))
+                    while not done.empty():
+                        finished.append(done.get_nowait())
+                except queue.Empty:
+                    pass
+
+            for vm, keys in finished:
+                in_use.subtract(keys)
+                self.running -= 1
+                self.finished += 1
+                if outcomes[vm].exception() is not None:
+                    self.failed += 1
+                if on_done is not None:
+                    on_done(vm, outcomes[vm])
+
+            self.elapsed = time.monotonic() - start_time
+            if self.progress_interval is not None and time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                self._report()
+
+        self.elapsed = time.monotonic() - start_time
+        if self.progress_interval is not None and self.elapsed >= self.progress_interval:
+            self._report()
+
+        return TaskBatchResult(order, [outcomes[vm] for vm in order])
+
+    def _start(self, vm, operation):
+        """
+        Start the operation on a virtual machine.
+
+        :return: the started task, or a failed future if the operation raised
+        """
+        try:
+            return operation(vm)
+        except Exception as error:
+            # the operation failed before a task was created, report it like a failed task
+            return self._failed_future(error)
+
+    @staticmethod
+    def _failed_future(error):
+        future = futures.Future()
+        future.set_exception(error)
+        return future
+
+    def _has_slot(self, in_use, keys):
+        for key in keys:
+            limit = self.limits[key[0]]
+            if limit is not None and in_use[key] >= limit:
+                return False
+
+        return True
+
+    def _resource_keys(self, vms):
+        return vm_resource_keys(self.si, vms)
+
+    def _report(self):
+        print(f"Tasks: {self.finished}/{self.started} finished ({self.failed} failed), {self.running} running, "
+              f"{self.queued} queued, {self.throughput:.1f} tasks/s.")
+
+
+def vm_resource_keys(si, vms):
+    """
+    Read the host, datastores and cluster of virtual machines in two property collector calls.
+
+    :param si: service instance object connected to vCenter
+    :param vms: list of virtual machines
+    :return: a list with the resource keys of each virtual machine, e.g. ('host', 'host-12')
+    """
+    if not vms:
+        return []
+
+    placement = {props['obj']: props
+                 for props in retrieve_object_properties(si, vms, vim.VirtualMachine, ['runtime.host', 'datastore'])}
+
+    hosts = list({props['runtime.host'] for props in placement.values() if props.get('runtime.host')})
+    clusters = {}
+    for props in retrieve_object_properties(si, hosts, vim.HostSystem, ['parent']):
+        if isinstance(props.get('parent'), vim.ClusterComputeResource):
+            clusters[props['obj']] = props['parent']
+
+    keys = []
+    for vm in vms:
+        props = placement.get(vm, {})
+        vm_keys = [('vm', vm._moId)]
+        host = props.get('runtime.host')
+        if host is not None:
+            vm_keys.append(('host', host._moId))
+            if host in clusters:
+                vm_keys.append(('cluster', clusters[host]._moId))
+        for datastore in props.get('datastore') or []:
+            vm_keys.append(('datastore', datastore._moId))
+        keys.append(vm_keys)
+
+    return keys
+
+
+def run_tasks(si, vms, operation, resource_keys=None, on_done=None, **limits):
+    """
+    Run an operation on every virtual machine under the default concurrency caps and wait for all tasks.
+
+    :param si: service instance object connected to vCenter
+    :param vms: iterable of virtual machines
+    :param operation: callable taking a virtual machine and returning the task it started
+    :param resource_keys: optional callable returning the resource keys of a list of items, see TaskScheduler.run
+    :param on_done: optional callable taking an item and its finished future, see TaskScheduler.run
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+    :return: a TaskBatchResult keyed by virtual machine
+    """
+    batch = TaskScheduler(si, **limits).run(vms, operation, resource_keys=resource_keys, on_done=on_done)
+    batch.raise_for_errors()
+
+    return batch
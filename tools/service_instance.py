@@ -1,42 +1,148 @@
 import atexit
+import os
 from pyVim.connect import SmartConnect, Disconnect
+from pyVmomi import vim
 
+# environment variables holding the connection parameters
+ENV_HOST = 'VSPHERE_HOST'
+ENV_USER = 'VSPHERE_USER'
+ENV_PASSWORD = 'VSPHERE_PASSWORD'
+ENV_PORT = 'VSPHERE_PORT'
+ENV_SESSION_FILE = 'VSPHERE_SESSION_FILE'
 
-def connect(disable_ssl_verification=True):
+
+def connection_settings(host=None, user=None, password=None, port=None):
+    """
+    Resolve the connection parameters, falling back to the VSPHERE_* environment variables.
+
+    :param host: vCenter server address, defaults to $VSPHERE_HOST
+    :param user: vCenter username, defaults to $VSPHERE_USER
+    :param password: vCenter password, defaults to $VSPHERE_PASSWORD
+    :param port: vSphere API port, defaults to $VSPHERE_PORT or 443
+    :return: a dictionary with the host, user, password and port
+    """
+    settings = {
+        'host': host or os.environ.get(ENV_HOST),
+        'user': user or os.environ.get(ENV_USER),
+        'password': password or os.environ.get(ENV_PASSWORD),
+        'port': int(port or os.environ.get(ENV_PORT, 443)),
+    }
+
+    if not settings['host']:
+        raise SystemExit(f"No vCenter server given, set the {ENV_HOST} environment variable.")
+
+    return settings
+
+
+def load_session_id(session_file):
+    """
+    Read a persisted session cookie.
+
+    :param session_file: path of the session file
+    :return: the session id, or None if the file does not exist
+    """
+    try:
+        with open(session_file) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_session_id(session_file, session_id):
+    """
+    Persist a session cookie, readable by the current user only.
+
+    :param session_file: path of the session file
+    :param session_id: the session id to store
+    :return: none
+    """
+    fd = os.open(session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as file:
+        file.write(session_id)
+
+
+def login(settings, disable_ssl_verification=True, session_id=None):
+    """
+    Open a service instance, either by logging in or by resuming an existing session.
+
+    :param settings: connection parameters returned by connection_settings()
+    :param disable_ssl_verification: whether to disable SSL certificate verification
+    :param session_id: optional session cookie to resume instead of logging in
+    :return: the service instance, or None if the given session is no longer valid
+    """
+    if session_id:
+        service_instance = SmartConnect(host=settings['host'], port=settings['port'], sessionId=session_id,
+                                        disableSslCertValidation=disable_ssl_verification)
+        # an expired cookie still connects, but the session manager reports no session
+        if service_instance.content.sessionManager.currentSession is None:
+            return None
+        return service_instance
+
+    if not settings['user'] or not settings['password']:
+        raise SystemExit(f"No vCenter credentials given, set the {ENV_USER} and {ENV_PASSWORD} "
+                         f"environment variables.")
+
+    return SmartConnect(host=settings['host'], user=settings['user'], pwd=settings['password'],
+                        port=settings['port'], disableSslCertValidation=disable_ssl_verification)
+
+
+def is_session_active(service_instance):
+    """
+    Check that the session of a service instance is still authenticated; the call also keeps it alive.
+
+    :param service_instance: the service instance to check
+    :return: True if the session is active
+    """
+    try:
+        session_manager = service_instance.content.sessionManager
+        session = session_manager.currentSession
+        if session is None:
+            return False
+        return session_manager.SessionIsActive(session.key, session.userName)
+    except vim.fault.NoPermission:
+        # validating sessions needs the Sessions.ValidateSession privilege, reading currentSession succeeded
+        return True
+    except (vim.fault.NotAuthenticated, IOError):
+        return False
+
+
+def connect(disable_ssl_verification=True, host=None, user=None, password=None, port=None, session_file=None):
     """
     Establishes a connection to the vCenter server using the pyvmomi library.
 
+    The connection parameters default to the VSPHERE_HOST, VSPHERE_USER, VSPHERE_PASSWORD and VSPHERE_PORT
+    environment variables. With a session file (or $VSPHERE_SESSION_FILE) the session cookie is kept on disk
+    and the session is not logged out at exit, so repeated short invocations skip the login round trip.
+
     :param disable_ssl_verification: Whether to disable SSL certificate verification during the connection
+    :param host: vCenter server address
+    :param user: vCenter username
+    :param password: vCenter password
+    :param port: vSphere API port
+    :param session_file: optional path where the session cookie is persisted
     :return: an instance of the vCenter server connection object
     """
-    # Connection parameters
-    host = '192.168.25.132'  # Replace with the vCenter server's IP
-    user = 'administrator@vsphere.local'  # Replace with the vCenter username
-    password = 'BUPTwb407!'  # Replace with the vCenter password
-    port = 443  # Default port for vSphere API
+    settings = connection_settings(host, user, password, port)
+    session_file = session_file or os.environ.get(ENV_SESSION_FILE)
 
     service_instance = None
 
     try:
-        # Attempt to establish the connection
-        if disable_ssl_verification:
-            service_instance = SmartConnect(
-                host=host,
-                user=user,
-                pwd=password,
-                port=port,
-                disableSslCertValidation=True
-            )
-        else:
-            service_instance = SmartConnect(
-                host=host,
-                user=user,
-                pwd=password,
-                port=port
-            )
-
-        # Register atexit handler to ensure proper disconnection
-        atexit.register(Disconnect, service_instance)
+        # resume the persisted session if it is still valid
+        if session_file:
+            session_id = load_session_id(session_file)
+            if session_id:
+                service_instance = login(settings, disable_ssl_verification, session_id=session_id)
+
+        if not service_instance:
+            service_instance = login(settings, disable_ssl_verification)
+
+            if session_file:
+                save_session_id(session_file, service_instance._stub.GetSessionId())
+
+        # Register atexit handler to ensure proper disconnection, a persisted session is kept for reuse
+        if not session_file:
+            atexit.register(Disconnect, service_instance)
 
     except IOError as io_error:
         print(f"IOError occurred: {io_error}")
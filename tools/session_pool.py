@@ -0,0 +1,251 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pyVim.connect import Disconnect
+from .service_instance import (connection_settings, is_session_active, load_session_id, login,
+                               save_session_id)
+
+# default number of service instances held by a pool
+DEFAULT_POOL_SIZE = 4
+# vCenter drops idle sessions after 30 minutes by default
+DEFAULT_KEEPALIVE_SECONDS = 600
+# service instances idle for longer are checked before they are handed out
+VALIDATE_AFTER_SECONDS = 60
+
+# session pools, keyed by vCenter host and user
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host=None, user=None, password=None, port=None, **options):
+    """
+    Return the session pool of a vCenter, creating it on first use.
+
+    :param host: vCenter server address, defaults to $VSPHERE_HOST
+    :param user: vCenter username, defaults to $VSPHERE_USER
+    :param password: vCenter password, defaults to $VSPHERE_PASSWORD
+    :param port: vSphere API port, defaults to $VSPHERE_PORT or 443
+    :param options: SessionPool options used when the pool is created
+    :return: the SessionPool of this vCenter and user
+    """
+    settings = connection_settings(host, user, password, port)
+    key = (settings['host'], settings['port'], settings['user'])
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = _pools[key] = SessionPool(**settings, **options)
+
+    return pool
+
+
+class SessionPool:
+    """
+    Pool of authenticated service instances of one vCenter, handed out to worker threads.
+
+    All service instances of the pool share a single session: the pool logs in once, or resumes the
+    session persisted in the session file, and opens every further stub with that session cookie. A
+    background thread keeps the session alive with SessionManager.SessionIsActive, and when the session
+    expires anyway the pool logs in again and replaces the stubs as they are handed out. A failed
+    keep-alive call is kept in the error attribute for the caller to report, and cleared by the next
+    successful one.
+
+    Usage::
+
+        pool = get_pool(size=8)
+        with pool.session() as si:
+            vm = get_single_vm(si, 'web01')
+    """
+
+    def __init__(self, host=None, user=None, password=None, port=None, size=DEFAULT_POOL_SIZE,
+                 disable_ssl_verification=True, session_file=None, keepalive_seconds=DEFAULT_KEEPALIVE_SECONDS):
+        """
+        :param host: vCenter server address, defaults to $VSPHERE_HOST
+        :param user: vCenter username, defaults to $VSPHERE_USER
+        :param password: vCenter password, defaults to $VSPHERE_PASSWORD
+        :param port: vSphere API port, defaults to $VSPHERE_PORT or 443
+        :param size: maximum number of service instances held by the pool
+        :param disable_ssl_verification: whether to disable SSL certificate verification
+        :param session_file: optional path where the session cookie is persisted between processes;
+                             a persisted session is not logged out when the pool is closed
+        :param keepalive_seconds: interval of the keep-alive calls, None disables them
+        """
+        self.settings = connection_settings(host, user, password, port)
+        self.size = size
+        self.disable_ssl_verification = disable_ssl_verification
+        self.session_file = session_file
+        self.keepalive_seconds = keepalive_seconds
+        self.closed = False
+        self.error = None
+
+        self._session_id = None
+        # stub of the latest session, used to log it out on close even while every stub is checked out
+        self._logout_instance = None
+        # incremented on every login, stubs of an older session are replaced when handed out
+        self._generation = 0
+        self._generations = {}
+        self._last_used = {}
+        self._created = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._keepalive = None
+        if keepalive_seconds:
+            self._keepalive = threading.Thread(target=self._run_keepalive, name='session-keepalive', daemon=True)
+            self._keepalive.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def acquire(self, timeout=None):
+        """
+        Take a service instance out of the pool, opening a new one while the pool is not full.
+
+        :param timeout: seconds to wait for a free service instance, None waits forever
+        :return: an authenticated service instance
+        """
+        if self.closed:
+            raise RuntimeError("The session pool is closed.")
+
+        try:
+            service_instance = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._open()
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            service_instance = self._idle.get(timeout=timeout)
+
+        # replace stubs of an expired session
+        if self._generations.get(id(service_instance)) != self._generation:
+            self._generations.pop(id(service_instance), None)
+            return self._open()
+
+        # the session may have expired while the stub was idle, e.g. after a vCenter restart
+        idle = time.monotonic() - self._last_used.get(id(service_instance), 0)
+        if idle > VALIDATE_AFTER_SECONDS and not is_session_active(service_instance):
+            return self._renew(service_instance)
+
+        return service_instance
+
+    def release(self, service_instance):
+        """
+        Return a service instance to the pool.
+
+        :param service_instance: a service instance obtained from acquire()
+        :return: none
+        """
+        self._last_used[id(service_instance)] = time.monotonic()
+        self._idle.put(service_instance)
+
+    @contextmanager
+    def session(self, timeout=None):
+        """
+        Borrow a service instance for the duration of a with block.
+
+        :param timeout: seconds to wait for a free service instance, None waits forever
+        :return: a context manager yielding an authenticated service instance
+        """
+        service_instance = self.acquire(timeout=timeout)
+        try:
+            yield service_instance
+        finally:
+            self.release(service_instance)
+
+    def close(self):
+        """
+        Stop the keep-alive thread and log the session out, unless it is persisted in a session file.
+
+        :return: none
+        """
+        self.closed = True
+        self._stop.set()
+        if self._keepalive is not None:
+            self._keepalive.join()
+
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+        # all stubs share one session, a single logout ends it
+        service_instance = self._logout_instance
+        if service_instance is not None and not self.session_file:
+            try:
+                Disconnect(service_instance)
+            except Exception:
+                pass
+
+    def _open(self):
+        """
+        Open a service instance on the shared session, logging in first if there is no valid session.
+        """
+        with self._lock:
+            generation = self._generation
+            service_instance = None
+
+            session_id = self._session_id
+            # the persisted session is only tried before the first login of this pool
+            if session_id is None and self.session_file and self._generation == 0:
+                session_id = load_session_id(self.session_file)
+            if session_id:
+                service_instance = login(self.settings, self.disable_ssl_verification, session_id=session_id)
+
+            if service_instance is None:
+                service_instance = login(self.settings, self.disable_ssl_verification)
+                session_id = service_instance._stub.GetSessionId()
+                if self.session_file:
+                    save_session_id(self.session_file, session_id)
+                if self._session_id is not None:
+                    # a new session invalidates the stubs opened on the expired one
+                    self._generation += 1
+                    generation = self._generation
+
+            self._session_id = session_id
+            self._logout_instance = service_instance
+            self._generations[id(service_instance)] = generation
+            self._last_used[id(service_instance)] = time.monotonic()
+
+        return service_instance
+
+    def _renew(self, service_instance):
+        """
+        Log in again after the session of a service instance expired, and open a stub on the new session.
+        """
+        with self._lock:
+            # only the first thread noticing the expiry starts a new session
+            if self._generations.pop(id(service_instance), None) == self._generation:
+                self._session_id = None
+                self._generation += 1
+            self._last_used.pop(id(service_instance), None)
+
+        return self._open()
+
+    def _run_keepalive(self):
+        while not self._stop.wait(self.keepalive_seconds):
+            try:
+                service_instance = self._idle.get_nowait()
+            except queue.Empty:
+                # every stub is in use, which keeps the session alive anyway
+                continue
+
+            try:
+                if not is_session_active(service_instance):
+                    # log in again now instead of failing the next caller
+                    service_instance = self._renew(service_instance)
+                self.error = None
+            except Exception as error:
+                # the next round tries again, the error is kept for the caller to report
+                self.error = error
+            finally:
+                self.release(service_instance)
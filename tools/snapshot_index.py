@@ -0,0 +1,213 @@
+import re
+from datetime import datetime, timezone
+from pyVmomi import vim
+from .property_helper import DEFAULT_MAX_OBJECTS, retrieve_object_properties, retrieve_properties
+
+# properties of the virtual machines read to index their snapshots
+SNAPSHOT_PROPERTIES = ['name', 'snapshot', 'summary.config.template']
+
+
+class SnapshotRecord:
+    """
+    One snapshot of a virtual machine, wherever it sits in the snapshot tree.
+    """
+
+    def __init__(self, vm, vm_name, tree, parent, depth, current):
+        """
+        :param vm: the virtual machine
+        :param vm_name: name of the virtual machine
+        :param tree: the vim.vm.SnapshotTree of the snapshot
+        :param parent: the SnapshotRecord of the parent snapshot, None for a root snapshot
+        :param depth: depth of the snapshot in the tree, 0 for a root snapshot
+        :param current: whether the snapshot is the current snapshot of the virtual machine
+        """
+        self.vm = vm
+        self.vm_name = vm_name
+        self.snapshot = tree.snapshot
+        self.name = tree.name
+        self.description = tree.description
+        self.create_time = tree.createTime
+        self.state = tree.state
+        self.quiesced = tree.quiesced
+        self.parent = parent
+        self.depth = depth
+        self.current = current
+
+    @property
+    def path(self):
+        """
+        Names of the snapshot and all its ancestors, from the root, e.g. 'base/before-patch'.
+        """
+        names = []
+        record = self
+        while record is not None:
+            names.append(record.name)
+            record = record.parent
+
+        return '/'.join(reversed(names))
+
+    def age(self, now=None):
+        """
+        Return how old the snapshot is.
+
+        :param now: the reference time, defaults to the current time
+        :return: a datetime.timedelta
+        """
+        return (now or datetime.now(timezone.utc)) - self.create_time
+
+    def is_descendant_of(self, other):
+        """
+        Check whether the snapshot sits below another snapshot of the same tree.
+
+        :param other: the other SnapshotRecord
+        :return: True if other is an ancestor of the snapshot
+        """
+        record = self.parent
+        while record is not None:
+            if record.snapshot == other.snapshot:
+                return True
+            record = record.parent
+
+        return False
+
+
+class SnapshotIndex:
+    """
+    Every snapshot of many virtual machines, including child snapshots, read with one property collector call.
+
+    The snapshot trees of all virtual machines are walked down their childSnapshotList, so a snapshot is
+    found wherever it sits and not only among the root snapshots. The records can be searched by virtual
+    machine, snapshot name, description and age.
+
+    Usage::
+
+        index = SnapshotIndex(si).load(folder=folder)
+        old = index.find(name_regex='^before-patch', older_than=timedelta(days=7))
+    """
+
+    def __init__(self, si, max_objects=DEFAULT_MAX_OBJECTS):
+        """
+        :param si: service instance object connected to vCenter
+        :param max_objects: maximum number of objects fetched per property collector page
+        """
+        self.si = si
+        self.max_objects = max_objects
+        self.records = []
+        # virtual machine -> its name, also for virtual machines without snapshots
+        self.vm_names = {}
+        self.templates = set()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def load(self, vms=None, folder=None):
+        """
+        Read the snapshot trees of virtual machines, replacing what was loaded before.
+
+        :param vms: optional list of virtual machines, all virtual machines below the folder otherwise
+        :param folder: the folder to start the search from when no virtual machines are given
+        :return: the index
+        """
+        if vms is not None:
+            vm_props = retrieve_object_properties(self.si, list(vms), vim.VirtualMachine, SNAPSHOT_PROPERTIES,
+                                                  max_objects=self.max_objects)
+        else:
+            vm_props = retrieve_properties(self.si, [vim.VirtualMachine], SNAPSHOT_PROPERTIES, folder=folder,
+                                           max_objects=self.max_objects)
+
+        self.records = []
+        self.vm_names = {}
+        self.templates = set()
+        for props in vm_props:
+            self.vm_names[props['obj']] = props.get('name')
+            if props.get('summary.config.template'):
+                self.templates.add(props['obj'])
+            snapshot_info = props.get('snapshot')
+            if snapshot_info is not None:
+                self._walk(props['obj'], props.get('name'), snapshot_info.rootSnapshotList, None, 0,
+                           snapshot_info.currentSnapshot)
+
+        return self
+
+    def _walk(self, vm, vm_name, trees, parent, depth, current_snapshot):
+        for tree in trees or []:
+            record = SnapshotRecord(vm, vm_name, tree, parent, depth, tree.snapshot == current_snapshot)
+            self.records.append(record)
+            self._walk(vm, vm_name, tree.childSnapshotList, record, depth + 1, current_snapshot)
+
+    def find(self, vm_names=None, vm_regex=None, name=None, name_regex=None, description_regex=None,
+             older_than=None, newer_than=None, now=None):
+        """
+        Search the snapshots, every given criterion must match.
+
+        :param vm_names: optional list of virtual machine names
+        :param vm_regex: optional regular expression matching the virtual machine names
+        :param name: optional exact snapshot name
+        :param name_regex: optional regular expression matching the snapshot names
+        :param description_regex: optional regular expression searched in the snapshot descriptions
+        :param older_than: optional datetime.timedelta, only snapshots older than that
+        :param newer_than: optional datetime.timedelta, only snapshots newer than that
+        :param now: reference time of the age criteria, defaults to the current time
+        :return: a list of SnapshotRecords, in tree order
+        """
+        now = now or datetime.now(timezone.utc)
+        vm_names = set(vm_names) if vm_names is not None else None
+
+        records = []
+        for record in self.records:
+            if vm_names is not None and record.vm_name not in vm_names:
+                continue
+            if vm_regex and not re.search(vm_regex, record.vm_name or ''):
+                continue
+            if name is not None and record.name != name:
+                continue
+            if name_regex and not re.search(name_regex, record.name or ''):
+                continue
+            if description_regex and not re.search(description_regex, record.description or ''):
+                continue
+            if older_than is not None and record.age(now) <= older_than:
+                continue
+            if newer_than is not None and record.age(now) >= newer_than:
+                continue
+            records.append(record)
+
+        return records
+
+    def select_vms(self, vm_names=None, vm_regex=None):
+        """
+        Return the loaded virtual machines, templates excluded, matching the given names or regular expression.
+
+        :param vm_names: optional list of virtual machine names
+        :param vm_regex: optional regular expression matching the virtual machine names
+        :return: a list of virtual machines
+        """
+        vm_names = set(vm_names) if vm_names is not None else None
+
+        return [vm for vm, vm_name in self.vm_names.items()
+                if vm not in self.templates and (vm_names is None or vm_name in vm_names) and
+                (not vm_regex or re.search(vm_regex, vm_name or ''))]
+
+    def for_vm(self, vm):
+        """
+        Return the snapshots of one virtual machine.
+
+        :param vm: the virtual machine
+        :return: a list of SnapshotRecords, in tree order
+        """
+        return [record for record in self.records if record.vm == vm]
+
+    def current(self, vm):
+        """
+        Return the current snapshot of a virtual machine.
+
+        :param vm: the virtual machine
+        :return: the SnapshotRecord, or None if the virtual machine has no snapshot
+        """
+        for record in self.records:
+            if record.vm == vm and record.current:
+                return record
+
+        return None
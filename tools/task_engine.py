@@ -0,0 +1,348 @@
+import asyncio
+import threading
+from concurrent import futures
+from pyVmomi import vim
+from pyVmomi import vmodl
+
+# task properties watched by the engine, the full TaskInfo would also report every progress change
+TASK_PROPERTIES = ['info.state', 'info.result', 'info.error']
+
+# task engines currently running, keyed by the stub of their service instance
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(si):
+    """
+    Return the task engine of a service instance, starting one if needed.
+
+    :param si: service instance object connected to vCenter
+    :return: the running TaskEngine shared by all callers of this service instance
+    """
+    with _engines_lock:
+        engine = _engines.get(id(si._stub))
+        if engine is None or not engine.running:
+            engine = TaskEngine(si).start()
+            _engines[id(si._stub)] = engine
+
+    return engine
+
+
+class TaskBatchError(Exception):
+    """
+    Raised when tasks of a batch end in error; holds the outcome of every task of the batch.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+        messages = [f"{task}: {getattr(error, 'msg', None) or error}" for task, error in batch.errors.items()]
+        super().__init__(f"{len(batch.errors)} of {len(batch)} tasks failed: " + '; '.join(messages))
+
+
+class TaskBatchResult:
+    """
+    Outcome of a batch of tasks: the result of every succeeded task and the error of every failed one.
+    """
+
+    def __init__(self, tasks, task_futures):
+        """
+        :param tasks: list of tasks, or of the objects the tasks were started for, used as result keys
+        :param task_futures: list of finished futures, one per key and in the same order
+        """
+        self.tasks = list(tasks)
+        self.results = {}
+        self.errors = {}
+
+        for task, future in zip(self.tasks, task_futures):
+            error = future.exception()
+            if error is None:
+                self.results[task] = future.result()
+            else:
+                self.errors[task] = error
+
+    def __len__(self):
+        return len(self.tasks)
+
+    @property
+    def succeeded(self):
+        return [task for task in self.tasks if task in self.results]
+
+    @property
+    def failed(self):
+        return [task for task in self.tasks if task in self.errors]
+
+    def raise_for_errors(self):
+        """
+        Raise if any task failed; a single failure is raised as the fault reported by vCenter.
+
+        :return: none
+        """
+        if len(self.errors) == 1:
+            raise next(iter(self.errors.values()))
+        if self.errors:
+            raise TaskBatchError(self)
+
+
+class TaskEngine:
+    """
+    Tracks vCenter tasks on one dedicated property collector.
+
+    Every batch of submitted tasks gets one property filter, and a single background thread follows all
+    of them with WaitForUpdatesEx, so thousands of concurrent tasks cost one long poll instead of one
+    poll per task. Each task gets its own future, resolved with the task result or failed with the fault
+    it ended with, so one failed task does not hide the outcome of the others.
+
+    Usage::
+
+        engine = get_engine(si)
+        batch = engine.wait([vm.PowerOn() for vm in vms])
+        for vm_task, error in batch.errors.items():
+            print(vm_task, error.msg)
+
+        # or from a coroutine
+        batch = await engine.wait_async(tasks)
+    """
+
+    def __init__(self, si, max_objects=1000, wait_seconds=30):
+        """
+        :param si: service instance object connected to vCenter
+        :param max_objects: maximum number of object updates returned by one WaitForUpdatesEx call
+        :param wait_seconds: how long one WaitForUpdatesEx call waits for changes before returning
+        """
+        self.si = si
+        self.max_objects = max_objects
+        self.wait_seconds = wait_seconds
+        self.error = None
+
+        self._property_collector = None
+        self._version = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._has_work = threading.Event()
+        self._lock = threading.Lock()
+
+        # task moId -> (future, filter)
+        self._futures = {}
+        # filter -> set of moIds of its unfinished tasks
+        self._filters = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        """
+        Number of submitted tasks that have not finished yet.
+        """
+        with self._lock:
+            return len(self._futures)
+
+    def start(self):
+        """
+        Create the property collector and start following task updates in a background thread.
+
+        :return: the engine itself
+        """
+        # use a dedicated property collector so other WaitForUpdates callers are not disturbed
+        self._property_collector = self.si.content.propertyCollector.CreatePropertyCollector()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='task-engine', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stop following tasks, fail the futures of unfinished ones and release the property collector.
+
+        :return: none
+        """
+        self._stop.set()
+        self._has_work.set()
+        if self._thread is not None:
+            try:
+                self._property_collector.CancelWaitForUpdates()
+            except vmodl.MethodFault:
+                pass
+            self._thread.join()
+            self._thread = None
+
+        self._fail_all(None)
+        if self._property_collector is not None:
+            self._property_collector.Destroy()
+            self._property_collector = None
+
+    def submit(self, tasks):
+        """
+        Start tracking a batch of tasks.
+
+        :param tasks: list of tasks to track
+        :return: a list of futures, one per task and in the same order
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return []
+        if not self.running:
+            raise RuntimeError("The task engine is not running.")
+
+        task_futures = []
+        # moId -> (task, future) of the tasks not tracked yet
+        new_tasks = {}
+        with self._lock:
+            for task in tasks:
+                # a task submitted twice shares its future
+                if task._moId in self._futures:
+                    future = self._futures[task._moId][0]
+                elif task._moId in new_tasks:
+                    future = new_tasks[task._moId][1]
+                else:
+                    future = futures.Future()
+                    new_tasks[task._moId] = (task, future)
+                task_futures.append(future)
+
+        if new_tasks:
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+            filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=task, skip=False)
+                                     for task, _ in new_tasks.values()]
+            filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim.Task,
+                                                                              pathSet=TASK_PROPERTIES,
+                                                                              all=False)]
+            # register the futures before the first update of the filter can arrive
+            with self._lock:
+                task_filter = self._property_collector.CreateFilter(filter_spec, True)
+                for mo_id, (_, future) in new_tasks.items():
+                    self._futures[mo_id] = (future, task_filter)
+                self._filters[task_filter] = set(new_tasks)
+                self._has_work.set()
+
+        return task_futures
+
+    def wait(self, tasks, timeout=None):
+        """
+        Wait for a batch of tasks to finish.
+
+        :param tasks: list of tasks to wait for
+        :param timeout: optional number of seconds to wait before raising TimeoutError
+        :return: a TaskBatchResult with the per-task results and errors
+        """
+        tasks = list(tasks)
+        task_futures = self.submit(tasks)
+
+        done, not_done = futures.wait(task_futures, timeout=timeout)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} of {len(tasks)} tasks still running after {timeout} seconds.")
+
+        return TaskBatchResult(tasks, task_futures)
+
+    async def wait_async(self, tasks):
+        """
+        Wait for a batch of tasks to finish without blocking the event loop.
+
+        :param tasks: list of tasks to wait for
+        :return: a TaskBatchResult with the per-task results and errors
+        """
+        tasks = list(tasks)
+        task_futures = self.submit(tasks)
+        # gather retrieves the exceptions of failed tasks, they are reported through the batch result
+        await asyncio.gather(*[asyncio.wrap_future(future) for future in set(task_futures)], return_exceptions=True)
+
+        return TaskBatchResult(tasks, task_futures)
+
+    def _run(self):
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.wait_seconds,
+                                                            maxObjectUpdates=self.max_objects)
+        while not self._stop.is_set():
+            # sleep until tasks are submitted instead of polling an empty collector
+            self._has_work.wait()
+            if self._stop.is_set():
+                break
+
+            try:
+                update = self._property_collector.WaitForUpdatesEx(self._version or '', options)
+            except vmodl.fault.RequestCanceled:
+                break
+            except Exception as error:
+                # futures of a broken engine would never resolve, fail them instead
+                if not self._stop.is_set():
+                    self.error = error
+                    self._fail_all(error)
+                break
+
+            if update is not None:
+                try:
+                    self._apply(update)
+                except Exception as error:
+                    # a dead thread would leave the pending futures unresolved forever
+                    self.error = error
+                    self._fail_all(error)
+                    break
+                self._version = update.version
+
+    def _apply(self, update):
+        finished = []
+        for filter_set in update.filterSet:
+            for obj_set in filter_set.objectSet:
+                values = {change.name: change.val for change in obj_set.changeSet}
+                state = values.get('info.state')
+                if state in (vim.TaskInfo.State.success, vim.TaskInfo.State.error):
+                    finished.append((obj_set.obj, state, values))
+
+        for task, state, values in finished:
+            done_filter = None
+            with self._lock:
+                entry = self._futures.pop(task._moId, None)
+                if entry is None:
+                    continue
+                future, task_filter = entry
+
+                # drop the filter once all of its tasks finished
+                pending = self._filters.get(task_filter)
+                if pending is not None:
+                    pending.discard(task._moId)
+                    if not pending:
+                        del self._filters[task_filter]
+                        done_filter = task_filter
+                if not self._futures:
+                    self._has_work.clear()
+
+            if done_filter is not None:
+                self._destroy_filter(done_filter)
+
+            if state == vim.TaskInfo.State.success:
+                self._resolve(future, result=values.get('info.result'))
+            else:
+                error = values.get('info.error')
+                if error is None:
+                    error = task.info.error
+                self._resolve(future, error=error)
+
+    def _destroy_filter(self, task_filter):
+        try:
+            task_filter.Destroy()
+        except vmodl.MethodFault:
+            pass
+
+    def _fail_all(self, error):
+        with self._lock:
+            entries = list(self._futures.values())
+            task_filters = list(self._filters)
+            self._futures.clear()
+            self._filters.clear()
+            self._has_work.clear()
+
+        for task_filter in task_filters:
+            self._destroy_filter(task_filter)
+        for future, _ in entries:
+            self._resolve(future, error=error or RuntimeError("The task engine was stopped before the task finished."))
+
+    @staticmethod
+    def _resolve(future, result=None, error=None):
+        # the caller may have cancelled the future, e.g. a wait_async coroutine cancelled by a timeout
+        if not future.set_running_or_notify_cancel():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
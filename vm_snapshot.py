@@ -1,7 +1,59 @@
 from pyVmomi import vim
 from tools.obj_helper import *
 from tools import task
-from prettytable import PrettyTable
+from tools.output_sink import TableSink
+from tools.property_helper import retrieve_object_properties
+from tools.retention import DEFAULT_MAX_REMOVALS_PER_DATASTORE
+from tools.scheduler import TaskScheduler, run_tasks, vm_resource_keys
+from tools.snapshot_index import SnapshotIndex
+from tools.task_engine import TaskBatchResult
+
+
+def _find_snapshot(si, vm, vm_name, snapshot_name):
+    """
+    Search the whole snapshot tree of a virtual machine for a snapshot by name.
+
+    :param si: service instance object connected to vCenter
+    :param vm: the virtual machine
+    :param vm_name: name of the virtual machine
+    :param snapshot_name: name of the snapshot
+    :return: the SnapshotRecord of the first snapshot of this name, in tree order
+    """
+    records = SnapshotIndex(si).load(vms=[vm]).find(name=snapshot_name)
+    if not records:
+        raise ManagedObjectNotFoundError(
+            f"Snapshot '{snapshot_name}' not found for virtual machine '{vm_name}'."
+        )
+
+    return records[0]
+
+
+def _load_index(si, folder_name, vm_names, regex, action):
+    """
+    Read the snapshot trees of the virtual machines selected by folder, names or regular expression.
+
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_names: list of virtual machine names
+    :param regex: regular expression to match virtual machine names
+    :param action: what is done with the snapshots, used in the error message
+    :return: the loaded SnapshotIndex
+    """
+    if not (folder_name or vm_names or regex):
+        raise ValueError(f"No virtual machine specified to {action}.")
+
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    index = SnapshotIndex(si).load(folder=folder)
+    if vm_names:
+        missing = sorted(set(vm_names) - set(index.vm_names.values()))
+        if missing:
+            raise ManagedObjectNotFoundError(f"Virtual machines not found: {', '.join(missing)}.")
+
+    return index
 
 
 def create(si, vm_name, snapshot_name, description=None, memory=False, quiesce=False):
@@ -16,23 +68,8 @@ def create(si, vm_name, snapshot_name, description=None, memory=False, quiesce=F
     :param quiesce: whether to quiesce the file system during snapshot creation
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
-
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+    vm = get_single_vm(si, vm_name)
 
     tasks = [vm.CreateSnapshot(snapshot_name, description, memory, quiesce)]
     task.wait_for_tasks(si, tasks)
@@ -49,34 +86,10 @@ def remove(si, vm_name, snapshot_name):
     :param snapshot_name: name of the snapshot to be removed
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
-
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
-
-    snapshot = None
-    for snapshot_temp in vm.snapshot.rootSnapshotList:
-        if snapshot_temp.name == snapshot_name:
-            snapshot = snapshot_temp
-            break
+    vm = get_single_vm(si, vm_name)
 
-    if not snapshot:
-        raise ManagedObjectNotFoundError(
-            f"Snapshot '{snapshot_name}' not found for virtual machine '{vm_name}'."
-        )
+    snapshot = _find_snapshot(si, vm, vm_name, snapshot_name)
 
     tasks = [snapshot.snapshot.RemoveSnapshot_Task(True)]
     task.wait_for_tasks(si, tasks)
@@ -93,35 +106,12 @@ def revert(si, vm_name, snapshot_name=None):
     :param snapshot_name: name of the snapshot to revert to
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
-
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+    vm = get_single_vm(si, vm_name)
 
     snapshot = None
     if snapshot_name:
-        for snapshot_temp in vm.snapshot.rootSnapshotList:
-            if snapshot_temp.name == snapshot_name:
-                snapshot = snapshot_temp
-                break
-
-        if not snapshot:
-            raise ManagedObjectNotFoundError(
-                f"Snapshot '{snapshot_name}' not found for virtual machine '{vm_name}'."
-            )
+        snapshot = _find_snapshot(si, vm, vm_name, snapshot_name)
 
     if snapshot:
         tasks = [snapshot.snapshot.RevertToSnapshot_Task()]
@@ -142,23 +132,8 @@ def remove_all(si, vm_name):
     :param vm_name: name of the virtual machine
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
-
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+    vm = get_single_vm(si, vm_name)
 
     tasks = [vm.RemoveAllSnapshots()]
     task.wait_for_tasks(si, tasks)
@@ -176,80 +151,256 @@ def rename(si, vm_name, snapshot_name, new_name):
     :param new_name: new name for the snapshot
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
-
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
-
-    snapshot = None
-    # locate the snapshot by name
-    for snapshot_temp in vm.snapshot.rootSnapshotList:
-        if snapshot_temp.name == snapshot_name:
-            snapshot = snapshot_temp
-            break
+    vm = get_single_vm(si, vm_name)
 
-    if not snapshot:
-        raise ManagedObjectNotFoundError(
-            f"Snapshot '{snapshot_name}' not found for virtual machine '{vm_name}'."
-        )
+    # locate the snapshot by name, anywhere in the snapshot tree
+    snapshot = _find_snapshot(si, vm, vm_name, snapshot_name)
 
     # rename the snapshot
     snapshot.snapshot.Rename(new_name)
     print(f"Snapshot '{snapshot_name}' renamed to '{new_name}' successfully for virtual machine '{vm_name}'.")
 
 
-def show(si, vm_name):
+def show(si, vm_name, sink=None):
     """
-    Display all snapshots of a virtual machine.
+    Display all snapshots of a virtual machine, child snapshots included, in tree order.
 
     :param si: service instance object connected to vCenter
     :param vm_name: name of the virtual machine
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
-    vm = None
     # locate the virtual machine by name
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
+    vm = get_single_vm(si, vm_name)
 
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
+    sink = sink or TableSink()
+    sink.begin(["Name", "Description", "Quiesce", "State", "Created time", "Parent"],
+               title=f"Snapshots for virtual machine '{vm_name}':")
 
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
+    for record in SnapshotIndex(si).load(vms=[vm]):
+        sink.write(
+            [record.name, record.description, record.quiesced, record.state, str(record.create_time).split('.')[0],
+             record.parent.name if record.parent else None]
         )
 
-    table = PrettyTable()
-    table.field_names = ["Name", "Description", "Quiesce", "State", "Created time"]
+    sink.end()
 
-    for snapshot_temp in vm.snapshot.rootSnapshotList:
-        snapshot_name = snapshot_temp.name
-        snapshot_description = snapshot_temp.description
-        snapshot_quiesced = snapshot_temp.quiesced
-        snapshot_state = snapshot_temp.state
-        snapshot_time = snapshot_temp.createTime
 
-        table.add_row(
-            [snapshot_name, snapshot_description, snapshot_quiesced, snapshot_state, str(snapshot_time).split('.')[0]]
-        )
+def create_bulk(si, snapshot_name, folder_name=None, vm_names=None, regex=None, description=None, memory=False,
+                quiesce=False, **limits):
+    """
+    Create a snapshot of many virtual machines concurrently.
+
+    The virtual machines are selected by names or regular expression, all the virtual machines of the
+    folder otherwise; templates are skipped. The tasks run under the TaskScheduler caps, one at a time
+    per virtual machine, and every virtual machine is reported as soon as it is done.
+
+    :param si: service instance object connected to vCenter
+    :param snapshot_name: name of the snapshot to be created
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_names: list of virtual machine names
+    :param regex: regular expression to match virtual machine names
+    :param description: description of the snapshot
+    :param memory: whether to include the VM memory state in the snapshot
+    :param quiesce: whether to quiesce the file system during snapshot creation
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster,
+                   max_per_vm)
+    :return: a TaskBatchResult keyed by virtual machine
+    """
+    index = _load_index(si, folder_name, vm_names, regex, "snapshot")
+    action_vms = index.select_vms(vm_names, regex)
+    if not action_vms:
+        print("Specified virtual machines could not be snapshotted.")
+        return None
+
+    def create_done(vm, future):
+        error = future.exception()
+        if error is None:
+            print(f"Snapshot '{snapshot_name}' created successfully for virtual machine '{index.vm_names[vm]}'.")
+        else:
+            print(f"Snapshot '{snapshot_name}' could not be created for virtual machine '{index.vm_names[vm]}': "
+                  f"{getattr(error, 'msg', None) or error}")
+
+    return run_tasks(si, action_vms, lambda vm: vm.CreateSnapshot(snapshot_name, description, memory, quiesce),
+                     on_done=create_done, **limits)
+
+
+def remove_bulk(si, folder_name=None, vm_names=None, regex=None, snapshot_name=None, snapshot_regex=None,
+                description_regex=None, older_than=None, remove_children=False, consolidate=True, dry_run=False,
+                **limits):
+    """
+    Remove the snapshots of many virtual machines matching a name, description or age.
 
-    print(f"Snapshots for virtual machine '{vm_name}':")
-    print(table)
+    The snapshot trees of all virtual machines are read with one property collector call and searched down
+    to the deepest child snapshot. When the children are removed with their parent, the selected snapshots
+    below another selected one are left to their ancestor. The removals run under the TaskScheduler caps,
+    one at a time per virtual machine, and every snapshot is reported as soon as it is removed.
+
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_names: list of virtual machine names
+    :param regex: regular expression to match virtual machine names
+    :param snapshot_name: exact name of the snapshots to remove
+    :param snapshot_regex: regular expression to match the names of the snapshots to remove
+    :param description_regex: regular expression searched in the descriptions of the snapshots to remove
+    :param older_than: datetime.timedelta, only snapshots older than that are removed
+    :param remove_children: whether to remove the child snapshots of the removed snapshots as well
+    :param consolidate: whether to consolidate the disks after each removal
+    :param dry_run: only print the snapshots that would be removed
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster,
+                   max_per_vm)
+    :return: the list of SnapshotRecords selected for removal
+    """
+    if snapshot_name is None and not snapshot_regex and not description_regex and older_than is None:
+        raise ValueError("No snapshot criterion specified, use remove_all() to remove every snapshot.")
+
+    index = _load_index(si, folder_name, vm_names, regex, "remove snapshots from")
+    records = index.find(vm_names=vm_names, vm_regex=regex, name=snapshot_name, name_regex=snapshot_regex,
+                         description_regex=description_regex, older_than=older_than)
+
+    # a snapshot removed with its children takes the selected snapshots below it along
+    if remove_children:
+        records = [record for record in records
+                   if not any(record.is_descendant_of(other) for other in records if other.vm == record.vm)]
+
+    for record in records:
+        print(f"Virtual machine '{record.vm_name}': snapshot '{record.path}' created {record.create_time}")
+    print(f"Snapshots: {len(records)} selected for removal.")
+    if dry_run or not records:
+        return records
+
+    def remove_done(record, future):
+        error = future.exception()
+        if error is None:
+            print(f"Snapshot '{record.path}' removed successfully from virtual machine '{record.vm_name}'.")
+        else:
+            print(f"Snapshot '{record.path}' could not be removed from virtual machine '{record.vm_name}': "
+                  f"{getattr(error, 'msg', None) or error}")
+
+    run_tasks(si, records, lambda record: record.snapshot.RemoveSnapshot_Task(remove_children, consolidate),
+              resource_keys=lambda batch: vm_resource_keys(si, [record.vm for record in batch]),
+              on_done=remove_done, **limits)
+
+    return records
+
+
+def revert_bulk(si, snapshot_name, folder_name=None, vm_names=None, regex=None, **limits):
+    """
+    Revert many virtual machines to a snapshot concurrently.
+
+    Each virtual machine goes back to its newest snapshot of the given name, wherever it sits in the snapshot
+    tree; virtual machines without such a snapshot are reported and left alone.
+
+    :param si: service instance object connected to vCenter
+    :param snapshot_name: name of the snapshot to revert to
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_names: list of virtual machine names
+    :param regex: regular expression to match virtual machine names
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster,
+                   max_per_vm)
+    :return: a TaskBatchResult keyed by SnapshotRecord
+    """
+    index = _load_index(si, folder_name, vm_names, regex, "revert")
+
+    # the newest snapshot of the name per virtual machine
+    newest = {}
+    for record in index.find(vm_names=vm_names, vm_regex=regex, name=snapshot_name):
+        if record.vm not in newest or record.create_time > newest[record.vm].create_time:
+            newest[record.vm] = record
+
+    missing = sorted(index.vm_names[vm] for vm in index.select_vms(vm_names, regex) if vm not in newest)
+    if missing:
+        print(f"Virtual machines without snapshot '{snapshot_name}': {', '.join(missing)}.")
+    if not newest:
+        return None
+
+    def revert_done(record, future):
+        error = future.exception()
+        if error is None:
+            print(f"Virtual machine '{record.vm_name}' reverted to snapshot '{record.path}' successfully.")
+        else:
+            print(f"Virtual machine '{record.vm_name}' could not be reverted to snapshot '{record.path}': "
+                  f"{getattr(error, 'msg', None) or error}")
+
+    return run_tasks(si, list(newest.values()), lambda record: record.snapshot.RevertToSnapshot_Task(),
+                     resource_keys=lambda batch: vm_resource_keys(si, [record.vm for record in batch]),
+                     on_done=revert_done, **limits)
+
+
+def apply_retention(si, policy, folder_name=None, vm_names=None, regex=None, consolidate=True, dry_run=False,
+                    **limits):
+    """
+    Remove the snapshots a retention policy no longer keeps, then consolidate the disks left behind.
+
+    The snapshot trees of all virtual machines are read with one property collector call and the policy
+    builds the deletion plan from them. The removals run under the TaskScheduler caps, one at a time per
+    virtual machine and at most DEFAULT_MAX_REMOVALS_PER_DATASTORE per datastore unless max_per_datastore
+    is given, so the disk merges do not saturate the storage. Afterwards every scanned virtual machine
+    flagged with runtime.consolidationNeeded gets its disks consolidated.
+
+    :param si: service instance object connected to vCenter
+    :param policy: the tools.retention.RetentionPolicy to evaluate
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_names: list of virtual machine names
+    :param regex: regular expression to match virtual machine names
+    :param consolidate: whether to consolidate the disks of the virtual machines that need it
+    :param dry_run: only print the deletion plan
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster,
+                   max_per_vm)
+    :return: the deletion plan, a list of (SnapshotRecord, reason) tuples
+    """
+    index = _load_index(si, folder_name, vm_names, regex, "apply the retention policy to")
+    # templates cannot run snapshot tasks, they are left out with the virtual machines not selected
+    scanned_vms = index.select_vms(vm_names, regex)
+    selected = set(scanned_vms)
+    index.records = [record for record in index.records if record.vm in selected]
+
+    plan = policy.plan(index)
+    for record, reason in plan:
+        print(f"Virtual machine '{record.vm_name}': snapshot '{record.path}' created {record.create_time}, "
+              f"{reason}")
+    print(f"Snapshots: {len(plan)} of {len(index)} selected for removal.")
+    if dry_run:
+        return plan
+
+    limits.setdefault('max_per_datastore', DEFAULT_MAX_REMOVALS_PER_DATASTORE)
+
+    # a failed removal is what leaves disks to consolidate, so the errors are raised once both steps ran
+    batches = []
+    if plan:
+        def remove_done(record, future):
+            error = future.exception()
+            if error is None:
+                print(f"Snapshot '{record.path}' removed successfully from virtual machine '{record.vm_name}'.")
+            else:
+                print(f"Snapshot '{record.path}' could not be removed from virtual machine '{record.vm_name}': "
+                      f"{getattr(error, 'msg', None) or error}")
+
+        batches.append(TaskScheduler(si, **limits).run(
+            [record for record, _ in plan], lambda record: record.snapshot.RemoveSnapshot_Task(False, consolidate),
+            resource_keys=lambda batch: vm_resource_keys(si, [record.vm for record in batch]), on_done=remove_done))
+
+    if consolidate:
+        pending = [props['obj'] for props in retrieve_object_properties(si, scanned_vms, vim.VirtualMachine,
+                                                                        ['runtime.consolidationNeeded'])
+                   if props.get('runtime.consolidationNeeded')]
+        if pending:
+            batch = TaskScheduler(si, **limits).run(pending, lambda vm: vm.ConsolidateVMDisks_Task())
+            batches.append(batch)
+            for vm, error in batch.errors.items():
+                print(f"Virtual machine '{index.vm_names[vm]}' disks could not be consolidated: "
+                      f"{getattr(error, 'msg', None) or error}")
+            if batch.succeeded:
+                print(f"Virtual machines: {', '.join(index.vm_names[vm] for vm in batch.succeeded)} disks "
+                      f"consolidated successfully.")
+
+    # raise the removal and consolidation errors together
+    outcome = TaskBatchResult([], [])
+    for batch in batches:
+        outcome.tasks.extend(batch.tasks)
+        outcome.results.update(batch.results)
+        outcome.errors.update(batch.errors)
+    outcome.raise_for_errors()
+
+    return plan
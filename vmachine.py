@@ -1,10 +1,33 @@
 from pyVmomi import vim
 import re
-from prettytable import PrettyTable
+from collections import Counter
+from tools.output_sink import TableSink
 from tools.obj_helper import *
 from tools.power_helper import *
 from tools import task
+from tools.base_snapshot import get_registry
+from tools.change_set import CHANGE_SET_PROPERTIES, find_networks
+from tools.placement_cache import PlacementCache
+from tools.event_stream import EventStream
+from tools.perf_metrics import METRIC_UNITS, MetricsCollector
+from tools.placement_engine import PlacementEngine
+from tools.reconciler import diff_hardware
+from tools.scheduler import TaskScheduler, run_tasks
+from tools.task_engine import TaskBatchResult
 from tools.vm_helper import *
+from tools.property_helper import DEFAULT_MAX_OBJECTS, iter_properties, retrieve_object_properties, retrieve_properties
+
+# properties read by show(), retrieved for all virtual machines in one paged property collector call
+SHOW_PROPERTIES = ['name', 'config.template', 'runtime.powerState', 'runtime.connectionState',
+                   'guest.toolsStatus', 'storage.perDatastoreUsage', 'config.hardware.numCPU',
+                   'config.hardware.memoryMB']
+SHOW_FIELD_NAMES = ['Name', 'Power State', 'Connection State', 'VMware Tools', 'Disk space', 'CPU Number', 'Memory']
+
+# guest network state read by customize_bulk() to build the customization specifications
+CUSTOMIZE_PROPERTIES = ['name', 'guest.net', 'guest.ipStack', 'runtime.powerState']
+
+# clone modes accepted by clone() and clone_bulk()
+CLONE_MODES = ['full', 'linked', 'instant']
 
 
 def power_on(si, folder_name, vm_names=None, regex=None):
@@ -27,9 +50,8 @@ def power_on(si, folder_name, vm_names=None, regex=None):
         raise ValueError(f"No virtual machine specified to power on.")
 
     if action_vms:
-        # create and execute power-on tasks
-        task_list = [vm.PowerOn() for vm in action_vms]
-        task.wait_for_tasks(si, task_list)
+        # power on the virtual machines under the host and datastore concurrency caps
+        run_tasks(si, action_vms, lambda vm: vm.PowerOn())
 
         print(f"Virtual machines {', '.join(vm.name for vm in action_vms)} powered on successfully")
     else:
@@ -56,9 +78,8 @@ def power_off(si, folder_name, vm_names=None, regex=None):
         raise ValueError(f"No virtual machine specified to power off.")
 
     if action_vms:
-        # create and execute power-off tasks
-        task_list = [vm.PowerOff() for vm in action_vms]
-        task.wait_for_tasks(si, task_list)
+        # power off the virtual machines under the host and datastore concurrency caps
+        run_tasks(si, action_vms, lambda vm: vm.PowerOff())
 
         print(f"Virtual machines {', '.join(vm.name for vm in action_vms)} powered off successfully.")
     else:
@@ -83,8 +104,7 @@ def suspend(si, folder_name, vm_names=None, regex=None):
         raise ValueError(f"No virtual machine specified to suspend")
 
     if action_vms:
-        task_list = [vm.Suspend() for vm in action_vms]
-        task.wait_for_tasks(si, task_list)
+        run_tasks(si, action_vms, lambda vm: vm.Suspend())
 
         print(f"Virtual machines {', '.join(vm.name for vm in action_vms)} suspended successfully.")
     else:
@@ -109,8 +129,7 @@ def reboot(si, folder_name, vm_names=None, regex=None):
         raise ValueError(f"No virtual machine specified to reboot.")
 
     if action_vms:
-        task_list = [vm.Reset() for vm in action_vms]
-        task.wait_for_tasks(si, task_list)
+        run_tasks(si, action_vms, lambda vm: vm.Reset())
 
         print(f"Virtual machines {', '.join(vm.name for vm in action_vms)} rebooted successfully.")
     else:
@@ -137,22 +156,112 @@ def destroy(si, folder_name, vm_names=None, regex=None):
     action_names = [vm.name for vm in action_vms]
 
     # power off virtual machines if necessary
-    power_list = list()
-    for vm in action_vms:
-        if vm.summary.runtime.powerState == "poweredOn":
-            power_list.append(vm)
+    power_list = filter_power_state(si, action_vms, 'Off')
 
     if power_list:
-        task_list = [vm.PowerOff() for vm in power_list]
-        task.wait_for_tasks(si, task_list)
+        run_tasks(si, power_list, lambda vm: vm.PowerOff())
         print(f"Powered off virtual machines: {', '.join(vm.name for vm in power_list)}.")
 
     # destroy the specified virtual machines
-    task_list = [vm.Destroy() for vm in action_vms]
-    task.wait_for_tasks(si, task_list)
+    run_tasks(si, action_vms, lambda vm: vm.Destroy())
     print(f"Virtual machines: {', '.join(action_names)} destroyed successfully.")
 
 
+def reconfigure(si, folder_name, change_set, vm_names=None, regex=None, **limits):
+    """
+    Apply a set of CPU, memory, disk and network adapter changes to virtual machines.
+
+    Every virtual machine gets all the changes with a single reconfiguration task, the tasks run
+    concurrently under the TaskScheduler caps.
+
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing virtual machines
+    :param change_set: the tools.change_set.ChangeSet to apply
+    :param vm_names: list of virtual machine names to reconfigure
+    :param regex: regular expression to match virtual machine names
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+    :return: none
+    """
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    if vm_names:
+        action_vms = get_given_obj(si, [vim.VirtualMachine], vm_names, folder=folder)
+    elif regex:
+        action_vms = get_matched_obj(si, [vim.VirtualMachine], regex, folder=folder)
+    else:
+        raise ValueError(f"No virtual machine specified to reconfigure.")
+
+    if action_vms:
+        vm_names = get_obj_property(si, action_vms, vim.VirtualMachine, 'name')
+        change_set.apply(si, action_vms, **limits)
+        print(f"Virtual machines {', '.join(vm_names[vm] for vm in action_vms)} reconfigured successfully.")
+    else:
+        print("Specified virtual machines could not be reconfigured.")
+
+
+def reconcile(si, desired_states, folder_name=None, prune=False, dry_run=False, **limits):
+    """
+    Bring the hardware of virtual machines to their desired state.
+
+    The actual hardware of all virtual machines is read with one property collector call and compared with
+    the desired state documents. Only the virtual machines that differ get a reconfiguration task, holding
+    just the differences, and those tasks run concurrently under the TaskScheduler caps. Rerunning a
+    reconciliation that already converged makes no changes at all.
+
+    :param si: service instance object connected to vCenter
+    :param desired_states: list of desired state documents, dictionaries with the vm_name and any of cpu_num,
+                           core_num, memory_size, disks and nics, see tools.reconciler.diff_hardware
+    :param folder_name: name of the folder containing the virtual machines
+    :param prune: whether to remove the disks and network adapters missing from the desired states
+    :param dry_run: only print the changes, without applying them
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+    :return: a dictionary mapping the names of the virtual machines that differ to their list of changes
+    """
+    desired_states = list(desired_states)
+
+    vm_names = [desired['vm_name'] for desired in desired_states]
+    duplicates = sorted(vm_name for vm_name, count in Counter(vm_names).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Virtual machine names requested more than once: {', '.join(duplicates)}.")
+
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    # read the actual hardware of all virtual machines at once
+    vms, vm_props = _find_vms(si, vm_names, folder, CHANGE_SET_PROPERTIES)
+
+    # compute the differences, an invalid desired state fails before anything is changed
+    change_sets = {}
+    report = {}
+    for desired in desired_states:
+        vm = vms[desired['vm_name']]
+        change_set, changes = diff_hardware(vm_props[vm], desired, prune=prune)
+        if change_set:
+            change_sets[vm] = change_set
+            report[desired['vm_name']] = changes
+            print(f"Virtual machine '{desired['vm_name']}': {', '.join(changes)}")
+
+    print(f"Virtual machines: {len(desired_states) - len(change_sets)} of {len(desired_states)} already "
+          f"match the desired state.")
+    if dry_run or not change_sets:
+        return report
+
+    # build every specification before the first task starts
+    networks = find_networks(si, [portgroup_name for change_set in change_sets.values()
+                                  for portgroup_name in change_set.portgroup_names()])
+    specs = {vm: change_set.build_spec(vm_props[vm], networks) for vm, change_set in change_sets.items()}
+
+    run_tasks(si, list(specs), lambda vm: vm.ReconfigVM_Task(spec=specs[vm]), **limits)
+    print(f"Virtual machines {', '.join(report)} reconciled successfully.")
+
+    return report
+
+
 def rename(si, vm_name, new_name, folder_name=None):
     """
     Rename a virtual machine.
@@ -163,45 +272,13 @@ def rename(si, vm_name, new_name, folder_name=None):
     :param folder_name: the folder name containing the VM
     :return:
     """
-    content = si.RetrieveContent()
-
-    # locate the specified folder
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
-    if not folder_name:
-        folder = content.rootFolder
-    else:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-
-    # locate the virtual machine by its name in the specified folder
-    # vms = get_all_obj(si, [vim.VirtualMachine], folder_name)
-    container_view = content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    vm = None
-    for vm_temp in vms:
-        # exclude templates from the search
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+    # locate the virtual machine by its name in the specified folder, templates are excluded
+    vm = get_single_vm(si, vm_name, folder=folder)
 
     # initiate the rename task for the virtual machine
     tasks = [vm.Rename_Task(new_name)]
@@ -209,123 +286,94 @@ def rename(si, vm_name, new_name, folder_name=None):
     print(f"Virtual machine '{vm_name}' renamed to '{new_name}' successfully.")
 
 
-def show(si, folder_name=None):
+def _show_row(props):
     """
-    Display brief information about virtual machines in a folder.
+    Build the row of a virtual machine from its retrieved SHOW_PROPERTIES.
+
+    :param props: property dictionary of the virtual machine
+    :return: the row displayed by show()
+    """
+    # sum the usage over every datastore the virtual machine has files on
+    disk_space = sum(usage.committed + usage.uncommitted for usage in props.get('storage.perDatastoreUsage') or [])
+    vm_storage = '%.2f' % (disk_space / (1024 ** 3))
+
+    vm_memory = props.get('config.hardware.memoryMB', 0) / 1024
+
+    return [props['name'], props.get('runtime.powerState'), props.get('runtime.connectionState'),
+            props.get('guest.toolsStatus'), str(vm_storage) + ' GB', props.get('config.hardware.numCPU'),
+            str(vm_memory) + 'GB']
+
+
+def iter_show_rows(si, folder_name=None, max_objects=DEFAULT_MAX_OBJECTS):
+    """
+    Collect brief information about virtual machines in a folder, one property collector page at a time.
 
     :param si: service instance object connected to vCenter
     :param folder_name: name of the folder containing virtual machines
-    :return: none
+    :param max_objects: maximum number of virtual machines retrieved per page
+    :return: a generator yielding one list of rows per page
     """
-    content = si.RetrieveContent()
-
-    # locate the specified folder
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
-    if not folder_name:
-        folder = content.rootFolder
-    else:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
+    for page in iter_properties(si, [vim.VirtualMachine], SHOW_PROPERTIES, folder=folder, max_objects=max_objects):
+        yield [_show_row(props) for props in page if not props.get('config.template')]
 
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-
-    # vms = get_all_obj(si, [vim.VirtualMachine], folder_name)
-    container_view = content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-    container_view.Destroy()
 
-    if not vms:
-        raise ManagedObjectNotFoundError(
-            f"No managed objects of type '[vim.VirtualMachine]' found."
-        )
+def show_rows(si, folder_name=None):
+    """
+    Collect brief information about virtual machines in a folder.
 
-    # display virtual machine details
-    vm_count = 0
-    table = PrettyTable()
-    table.field_names = ['Name', 'Power State', 'Connection State', 'VMware Tools', 'Disk space', 'CPU Number',
-                         'Memory']
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing virtual machines
+    :return: a tuple of the column names and the list of rows, one per virtual machine
+    """
+    rows = []
+    for page in iter_show_rows(si, folder_name):
+        rows.extend(page)
 
-    for vm in vms:
-        if vm.summary.config.template:
-            continue
+    return SHOW_FIELD_NAMES, rows
 
-        vm_count += 1
-        vm_name = vm.config.name
-        vm_power_state = vm.runtime.powerState
-        vm_connection_state = vm.runtime.connectionState
-        vm_tools = vm.guest.toolsStatus
 
-        disk_space = vm.storage.perDatastoreUsage[0].committed + vm.storage.perDatastoreUsage[0].uncommitted
-        vm_storage = '%.2f' % (disk_space / (1024 ** 3))
+def show(si, folder_name=None, stream=False, max_objects=DEFAULT_MAX_OBJECTS, sink=None):
+    """
+    Display brief information about virtual machines in a folder.
 
-        vm_cpu = vm.config.hardware.numCPU
-        vm_memory = vm.config.hardware.memoryMB / 1024
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing virtual machines
+    :param stream: whether to print every page as soon as it is retrieved instead of one table at the end
+    :param max_objects: maximum number of virtual machines retrieved per page
+    :param sink: optional OutputSink receiving the rows page by page, defaults to a printed table
+    :return: none
+    """
+    sink = sink or TableSink(page_size=max_objects if stream else None)
+    sink.begin(SHOW_FIELD_NAMES, title="The Virtual Machines are: {count}")
 
-        table.add_row([vm_name, vm_power_state, vm_connection_state, vm_tools, str(vm_storage) + ' GB', vm_cpu,
-                       str(vm_memory) + 'GB'])
+    for rows in iter_show_rows(si, folder_name, max_objects=max_objects):
+        sink.write_rows(rows)
 
-    print(f"The Virtual Machines are: {vm_count}")
-    print(table)
+    sink.end()
 
 
-def info(si, vm_name, folder_name=None):
+def info(si, vm_name, folder_name=None, sink=None):
     """
     Display detailed information of a virtual machine.
 
     :param si: service instance object connected to vCenter
     :param vm_name: name of the virtual machine
     :param folder_name: name of the folder containing the virtual machine
+    :param sink: optional OutputSink receiving the rows, defaults to printed tables
     :return: none
     """
-    content = si.RetrieveContent()
-
-    # locate the specified folder
+    # locate the specified folder, the root folder is searched if none is given
     folder = None
-    if not folder_name:
-        folder = content.rootFolder
-    else:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-
-    # locate the virtual machine by its name in the specified folder
-    # vms = get_all_obj(si, [vim.VirtualMachine], folder_name)
-    container_view = content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-
-    vm = None
-    for vm_temp in vms:
-        # exclude templates from the search
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
 
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+    # locate the virtual machine by its name in the specified folder, templates are excluded
+    vm = get_single_vm(si, vm_name, folder=folder)
 
     # gather virtual machine details
     vm_power_state = vm.runtime.powerState
@@ -350,27 +398,22 @@ def info(si, vm_name, folder_name=None):
         vm_adapter[vm_network.network] = {'ip': vm_network.ipAddress[0], 'mac': vm_network.macAddress}
     vm_version = vm.guest.hwVersion  # virtual machine version
 
-    # table 1: basic information
-    basic_table = PrettyTable()
-    basic_table.field_names = ["VM Name", "Power State", "Operating System", "Hostname", "IP Address"]
-    basic_table.add_row([vm_name, vm_power_state, vm_os, vm_hostname, vm_ip])
+    sink = sink or TableSink()
 
-    # table 2: resource usage details
-    resource_table = PrettyTable()
-    resource_table.field_names = ["CPU Usage", "Memory Usage", "Disk Usage"]
-    resource_table.add_row([str(cpu_usage) + " MHz", str(memory_usage) + " MB", str(vm_disk_usage) + " GB"])
+    # section 1: basic information
+    sink.begin(["VM Name", "Power State", "Operating System", "Hostname", "IP Address"],
+               title="Virtual Machine Basic Information:")
+    sink.write([vm_name, vm_power_state, vm_os, vm_hostname, vm_ip])
 
-    # table 3: dynamic hardware table
-    hardware_table = PrettyTable()
+    # section 2: resource usage details
+    sink.begin(["CPU Usage", "Memory Usage", "Disk Usage"], title="\nVirtual Machine Resource Usage:")
+    sink.write([str(cpu_usage) + " MHz", str(memory_usage) + " MB", str(vm_disk_usage) + " GB"])
 
-    # base fields for hardware information
+    # section 3: dynamic hardware columns
     base_fields = ["CPU Number", "Memory", "Disk space"]
     adapter_fields = [f"Network adapter {i + 1}" for i in range(len(vm_adapter))]  # dynamic fields for adapters
     version_fields = ["Virtual machine version"]
 
-    # combine base fields with adapter fields
-    hardware_table.field_names = base_fields + adapter_fields + version_fields
-
     # prepare the row data
     row_data = [cpu_num, str(memory_space) + " GB", str(vm_disk_space) + " GB"]
     for name, address in vm_adapter.items():
@@ -380,23 +423,109 @@ def info(si, vm_name, folder_name=None):
         row_data.append(adapter_info)
     row_data.append(vm_version)
 
-    # fill the table
-    hardware_table.add_row(row_data)
+    sink.begin(base_fields + adapter_fields + version_fields, title="\nVirtual Machine Additional Information:")
+    sink.write(row_data)
+    sink.end()
+
+
+def events(si, folder_name=None, vm_name=None, event_types=None, since=None, checkpoint=None, follow=False,
+           sink=None):
+    """
+    Display the events of virtual machines, instead of polling them with show() to learn what changed.
+
+    The events are filtered by vCenter and read through an event history collector in pages of up to a
+    thousand. With a checkpoint file only the events logged since the previous run are displayed, and with
+    follow the new events keep being displayed as they happen, until the command is interrupted.
+
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing the virtual machines
+    :param vm_name: optional name of a single virtual machine
+    :param event_types: optional list of event type names, e.g. ['VmPoweredOnEvent', 'VmReconfiguredEvent']
+    :param since: optional datetime.timedelta, only events of the last period are read
+    :param checkpoint: optional path of the checkpoint file the stream resumes from
+    :param follow: whether to keep displaying new events
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
+    :return: none
+    """
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    entity = get_single_vm(si, vm_name, folder=folder) if vm_name else folder
+    begin_time = si.CurrentTime() - since if since is not None else None
+
+    # a followed stream prints every event as it arrives
+    sink = sink or TableSink(page_size=1 if follow else None)
+    sink.begin(["Time", "Event", "VM Name", "User", "Message"], title="Events: {count}")
+    with EventStream(si, entity=entity, event_types=event_types, begin_time=begin_time,
+                     checkpoint=checkpoint) as stream:
+        try:
+            for event in stream.events(follow=follow):
+                sink.write([str(event.createdTime).split('.')[0], type(event).__name__.split('.')[-1],
+                            event.vm.name if event.vm else None, event.userName, event.fullFormattedMessage])
+        except KeyboardInterrupt:
+            pass
+    sink.end()
+
+
+def metrics(si, folder_name=None, regex=None, metric='cpu.ready', stat='p95', count=10, collector=None, sink=None):
+    """
+    Display the virtual machines with the highest value of a performance metric.
+
+    The powered-on virtual machines are listed with one property collector call and their real-time samples
+    of the last hour are fetched in batches of hundreds of virtual machines per QueryPerf call. The ranking
+    and the other columns are computed over all virtual machines at once. Passing back the returned
+    collector on a later call only fetches the samples taken in between.
+
+    :param si: service instance object connected to vCenter
+    :param folder_name: name of the folder containing the virtual machines
+    :param regex: regular expression to match virtual machine names
+    :param metric: the metric the virtual machines are ranked by, see tools.perf_metrics.METRICS
+    :param stat: the statistic ranked, one of tools.perf_metrics.STATS
+    :param count: number of virtual machines displayed
+    :param collector: optional tools.perf_metrics.MetricsCollector filled by an earlier call
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
+    :return: the MetricsCollector holding the samples
+    """
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    # only powered-on virtual machines have real-time statistics
+    names = {}
+    for props in retrieve_properties(si, [vim.VirtualMachine], ['name', 'runtime.powerState'], folder=folder):
+        if props.get('runtime.powerState') == 'poweredOn' and (not regex or re.search(regex, props['name'])):
+            names[props['obj']] = props['name']
 
-    # Print the results
-    print("Virtual Machine Basic Information:")
-    print(basic_table)
-    print("\nVirtual Machine Resource Usage:")
-    print(resource_table)
-    print("\nVirtual Machine Additional Information:")
-    print(hardware_table)
+    collector = collector or MetricsCollector(si)
+    collector.collect(names)
+
+    sink = sink or TableSink()
+    sink.begin(["VM Name"] + [f"{name} {stat} ({METRIC_UNITS[name]})" for name in collector.metrics],
+               title=f"Top {count} virtual machines by {metric} {stat}:")
+    values = {name: collector.stat(name, stat) for name in collector.metrics}
+    for vm, _ in collector.top(metric, stat, count, entities=names):
+        row = collector.rows[vm]
+        sink.write([names[vm]] + ['%.2f' % values[name][row] for name in collector.metrics])
+    sink.end()
+
+    return collector
 
 
 def clone(si, vm_name, template_name, datacenter_name=None, folder_name=None, datastore_name=None, cluster_name=None,
-          resource_pool_name=None, esxi_name=None, power_on=False):
+          resource_pool_name=None, esxi_name=None, power_on=False, mode='full'):
     """
     clone a virtual machine from a template.
 
+    A full clone copies every disk of the template. A linked clone only gets delta disks on top of a base
+    snapshot of the template, created on first use, and an instant clone forks a running virtual machine;
+    both take seconds and hardly any datastore space.
+
+    Without esxi_name or datastore_name, the clone goes to the least loaded host and the emptiest
+    datastore mounted on it, see tools.placement_engine.
+
     :param si: service instance object connected to vCenter
     :param vm_name: name of the new virtual machine
     :param template_name: name of the template to clone from
@@ -407,250 +536,159 @@ def clone(si, vm_name, template_name, datacenter_name=None, folder_name=None, da
     :param resource_pool_name: optional name of the resource pool
     :param esxi_name: optional name of the target ESXi host
     :param power_on: whether to power on the new VM after creation
+    :param mode: one of CLONE_MODES, 'full', 'linked' or 'instant'; template_name names the running parent
+                 virtual machine of an instant clone
     :return: None
     """
-    content = si.RetrieveContent()
-
-    # locate the template
-    # template = get_single_obj(si, [vim.VirtualMachine], template_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    objs = list(container_view.view)
-
-    template = None
-    for obj_temp in objs:
-        if obj_temp.name == template_name and obj_temp.summary.config.template:
-            template = obj_temp
-            break
-    container_view.Destroy()
-
-    if not template:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{template_name}' not found."
-        )
-
-    # locate the datacenter
-    # datacenter = get_single_obj(si, [vim.Datacenter], datacenter_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
-    datacenters = list(container_view.view)
-
-    datacenter = None
-    if datacenter_name:
-        for datacenter_temp in datacenters:
-            if datacenter_temp.name == datacenter_name:
-                datacenter = datacenter_temp
-                break
-
-        if not datacenter:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Datacenter]' with name '{datacenter_name}' not found."
-            )
-    else:
-        datacenter = datacenters[0]
-
-    container_view.Destroy()
-
-    # locate the folder
-    folder = None
-    if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
+    clone_request = {
+        'vm_name': vm_name,
+        'template_name': template_name,
+        'datacenter_name': datacenter_name,
+        'folder_name': folder_name,
+        'datastore_name': datastore_name,
+        'cluster_name': cluster_name,
+        'resource_pool_name': resource_pool_name,
+        'esxi_name': esxi_name,
+        'power_on': power_on,
+        'mode': mode,
+    }
+    clone_bulk(si, [clone_request])
+
+
+def clone_bulk(si, clone_requests, placement_cache=None, placement_engine=None, snapshot_registry=None, **limits):
+    """
+    Clone many virtual machines from templates concurrently.
 
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
+    The placement objects of all clones are resolved in one pass over the inventory and the clones without
+    a given host or datastore are spread over the least loaded ones, then the clones are started under the
+    TaskScheduler caps of their target host, datastore and cluster, and every clone is reported as soon as
+    it finishes.
 
-        if not folder:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
-            )
-    else:
-        folder = datacenter.vmFolder
-
-    # determine datastore
-    if datastore_name is None:
-        datastore_name = template.datastore[0].info.name
-
-    # locate the datastore
-    # datastore = get_single_obj(si, [vim.Datastore], datastore_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datastore], True)
-    datastores = list(container_view.view)
-
-    datastore = None
-    for datastore_temp in datastores:
-        if datastore_temp.name == datastore_name:
-            datastore = datastore_temp
-            break
-    container_view.Destroy()
-
-    if not datastore:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.Datastore]' with name '{datastore_name}' not found."
-        )
-
-    # locate the cluster
-    cluster = None
-    if cluster_name:
-        # cluster = get_single_obj(si, [vim.ClusterComputeResource], cluster_name, folder=datacenter.hostFolder)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.ClusterComputeResource], True)
-        clusters = list(container_view.view)
-
-        for cluster_temp in clusters:
-            if cluster_temp.name == cluster_name:
-                cluster = cluster_temp
-                break
-        container_view.Destroy()
-
-        if not cluster:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.ClusterComputeResource]' with name '{cluster_name}' not found."
-            )
-    else:
-        # clusters = get_all_obj(si, [vim.ClusterComputeResource])
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.ClusterComputeResource], True)
-        clusters = list(container_view.view)
-
-        if len(clusters) > 0:
-            cluster = clusters[0]
-        container_view.Destroy()
-
-    # locate the resource pool
-    resource_pool = None
-    if resource_pool_name:
-        # resource_pool = get_single_obj(si, [vim.ResourcePool], resource_pool_name, folder=None)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.ResourcePool], True)
-        resource_pools = list(container_view.view)
-
-        for resource_temp in resource_pools:
-            if resource_temp.name == resource_pool_name:
-                resource_pool = resource_temp
-                break
-        container_view.Destroy()
-
-        if not resource_pool:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.ResourcePool]' with name '{resource_pool_name}' not found."
-            )
-    else:
-        # resource_pools = get_all_obj(si, [vim.ResourcePool])
-        if cluster:
-            resource_pool = cluster
+    :param si: service instance object connected to vCenter
+    :param clone_requests: list of dictionaries holding the clone() arguments of each virtual machine: vm_name,
+                           template_name and the optional datacenter_name, folder_name, datastore_name,
+                           cluster_name, resource_pool_name, esxi_name, power_on and mode
+    :param placement_cache: optional PlacementCache reused across calls, the new virtual machines are added to it
+    :param placement_engine: optional PlacementEngine choosing the host and datastore of the clones placed
+                             without esxi_name or datastore_name, a new one reading the current load by default
+    :param snapshot_registry: optional BaseSnapshotRegistry of linked clones, defaults to the registry of the
+                              service instance
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+    :return: a TaskBatchResult keyed by virtual machine name, holding the new virtual machines
+    """
+    clone_requests = list(clone_requests)
+    placement_cache = placement_cache or PlacementCache(si)
+    placement_engine = placement_engine or PlacementEngine(si)
+    snapshot_registry = snapshot_registry or get_registry(si)
+
+    modes = {clone_request['vm_name']: clone_request.get('mode') or 'full' for clone_request in clone_requests}
+    for mode in modes.values():
+        if mode not in CLONE_MODES:
+            raise ValueError(f"Invalid clone mode: '{mode}', expected one of {CLONE_MODES}.")
+
+    # results are keyed by name, so every name may only be requested once
+    vm_names = [clone_request['vm_name'] for clone_request in clone_requests]
+    duplicates = sorted(vm_name for vm_name, count in Counter(vm_names).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Virtual machine names requested more than once: {', '.join(duplicates)}.")
+
+    # resolve every placement before the first clone starts, so a typo fails the batch early
+    placements = dict(zip(vm_names, placement_cache.resolve_all(clone_requests, engine=placement_engine)))
+    power_ons = {clone_request['vm_name']: clone_request.get('power_on', False) for clone_request in clone_requests}
+
+    # look up, or create, the base snapshot of every template linked clones are made from
+    snapshots = {vm_name: snapshot_registry.get(placement.template, placement.resource_pool, placement.host)
+                 for vm_name, placement in placements.items() if modes[vm_name] == 'linked'}
+
+    def start_clone(vm_name):
+        placement = placements[vm_name]
+        relospec = placement.relocate_spec()
+
+        if modes[vm_name] == 'instant':
+            # an instant clone shares the memory and disks of its running parent and starts powered on
+            relospec.folder = placement.folder
+            instant_clone_spec = vim.vm.InstantCloneSpec(name=vm_name, location=relospec)
+            return placement.template.InstantClone(spec=instant_clone_spec)
+
+        # create clone spec
+        clonespec = vim.vm.CloneSpec()
+        clonespec.location = relospec
+        clonespec.powerOn = power_ons[vm_name]
+        if modes[vm_name] == 'linked':
+            # only create delta disks on top of the base snapshot instead of copying the disks
+            relospec.diskMoveType = 'createNewChildDiskBacking'
+            clonespec.snapshot = snapshots[vm_name]
+
+        return placement.template.Clone(folder=placement.folder, name=vm_name, spec=clonespec)
+
+    def clone_done(vm_name, future):
+        if future.exception() is None:
+            powered_on = modes[vm_name] == 'instant' or power_ons[vm_name]
+            placement_cache.add(future.result(), {'name': vm_name, 'parent': placements[vm_name].folder,
+                                                  'datastore': [placements[vm_name].datastore],
+                                                  'summary.config.template': False,
+                                                  'runtime.powerState': 'poweredOn' if powered_on else 'poweredOff'})
+            print(f"Virtual machines: {vm_name} cloned successfully.")
         else:
-            container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.ResourcePool], True)
-            resource_pools = list(container_view.view)
-
-            if len(resource_pools) > 0:
-                resource_pool = resource_pools[0]
-            container_view.Destroy()
-
-    # check if the VM name already exists
-    # vms = get_all_obj(si, [vim.VirtualMachine], folder=folder)
-    container_view = content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
-    container_view.Destroy()
-
-    vms_name = [vm.name for vm in vms]
-    if vm_name in vms_name:
-        raise ValueError(f"Managed Object of type '[vim.VirtualMachine]' with name {vm_name} has existed.")
-
-    # locate the ESXi host
-    esxi = None
-    if esxi_name:
-        # host = get_single_obj(si, [vim.HostSystem], EXSi_name, folder=None)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-        esxis = list(container_view.view)
-
-        for esxi_temp in esxis:
-            if esxi_temp.name == esxi_name:
-                esxi = esxi_temp
-                break
-        container_view.Destroy()
-
-        if not esxi:
-            raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.HostSystem]' with name '{esxi_name}' not found."
-            )
-    else:
-        # hosts = get_all_obj(si, [vim.HostSystem], folder=None)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-        esxis = list(container_view.view)
-
-        esxi = esxis[0]
-        container_view.Destroy()
-
-    # create relocation spec
-    relospec = vim.vm.RelocateSpec()
-    relospec.datastore = datastore
-    relospec.pool = resource_pool
-    relospec.host = esxi
-
-    # create clone spec
-    clonespec = vim.vm.CloneSpec()
-    clonespec.location = relospec
-    clonespec.powerOn = power_on
-
-    # clone the VM
-    tasks = [template.Clone(folder=folder, name=vm_name, spec=clonespec)]
-    task.wait_for_tasks(si, tasks)
-    print(f"Virtual machines: {vm_name} cloned successfully.")
+            error = future.exception()
+            print(f"Virtual machines: {vm_name} failed to clone: {getattr(error, 'msg', None) or error}")
 
+    return run_tasks(si, list(placements), start_clone,
+                     resource_keys=lambda names: [placements[vm_name].resource_keys() for vm_name in names],
+                     on_done=clone_done, **limits)
 
-def customize(si, vm_name, vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname, network_name=None, folder_name=None):
+
+def _find_vms(si, vm_names, folder, path_set):
     """
-    Modify the network configuration of a virtual machine, including IP, subnet mask, gateway, DNS, and hostname.
+    Locate many virtual machines by name and read their properties with one property collector call.
 
     :param si: service instance object connected to vCenter
-    :param vm_name: name of the virtual machine
-    :param vm_ip: IP address to assign to the virtual machine
-    :param vm_mask: subnet mask for the IP address
-    :param vm_gateway: gateway for the virtual machine
-    :param vm_dns: DNS server address
-    :param vm_hostname: hostname for the virtual machine
-    :param network_name: specific network name for multi-NIC virtual machines
-    :param folder_name: name of the folder containing the virtual machine
-    :return: none
+    :param vm_names: list of virtual machine names or inventory paths
+    :param folder: the folder to start the search from, the root folder if None
+    :param path_set: list of property paths to read, including 'name'
+    :return: a tuple of a dictionary mapping the names to the virtual machines and a dictionary mapping the
+             virtual machines to their properties
     """
-    content = si.RetrieveContent()
-
-    folder = None
-    if folder_name:
-        # folder = get_single_obj(si, [vim.Folder], folder_name)
-        container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.Folder], True)
-        folders = list(container_view.view)
-
-        for folder_temp in folders:
-            if folder_temp.name == folder_name:
-                folder = folder_temp
-                break
-        container_view.Destroy()
-
-        if not folder:
+    # plain names are resolved together, inventory paths one by one
+    plain_names = [vm_name for vm_name in vm_names if '/' not in vm_name]
+    vms = {vm_name: get_single_vm(si, vm_name, folder=folder) for vm_name in vm_names if '/' in vm_name}
+    found = find_obj(si, [vim.VirtualMachine], plain_names, folder=folder,
+                     filters={'summary.config.template': False}) if plain_names else []
+
+    vm_props = {props['obj']: props for props in
+                retrieve_object_properties(si, found + list(vms.values()), vim.VirtualMachine, path_set)}
+    for vm in found:
+        # like get_single_vm, the first virtual machine of a name wins
+        vms.setdefault(vm_props[vm]['name'], vm)
+
+    for vm_name in vm_names:
+        if vm_name not in vms:
             raise ManagedObjectNotFoundError(
-                f"Managed object of type '[vim.Folder]' with name '{folder_name}' not found."
+                f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
             )
-    else:
-        folder = content.rootFolder
 
-    vm = None
-    container_view = content.viewManager.CreateContainerView(folder, [vim.VirtualMachine], True)
-    vms = list(container_view.view)
+    return vms, vm_props
 
-    for vm_temp in vms:
-        if vm_temp.name == vm_name and not vm_temp.summary.config.template:
-            vm = vm_temp
-            break
-    container_view.Destroy()
 
-    if not vm:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type '[vim.VirtualMachine]' with name '{vm_name}' not found."
-        )
+def _customization_spec(props, customization):
+    """
+    Build the customization specification of a virtual machine from its guest network state.
+
+    :param props: property dictionary of the virtual machine holding CUSTOMIZE_PROPERTIES
+    :param customization: dictionary with the customize() arguments of the virtual machine
+    :return: a vim.vm.customization.Specification
+    """
+    vm_ip = customization.get('vm_ip')
+    vm_mask = customization.get('vm_mask')
+    vm_gateway = customization.get('vm_gateway')
+    vm_dns = customization.get('vm_dns')
+    vm_hostname = customization.get('vm_hostname')
+    network_name = customization.get('network_name')
+    ip_stack = props.get('guest.ipStack') or []
 
     # create adapter mappings
     adaptermaps = []
-    for net in vm.guest.net:
+    for net in props.get('guest.net') or []:
         adapter_map = vim.vm.customization.AdapterMapping()
         adapter_map.adapter = vim.vm.customization.IPSettings()
         adapter_map.adapter.ip = vim.vm.customization.FixedIp()
@@ -661,13 +699,12 @@ def customize(si, vm_name, vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname, netw
                 # if a specific network matches, assign the given or default IP configuration
                 adapter_map.adapter.ip.ipAddress = vm_ip or net.ipAddress[0]
                 adapter_map.adapter.subnetMask = vm_mask or gen_mask(net.ipConfig.ipAddress[0].prefixLength)
-                adapter_map.adapter.gateway = vm_gateway or vm.guest.ipStack[0].ipRouteConfig.ipRoute[
-                    0].gateway.ipAddress
+                adapter_map.adapter.gateway = vm_gateway or ip_stack[0].ipRouteConfig.ipRoute[0].gateway.ipAddress
             else:
                 # for other nic, retain their original configuration
                 adapter_map.adapter.ip.ipAddress = net.ipAddress[0]
                 adapter_map.adapter.subnetMask = gen_mask(net.ipConfig.ipAddress[0].prefixLength)
-                adapter_map.adapter.gateway = vm.guest.ipStack[0].ipRouteConfig.ipRoute[0].gateway.ipAddress
+                adapter_map.adapter.gateway = ip_stack[0].ipRouteConfig.ipRoute[0].gateway.ipAddress
         else:
             # for single NIC without network_name, use the provided IP configuration
             adapter_map.adapter.ip.ipAddress = vm_ip
@@ -683,13 +720,13 @@ def customize(si, vm_name, vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname, netw
     global_ip = vim.vm.customization.GlobalIPSettings()
     if vm_dns:
         global_ip.dnsServerList = [vm_dns]
-    elif vm.guest.ipStack:
-        global_ip.dnsServerList = vm.guest.ipStack[0].dnsConfig.ipAddress
+    elif ip_stack:
+        global_ip.dnsServerList = ip_stack[0].dnsConfig.ipAddress
 
     # configure the identity settings for Linux virtual machines
     ident = vim.vm.customization.LinuxPrep()
     ident.hostName = vim.vm.customization.FixedName()
-    ident.hostName.name = vm_hostname if vm_hostname else vm.guest.ipStack[0].dnsConfig.hostName
+    ident.hostName.name = vm_hostname if vm_hostname else ip_stack[0].dnsConfig.hostName
 
     # create the customization specification
     custom_spec = vim.vm.customization.Specification()
@@ -697,12 +734,111 @@ def customize(si, vm_name, vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname, netw
     custom_spec.globalIPSettings = global_ip
     custom_spec.identity = ident
 
-    # Power off the virtual machine if it is powered on
-    if vm.runtime.powerState != "poweredOff":
-        power_off(si, folder_name, vm_name)
+    return custom_spec
 
-    # apply the customization specification to the virtual machine
-    tasks = [vm.Customize(spec=custom_spec)]
-    task.wait_for_tasks(si, tasks)
 
-    print(f"Virtual machines with name '{vm_name}' customization completed successfully.")
+def customize(si, vm_name, vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname, network_name=None, folder_name=None):
+    """
+    Modify the network configuration of a virtual machine, including IP, subnet mask, gateway, DNS, and hostname.
+
+    :param si: service instance object connected to vCenter
+    :param vm_name: name of the virtual machine
+    :param vm_ip: IP address to assign to the virtual machine
+    :param vm_mask: subnet mask for the IP address
+    :param vm_gateway: gateway for the virtual machine
+    :param vm_dns: DNS server address
+    :param vm_hostname: hostname for the virtual machine
+    :param network_name: specific network name for multi-NIC virtual machines
+    :param folder_name: name of the folder containing the virtual machine
+    :return: none
+    """
+    customization = {
+        'vm_name': vm_name,
+        'vm_ip': vm_ip,
+        'vm_mask': vm_mask,
+        'vm_gateway': vm_gateway,
+        'vm_dns': vm_dns,
+        'vm_hostname': vm_hostname,
+        'network_name': network_name,
+    }
+    customize_bulk(si, [customization], folder_name=folder_name)
+
+
+def customize_bulk(si, customizations, folder_name=None, **limits):
+    """
+    Modify the network configuration of many virtual machines concurrently.
+
+    The guest network state of all virtual machines is read in one property collector call and every
+    specification is built before the first task starts, so a bad row fails the batch early. Only the
+    virtual machines not powered off yet are powered off, then the customizations run under the
+    TaskScheduler caps and every virtual machine is reported as soon as it is done. A virtual machine
+    that cannot be powered off is reported and not customized, and the errors of both steps are raised
+    together once the other virtual machines are customized.
+
+    :param si: service instance object connected to vCenter
+    :param customizations: list of dictionaries holding the customize() arguments of each virtual machine:
+                           vm_name and the optional vm_ip, vm_mask, vm_gateway, vm_dns, vm_hostname and
+                           network_name
+    :param folder_name: name of the folder containing the virtual machines
+    :param limits: optional TaskScheduler caps (max_tasks, max_per_host, max_per_datastore, max_per_cluster)
+    :return: a TaskBatchResult keyed by virtual machine
+    """
+    customizations = list(customizations)
+
+    vm_names = [customization['vm_name'] for customization in customizations]
+    duplicates = sorted(vm_name for vm_name, count in Counter(vm_names).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Virtual machine names requested more than once: {', '.join(duplicates)}.")
+
+    # locate the specified folder, the root folder is searched if none is given
+    folder = None
+    if folder_name:
+        folder = get_single_obj(si, [vim.Folder], folder_name)
+
+    # read the guest network state of all virtual machines at once
+    vms, vm_props = _find_vms(si, vm_names, folder, CUSTOMIZE_PROPERTIES)
+
+    # build every specification up front
+    specs = {}
+    names = {}
+    for customization in customizations:
+        vm = vms[customization['vm_name']]
+        specs[vm] = _customization_spec(vm_props[vm], customization)
+        names[vm] = customization['vm_name']
+
+    # power off the virtual machines which are not powered off yet, one refusing does not stop the others
+    vm_order = list(specs)
+    power_off_errors = {}
+    running_vms = [vm for vm in specs if vm_props[vm].get('runtime.powerState') != 'poweredOff']
+    if running_vms:
+        def power_off_done(vm, future):
+            error = future.exception()
+            if error is not None:
+                print(f"Virtual machines with name '{names[vm]}' could not be powered off, customization skipped: "
+                      f"{getattr(error, 'msg', None) or error}")
+
+        power_off_errors = TaskScheduler(si, **limits).run(running_vms, lambda vm: vm.PowerOff(),
+                                                           on_done=power_off_done).errors
+        for vm in power_off_errors:
+            del specs[vm]
+
+    def customize_done(vm, future):
+        if future.exception() is None:
+            print(f"Virtual machines with name '{names[vm]}' customization completed successfully.")
+        else:
+            error = future.exception()
+            print(f"Virtual machines with name '{names[vm]}' customization failed: "
+                  f"{getattr(error, 'msg', None) or error}")
+
+    # apply the customization specifications to the virtual machines
+    batch = TaskScheduler(si, **limits).run(list(specs), lambda vm: vm.Customize(spec=specs[vm]),
+                                            on_done=customize_done)
+
+    # raise the power off and customization errors together
+    outcome = TaskBatchResult(vm_order, [])
+    outcome.results.update(batch.results)
+    outcome.errors.update(power_off_errors)
+    outcome.errors.update(batch.errors)
+    outcome.raise_for_errors()
+
+    return outcome
@@ -1,84 +1,145 @@
 from pyVmomi import vim
 import re
-from prettytable import PrettyTable
+from tools.host_network import DEFAULT_MAX_HOSTS, HostNetworkExecutor, diff_network, invert_network_config, run_on_hosts
+from tools.output_sink import TableSink
 from tools.obj_helper import *
 
 
-def add(si, vswitch_name: str, vnic_name: str, hosts_name: list):
+def add(si, vswitch_name: str, vnic_name: str, hosts_name: list, max_hosts=DEFAULT_MAX_HOSTS, rollback=False,
+        sink=None):
     """
-    Add a virtual switch to specified hosts.
+    Add a virtual switch to specified hosts, configuring the hosts in parallel.
 
     :param si: service instance object connected to vCenter
     :param vswitch_name: name of the virtual switch to be added
     :param vnic_name: name of the virtual NIC to be used as the uplink
     :param hosts_name: list of host names to which the virtual switch will be added
+    :param max_hosts: maximum number of hosts configured at once
+    :param rollback: whether to remove the virtual switch again from every host when any host failed
+    :param sink: optional OutputSink receiving the outcome of every host, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
+    # locate the hosts by name
+    hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
 
-    # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    hosts = list()
-    for host_temp in host_view:
-        # check if the host name matches the provided names
-        if host_temp.name in hosts_name:
-            hosts.append(host_temp)
-    container_view.Destroy()
-
-    # check if no hosts are found
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
-
-    for host in hosts:
-        # create the virtual switch specification
-        vswitch_spec = vim.host.VirtualSwitch.Specification()
+    # create the virtual switch specification
+    vswitch_spec = vim.host.VirtualSwitch.Specification()
 
-        # set the virtual NIC as the uplink
-        vswitch_spec.bridge = vim.host.VirtualSwitch.BondBridge(nicDevice=[vnic_name])
-        vswitch_spec.numPorts = 1024
-        vswitch_spec.mtu = 1500
+    # set the virtual NIC as the uplink
+    vswitch_spec.bridge = vim.host.VirtualSwitch.BondBridge(nicDevice=[vnic_name])
+    vswitch_spec.numPorts = 1024
+    vswitch_spec.mtu = 1500
 
-        # add the virtual switch to the host
-        host.configManager.networkSystem.AddVirtualSwitch(vswitch_name, vswitch_spec)
+    # add the virtual switch to the hosts
+    run_on_hosts(si, hosts, lambda props: props['configManager.networkSystem'].AddVirtualSwitch(vswitch_name,
+                                                                                                 vswitch_spec),
+                 rollback=_remove_vswitch(vswitch_name) if rollback else None, max_hosts=max_hosts, sink=sink,
+                 title=f"Virtual switch {vswitch_name} on the hosts:")
 
     print(f"Virtual switch {vswitch_name} added successfully with uplink {vnic_name}.")
 
 
-def delete(si, vswitch_name: str, hosts_name: list):
+def delete(si, vswitch_name: str, hosts_name: list, max_hosts=DEFAULT_MAX_HOSTS, rollback=False, sink=None):
     """
-    Delete a virtual switch from specified hosts.
+    Delete a virtual switch from specified hosts, configuring the hosts in parallel.
 
     :param si: service instance object connected to vCenter
     :param vswitch_name: name of the virtual switch to be deleted
     :param hosts_name: list of host names from which the virtual switch will be deleted
+    :param max_hosts: maximum number of hosts configured at once
+    :param rollback: whether to restore the virtual switch and its port groups on every host when any host failed
+    :param sink: optional OutputSink receiving the outcome of every host, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
+    # locate the hosts by name
+    hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
+
+    # remove the virtual switch from the hosts, keeping their network configuration to restore it on failure
+    run_on_hosts(si, hosts, _remove_vswitch(vswitch_name),
+                 rollback=_restore_vswitch(vswitch_name) if rollback else None,
+                 properties=['config.network.vswitch', 'config.network.portgroup'] if rollback else None,
+                 max_hosts=max_hosts, sink=sink, title=f"Virtual switch {vswitch_name} on the hosts:")
 
-    # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
+    print(f"Virtual switch {vswitch_name} deleted successfully.")
 
-    hosts = list()
-    for host_temp in host_view:
-        if host_temp.name in hosts_name:
-            hosts.append(host_temp)
-    container_view.Destroy()
 
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
+def _remove_vswitch(vswitch_name):
+    def remove(props):
+        props['configManager.networkSystem'].RemoveVirtualSwitch(vswitch_name)
+
+    return remove
+
+
+def _restore_vswitch(vswitch_name):
+    def restore(props):
+        # add the virtual switch back with its former specification, then the port groups it held
+        network_system = props['configManager.networkSystem']
+        for vswitch in props.get('config.network.vswitch') or []:
+            if vswitch.name == vswitch_name:
+                network_system.AddVirtualSwitch(vswitch_name, vswitch.spec)
+        for portgroup in props.get('config.network.portgroup') or []:
+            if portgroup.spec.vswitchName == vswitch_name:
+                network_system.AddPortGroup(portgroup.spec)
+
+    return restore
+
+
+def reconcile(si, layout, hosts_name: list, prune=False, dry_run=False, max_hosts=DEFAULT_MAX_HOSTS, rollback=False,
+              sink=None):
+    """
+    Bring the virtual switches and port groups of hosts to a desired layout.
 
+    The virtual switches and port groups of all hosts are read with one property collector call and compared
+    with the layout. Only the hosts that differ are changed, each with a single UpdateNetworkConfig call
+    holding just the missing or changed pieces, and the hosts are configured in parallel. Rerunning a
+    reconciliation that already converged makes no changes at all.
+
+    :param si: service instance object connected to vCenter
+    :param layout: desired layout document, a dictionary with the vswitches and portgroups lists, see
+                   tools.host_network.diff_network
+    :param hosts_name: list of host names to reconcile
+    :param prune: whether to remove the port groups of the layout virtual switches that are missing from it
+    :param dry_run: only print the changes, without applying them
+    :param max_hosts: maximum number of hosts configured at once
+    :param rollback: whether to restore the former configuration of every changed host when any host failed
+    :param sink: optional OutputSink receiving the outcome of every changed host, defaults to a printed table
+    :return: a dictionary mapping the names of the hosts that differ to their list of changes
+    """
+    # locate the hosts by name
+    hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
+
+    # read the virtual switches and port groups of all hosts at once
+    host_props = HostNetworkExecutor(si).read(hosts, ['config.network.vswitch', 'config.network.portgroup'])
+
+    # compute the differences, an invalid layout fails before anything is changed
+    configs = {}
+    report = {}
     for host in hosts:
-        # remove the virtual switch from the host
-        host.configManager.networkSystem.RemoveVirtualSwitch(vswitch_name)
+        props = host_props[host]
+        config, changes = diff_network(props['name'], props.get('config.network.vswitch'),
+                                       props.get('config.network.portgroup'), layout, prune=prune)
+        if changes:
+            configs[host] = config
+            report[props['name']] = changes
+            print(f"Host '{props['name']}': {', '.join(changes)}")
 
-    print(f"Virtual switch {vswitch_name} deleted successfully.")
+    print(f"Hosts: {len(hosts) - len(configs)} of {len(hosts)} already match the desired layout.")
+    if dry_run or not configs:
+        return report
+
+    def update(props):
+        props['configManager.networkSystem'].UpdateNetworkConfig(configs[props['obj']], 'modify')
+
+    def restore(props):
+        props['configManager.networkSystem'].UpdateNetworkConfig(
+            invert_network_config(props.get('config.network.vswitch'), props.get('config.network.portgroup'),
+                                  configs[props['obj']]), 'modify')
+
+    run_on_hosts(si, list(configs), update, rollback=restore if rollback else None, max_hosts=max_hosts, sink=sink,
+                 title="Network layout on the hosts:", host_props=host_props)
+    print(f"Hosts {', '.join(report)} reconciled successfully.")
+
+    return report
 
 
 def customize(si, vswitch_name, vnic_name, host_name):
@@ -91,23 +152,8 @@ def customize(si, vswitch_name, vnic_name, host_name):
     :param host_name: name of the host where the virtual switch exists
     :return: none
     """
-    content = si.RetrieveContent()
-
-    # hosts = get_given_obj(si, [vim.HostSystem], host_name)
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    host = None
     # locate the host by name
-    for host_temp in host_view:
-        if host_temp.name == host_name:
-            host = host_temp
-    container_view.Destroy()
-
-    if host is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(host_name)}' not found."
-        )
+    host = get_single_obj(si, [vim.HostSystem], host_name)
 
     vswitch = None
     # locate the virtual switch by name
@@ -135,34 +181,21 @@ def customize(si, vswitch_name, vnic_name, host_name):
     print(f"Virtual switch '{vswitch_name}' successfully updated with uplink '{vnic_name}' on host '{host_name}'.")
 
 
-def show(si, hosts_name=None):
+def show(si, hosts_name=None, sink=None):
     """
     Show the virtual switches on specified hosts.
 
     :param si: service instance object connected to vCenter
     :param hosts_name: list of host names to show the virtual switches
+    :param sink: optional OutputSink receiving the rows, defaults to a printed table
     :return: none
     """
-    content = si.RetrieveContent()
-
-    container_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-    host_view = list(container_view.view)
-
-    hosts = list()
     if hosts_name:
         # filter hosts based on provided names
-        for host_temp in host_view:
-            if host_temp.name in hosts_name:
-                hosts.append(host_temp)
+        hosts = get_given_obj(si, [vim.HostSystem], hosts_name)
     else:
         # if no host names are provided, show all hosts
-        hosts = host_view
-    container_view.Destroy()
-
-    if hosts is None:
-        raise ManagedObjectNotFoundError(
-            f"Managed object of type [vim.HostSystem] with name '{', '.join(hosts_name)}' not found."
-        )
+        hosts = get_all_obj(si, [vim.HostSystem])
 
     # create a dictionary to store host-switch relationships
     host_switches_dict = {}
@@ -170,10 +203,10 @@ def show(si, hosts_name=None):
         switches = host.config.network.vswitch
         host_switches_dict[host] = switches
 
-    # if there are switches to display, create a pretty table
+    # if there are switches to display, write them to the sink
     if host_switches_dict:
-        table = PrettyTable()
-        table.field_names = ["Host Name", "vSwitch Name", "Port Groups"]
+        sink = sink or TableSink()
+        sink.begin(["Host Name", "vSwitch Name", "Port Groups"], title="The vSwitches are:")
 
         for host, vswithes in host_switches_dict.items():
             for vswitch in vswithes:
@@ -184,7 +217,6 @@ def show(si, hosts_name=None):
                     portgroup_names.append(match.group(1))
 
                 portgroups = ", ".join(portgroup_names)
-                table.add_row([host.name, vswitch.name, portgroups])
+                sink.write([host.name, vswitch.name, portgroups])
 
-        print("The vSwitches are:")
-        print(table)
+        sink.end()